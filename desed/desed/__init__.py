@@ -11,4 +11,11 @@ from .generate_synthetic import (
     generate_tsv_from_jams,
     generate_df_from_jams,
 )
+from .annotation_store import save_annotations, load_annotations
+from .audio_cache import AudioCache
+from .downloader import ThreadedDownloader
+from .download_state import DownloadState
+from .frame_labels import export_frame_labels, load_frame_labels
+from .soundbank import SoundbankIndex
+from .transform_cache import TransformCache
 from . import post_process, utils
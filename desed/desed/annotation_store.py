@@ -0,0 +1,101 @@
+"""Columnar binary store of annotation tables (filename, onset, offset, event_label, ...), faster to load than a TSV"""
+import json
+import os
+import shutil
+from os import path as osp
+
+import numpy as np
+import pandas as pd
+
+from .logger import DesedError
+
+STORE_VERSION = 1
+
+
+def save_annotations(df, store_dir):
+    """ Save an annotation table in a folder containing one .npy file per column and a meta.json file.
+    The float columns are saved in float32, the other non numeric columns (filename, event_label, ...) are
+    dictionary encoded: int32 codes saved in the .npy file, the values (categories) in meta.json.
+    Args:
+        df: pd.DataFrame, the annotations, example columns: ["filename", "onset", "offset", "event_label"].
+        store_dir: str, the folder of the store, replaced if it exists.
+    Returns:
+        None
+    """
+    tmp_dir = osp.join(
+        osp.dirname(osp.abspath(store_dir)), f".{osp.basename(store_dir)}.{os.getpid()}"
+    )
+    if osp.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for cnt, name in enumerate(df.columns):
+        column = df[name]
+        meta = {"name": str(name), "file": f"column_{cnt}.npy"}
+        if pd.api.types.is_float_dtype(column.dtype):
+            values = column.to_numpy(dtype=np.float32)
+            meta["type"] = "float32"
+        elif pd.api.types.is_bool_dtype(column.dtype) or pd.api.types.is_integer_dtype(
+            column.dtype
+        ):
+            values = column.to_numpy()
+            meta["type"] = str(values.dtype)
+        else:
+            # Missing values have the code -1
+            codes, categories = pd.factorize(column)
+            values = codes.astype(np.int32)
+            meta["type"] = "category"
+            meta["categories"] = [str(category) for category in categories]
+        np.save(osp.join(tmp_dir, meta["file"]), values)
+        columns.append(meta)
+
+    with open(osp.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump({"version": STORE_VERSION, "n_rows": len(df), "columns": columns}, f)
+    if osp.exists(store_dir):
+        shutil.rmtree(store_dir)
+    os.replace(tmp_dir, store_dir)
+
+
+def load_annotations(store_dir, columns=None, mmap=True, categorical=True):
+    """ Load an annotation table saved by save_annotations.
+    Args:
+        store_dir: str, the folder of the store.
+        columns: list, optional, the columns to load, all the columns if None.
+        mmap: bool, whether the numeric columns are memory mapped (read from the disk when used) or loaded in memory.
+        categorical: bool, whether the dictionary encoded columns are returned as pd.Categorical (fast) or as
+            columns of str (like pd.read_csv).
+    Returns:
+        pd.DataFrame, the annotations, float columns in float32.
+    """
+    meta_path = osp.join(store_dir, "meta.json")
+    if not osp.exists(meta_path):
+        raise DesedError(f"{store_dir} is not an annotation store (no meta.json)")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta["version"] != STORE_VERSION:
+        raise DesedError(
+            f"Annotation store version {meta['version']} not supported, expected {STORE_VERSION}"
+        )
+
+    columns_meta = {column["name"]: column for column in meta["columns"]}
+    if columns is None:
+        columns = [column["name"] for column in meta["columns"]]
+    missing = [name for name in columns if name not in columns_meta]
+    if len(missing) > 0:
+        raise DesedError(f"Columns {missing} not in the annotation store {store_dir}")
+
+    data = {}
+    for name in columns:
+        column = columns_meta[name]
+        values = np.load(
+            osp.join(store_dir, column["file"]), mmap_mode="r" if mmap else None
+        )
+        if column["type"] == "category":
+            values = pd.Categorical.from_codes(
+                values, categories=column["categories"]
+            )
+            if not categorical:
+                values = np.asarray(values, dtype=object)
+        data[name] = values
+    return pd.DataFrame(data, columns=columns)
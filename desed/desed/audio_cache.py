@@ -0,0 +1,135 @@
+"""In-memory cache of decoded source audio, shared by the soundscapes rendered in a process"""
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import resampy
+import scaper.core
+import soundfile as sf
+
+from .soundbank import SoundInfo
+
+# resampy filter of the resampled sources, "kaiser_best" is several times slower for a difference
+# inaudible in the soundscapes (see desed.mixing.mix_annotation)
+RESAMPLE_FILTER = "kaiser_fast"
+
+
+class AudioCache:
+    """ Least recently used (LRU) cache of decoded audio files, limited by a budget in bytes.
+    Entries are keyed by (path, samplerate), samplerate=None meaning the samplerate of the file.
+
+    When an AudioCache is sent to another process (pickled, e.g. by a multiprocessing.Pool), the process gets
+    its own cache with the same budget, shared by all the tasks it runs. So the sources are decoded once per worker.
+
+    Args:
+        max_bytes: int, the maximum number of bytes of decoded audio kept in memory.
+
+    Examples:
+        >>> cache = AudioCache(max_bytes=4 * 1024 ** 3)
+        >>> sg = SoundscapesGenerator(10, fg_folder, bg_folder, audio_cache=cache)
+    """
+
+    def __init__(self, max_bytes=2 * 1024 ** 3):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._audio = OrderedDict()
+
+    def __reduce__(self):
+        return _shared_audio_cache, (self.max_bytes,)
+
+    def __len__(self):
+        return len(self._audio)
+
+    def read(self, filepath, samplerate=None):
+        """ Decoded audio of a file (the whole file).
+        Args:
+            filepath: str, path of the audio file.
+            samplerate: int, optional, samplerate of the returned audio (resampled if different from the file's one).
+        Returns:
+            tuple, (audio, samplerate), audio is a read-only np.ndarray of shape (n_samples, n_channels).
+        """
+        key = (filepath, samplerate)
+        if key in self._audio:
+            self.hits += 1
+            self._audio.move_to_end(key)
+            return self._audio[key]
+
+        self.misses += 1
+        audio, sr = sf.read(filepath, always_2d=True)
+        if samplerate is not None and samplerate != sr:
+            audio = resampy.resample(
+                audio, sr, samplerate, axis=0, filter=RESAMPLE_FILTER
+            )
+            sr = samplerate
+        audio.flags.writeable = False
+
+        if audio.nbytes <= self.max_bytes:
+            self._audio[key] = (audio, sr)
+            self.n_bytes += audio.nbytes
+            while self.n_bytes > self.max_bytes:
+                _, (audio_evicted, _) = self._audio.popitem(last=False)
+                self.n_bytes -= audio_evicted.nbytes
+        return audio, sr
+
+    def clear(self):
+        self._audio.clear()
+        self.n_bytes = 0
+
+
+_shared_audio_caches = {}
+
+
+def _shared_audio_cache(max_bytes):
+    """ The AudioCache of the current process having this budget (created the first time) """
+    if max_bytes not in _shared_audio_caches:
+        _shared_audio_caches[max_bytes] = AudioCache(max_bytes)
+    return _shared_audio_caches[max_bytes]
+
+
+class _CachedSoundfile:
+    """ Stand-in of the soundfile module used by scaper to read the sources, reading them through an AudioCache.
+    Other functions (write, ...) are the ones of soundfile.
+    If samplerate is defined, the files are read as if they had this samplerate (resampled once, then cached).
+    """
+
+    def __init__(self, audio_cache, samplerate=None):
+        self.audio_cache = audio_cache
+        self.samplerate = samplerate
+
+    def __getattr__(self, name):
+        return getattr(sf, name)
+
+    def info(self, file, verbose=False):
+        audio, sr = self.audio_cache.read(file, self.samplerate)
+        return SoundInfo(audio.shape[0], sr, audio.shape[1], float(audio.shape[0]) / sr)
+
+    def read(self, file, frames=-1, start=0, stop=None, always_2d=False, **kwargs):
+        audio, sr = self.audio_cache.read(file, self.samplerate)
+        if stop is None and frames >= 0:
+            stop = start + frames
+        audio = audio[start:stop].copy()
+        if not always_2d and audio.shape[1] == 1:
+            audio = audio[:, 0]
+        return audio, sr
+
+
+@contextmanager
+def scaper_audio_cache(audio_cache):
+    """ Context manager making scaper read the source files through an AudioCache.
+    Args:
+        audio_cache: AudioCache, the cache to use. If None, nothing is changed.
+
+    Examples:
+        >>> with scaper_audio_cache(AudioCache()):
+        ...     scaper.generate_from_jams(jams_file, audio_file)
+    """
+    if audio_cache is None:
+        yield
+        return
+    soundfile_module = scaper.core.soundfile
+    scaper.core.soundfile = _CachedSoundfile(audio_cache)
+    try:
+        yield
+    finally:
+        scaper.core.soundfile = soundfile_module
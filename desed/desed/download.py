@@ -1,27 +1,31 @@
 from asyncio import FastChildWatcher
 import functools
 import glob
+import hashlib
 import inspect
 import logging
 import os
 import shutil
 import subprocess
-import tempfile
+import tarfile
 import warnings
 
 from contextlib import closing
 from multiprocessing import Pool
 import pandas as pd
+import requests
+import soundfile as sf
 import yt_dlp
 
 from dcase_util.containers import AudioContainer
 from desed.utils import create_folder, download_file_from_url 
 from tqdm import tqdm
 from yt_dlp import DownloadError
-from yt_dlp.utils import ExtractorError
+from yt_dlp.utils import ExtractorError, download_range_func
 
+from .download_state import DownloadState, download_with_retries
 from .logger import create_logger, DesedWarning, DownloadDesedError
-from .utils import create_folder, download_file_from_url
+from .utils import create_folder, download_file_from_url, zenodo_file_metadata
 
 
 class LoggerYtdlWarnings(object):
@@ -37,7 +41,14 @@ class LoggerYtdlWarnings(object):
         pass
 
 
-def _download_audioset_file(filename, result_dir, platform="youtube", tmp_folder="tmp"):
+def _download_audioset_file(
+    filename,
+    result_dir,
+    platform="youtube",
+    tmp_folder="tmp",
+    segment_only=False,
+    res_type="kaiser_best",
+):
     """ download a file from youtube given an audioSet filename. (It takes only a part of the file thanks to
     information provided in the filename)
     Args:
@@ -45,16 +56,38 @@ def _download_audioset_file(filename, result_dir, platform="youtube", tmp_folder
         result_dir : str, result directory which will contain the downloaded file.
         platform: str, name of the platform, here youtube or vimeo.
         tmp_folder: str, the directory in which to download the temporary file generated by youtube_dl.
+        segment_only: bool, whether to download only the segment of the file, trimmed and resampled by ffmpeg
+            (see _fetch_audioset_file).
+        res_type: str, the resampling method of the whole file download (librosa res_type), example: "kaiser_fast".
     Return:
         list, Empty list if the file is downloaded, otherwise contains the filename and the error associated
 
     """
+    fetched = _fetch_audioset_file(
+        filename, result_dir, platform, tmp_folder, segment_only
+    )
+    return _save_audioset_segment(fetched, result_dir, res_type)
+
+
+def _fetch_audioset_file(
+    filename, result_dir, platform="youtube", tmp_folder="tmp", segment_only=False
+):
+    """ download with youtube_dl the audio of an AudioSet file in tmp_folder (first step of _download_audioset_file,
+    network bound).
+    Args:
+        filename : str, AudioSet filename to download.
+        result_dir : str, result directory which will contain the downloaded file.
+        platform: str, name of the platform, here youtube or vimeo.
+        tmp_folder: str, the directory in which to download the temporary file generated by youtube_dl.
+        segment_only: bool, if True, only the time range of the segment is downloaded, and decoded once by ffmpeg
+            in a 44.1kHz wav saved in result_dir (no file left to save, the cut can differ from the whole file
+            download by a few milliseconds).
+    Return:
+        tuple, (filename, path of the temporary file, None if there is nothing to save,
+        empty list if no error, otherwise contains the filename and the error associated)
+    """
     logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
     tmp_filename = ""
-    fname_no_ext = os.path.splitext(filename)[0]
-    segment_start = fname_no_ext.split("_")[-2]
-    segment_end = fname_no_ext.split("_")[-1]
-    audio_container = AudioContainer()
 
     # Define download parameters
     ydl_opts = {
@@ -66,6 +99,21 @@ def _download_audioset_file(filename, result_dir, platform="youtube", tmp_folder
         "logger": LoggerYtdlWarnings(),
         "audioformat": "wav",
     }
+    if segment_only:
+        fname_no_ext = os.path.splitext(filename)[0]
+        segment_start = float(fname_no_ext.split("_")[-2])
+        segment_end = float(fname_no_ext.split("_")[-1])
+        ydl_opts.update(
+            {
+                "download_ranges": download_range_func(
+                    None, [(segment_start, segment_end)]
+                ),
+                "postprocessors": [
+                    {"key": "FFmpegExtractAudio", "preferredcodec": "wav"}
+                ],
+                "postprocessor_args": {"extractaudio": ["-ar", "44100"]},
+            }
+        )
 
     if platform.lower() == "youtube":
         query_id = filename[1:12]  # Remove the Y in front of the file.
@@ -76,62 +124,126 @@ def _download_audioset_file(filename, result_dir, platform="youtube", tmp_folder
     else:
         raise NotImplementedError("platform can only be vimeo or youtube")
 
-    if not os.path.isfile(os.path.join(result_dir, filename)):
-        try:
-            logger.debug(filename)
-            # Download file
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                meta = ydl.extract_info(f"{baseurl}{query_id}", download=True)
-
-            audio_formats = [f for f in meta["formats"] if f.get("vcodec") == "none"]
-            if audio_formats is []:
-                return [filename, "no audio format available"]
-            # get the best audio format
-            best_audio_format = audio_formats[-1]
-
-            tmp_filename = tmp_folder + query_id + "." + best_audio_format["ext"]
-            audio_container.load(
-                filename=tmp_filename,
-                fs=44100,
-                res_type="kaiser_best",
-                start=float(segment_start),
-                stop=float(segment_end),
-                auto_trimming=True,
+    if os.path.isfile(os.path.join(result_dir, filename)):
+        logger.debug(f"{filename} exists, skipping")
+        return filename, None, []
+
+    try:
+        logger.debug(filename)
+        # Download file
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            meta = ydl.extract_info(f"{baseurl}{query_id}", download=True)
+
+        audio_formats = [f for f in meta["formats"] if f.get("vcodec") == "none"]
+        if len(audio_formats) == 0:
+            return filename, None, [filename, "no audio format available"]
+        # get the best audio format
+        best_audio_format = audio_formats[-1]
+
+        if segment_only:
+            tmp_filename = tmp_folder + query_id + ".wav"
+            if not os.path.exists(tmp_filename):
+                return filename, None, [filename, "segment not downloaded"]
+            _move_segment(
+                tmp_filename,
+                os.path.join(result_dir, filename),
+                segment_end - segment_start,
             )
+            return filename, None, []
+
+        tmp_filename = tmp_folder + query_id + "." + best_audio_format["ext"]
+        return filename, tmp_filename, []
 
-            # Save segmented audio
-            audio_container.filename = filename
-            audio_container.detect_file_format()
-            audio_container.save(filename=os.path.join(result_dir, filename))
+    except (KeyboardInterrupt, SystemExit):
+        # Remove temporary files and current audio file.
+        for fpath in glob.glob(tmp_folder + query_id + "*"):
+            os.remove(fpath)
+        raise
 
-            # Remove temporary file
+    # youtube-dl error, file often removed
+    except (ExtractorError, DownloadError, IOError) as e:
+        if os.path.exists(tmp_filename):
             os.remove(tmp_filename)
-            return []
-
-        except (KeyboardInterrupt, SystemExit):
-            # Remove temporary files and current audio file.
-            for fpath in glob.glob(tmp_folder + query_id + "*"):
-                os.remove(fpath)
-            raise
-
-        # youtube-dl error, file often removed, IO Error is for AudioContainer error if length of file is different.
-        except (ExtractorError, DownloadError, IOError) as e:
-            if os.path.exists(tmp_filename):
-                os.remove(tmp_filename)
-
-            return [filename, str(e)]
-
-        # multiprocessing can give this error
-        except (IndexError, ValueError) as e:
-            if os.path.exists(tmp_filename):
-                os.remove(tmp_filename)
-            logger.info(filename)
-            logger.info(str(e))
-            return [filename, "Index Error"]
+        return filename, None, [filename, str(e)]
+
+    # multiprocessing can give this error
+    except (IndexError, ValueError) as e:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        logger.info(filename)
+        logger.info(str(e))
+        return filename, None, [filename, "Index Error"]
+
+
+def _move_segment(tmp_filename, destination, duration, samplerate=44100):
+    """ Move a segment downloaded by _fetch_audioset_file, cut to last at most duration seconds """
+    info = sf.info(tmp_filename)
+    max_frames = int(round(duration * samplerate))
+    if info.frames > max_frames:
+        data, sr = sf.read(tmp_filename, frames=max_frames, always_2d=True)
+        sf.write(destination, data, sr, subtype=info.subtype)
+        os.remove(tmp_filename)
     else:
-        logger.debug(filename, "exists, skipping")
+        os.replace(tmp_filename, destination)
+
+
+def _save_audioset_segment(fetched, result_dir, res_type="kaiser_best"):
+    """ Trim, resample and save the segment of a file downloaded by _fetch_audioset_file (second step of
+    _download_audioset_file, CPU bound), the temporary file is removed.
+    Args:
+        fetched: tuple, the result of _fetch_audioset_file.
+        result_dir : str, result directory which will contain the downloaded file.
+        res_type: str, the resampling method (librosa res_type), "kaiser_best" is precise but slow, "kaiser_fast"
+            or "soxr_hq" are several times faster.
+    Return:
+        list, Empty list if the file is downloaded, otherwise contains the filename and the error associated
+    """
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+    filename, tmp_filename, error = fetched
+    if tmp_filename is None:
+        return error
+
+    fname_no_ext = os.path.splitext(filename)[0]
+    segment_start = fname_no_ext.split("_")[-2]
+    segment_end = fname_no_ext.split("_")[-1]
+    audio_container = AudioContainer()
+    try:
+        audio_container.load(
+            filename=tmp_filename,
+            fs=44100,
+            res_type=res_type,
+            start=float(segment_start),
+            stop=float(segment_end),
+            auto_trimming=True,
+        )
+
+        # Save segmented audio
+        audio_container.filename = filename
+        audio_container.detect_file_format()
+        audio_container.save(filename=os.path.join(result_dir, filename))
+
+        # Remove temporary file
+        os.remove(tmp_filename)
         return []
 
+    except (KeyboardInterrupt, SystemExit):
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+    # IO Error is for AudioContainer error if length of file is different.
+    except IOError as e:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        return [filename, str(e)]
+
+    except (IndexError, ValueError) as e:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        logger.info(filename)
+        logger.info(str(e))
+        return [filename, "Index Error"]
+
 
 def download_audioset_files(
     filenames,
@@ -140,6 +252,11 @@ def download_audioset_files(
     chunk_size=10,
     missing_files_tsv="..",
     platform="youtube",
+    downloader=None,
+    segment_only=False,
+    res_type="kaiser_best",
+    state_db=None,
+    max_attempts=3,
 ):
     """ download files in parallel from youtube given a tsv file listing files to download.
     It also stores not downloaded files with their associated error in "missing_files_[tsv_file].tsv"
@@ -152,23 +269,109 @@ def download_audioset_files(
                 because data is filled in memory but progress bar only updates after a chunk is finished.
            missing_files_tsv: str, path of the tsv which will contain the files that couldn't have been downloaded.
            platform: str, the platform the filenames are coming from "youtube" or "vimeo"
+           downloader: ThreadedDownloader, optional, if defined, the files are downloaded on its threads and
+                trimmed and resampled on its processes (n_jobs and chunk_size are then not used).
+           segment_only: bool, whether to download only the segments of the files (instead of the whole audio),
+                decoded, trimmed and resampled at once by ffmpeg.
+           res_type: str, the resampling method (librosa res_type) of the whole audio downloads,
+                example: "kaiser_fast" (faster than the default "kaiser_best").
+           state_db: str, optional, path of a SQLite database keeping the state of the downloads (see
+                DownloadState). The files already downloaded or having a permanent error (removed video...) are not
+                downloaded again, the other errors are retried with an exponential backoff.
+           max_attempts: int, the maximum number of attempts of a file (only used with state_db).
 
        Returns:
            missing_files : pandas.DataFrame, files not downloaded whith associated error.
 
        """
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
     warnings.filterwarnings("ignore")
     create_folder(result_dir)
     TMP_FOLDER = "tmp/"
     create_folder(TMP_FOLDER)
 
+    download_batch = functools.partial(
+        _download_audioset_batch,
+        result_dir=result_dir,
+        n_jobs=n_jobs,
+        chunk_size=chunk_size,
+        platform=platform,
+        downloader=downloader,
+        segment_only=segment_only,
+        res_type=res_type,
+        tmp_folder=TMP_FOLDER,
+    )
+    if state_db is None:
+        files_error = download_batch(filenames)
+    else:
+        with closing(DownloadState(state_db)) as state:
+            files_error = download_with_retries(
+                filenames, result_dir, download_batch, state, max_attempts
+            )
+            logger.info(f"Download state of {result_dir}: {state.summary(result_dir)}")
+
+    # Store files which gave error
+    missing_files = pd.DataFrame(files_error).dropna()
+    if not missing_files.empty:
+        # Save missing_files to be able to ask them
+        missing_files.columns = ["filename", "error"]
+        missing_files.to_csv(missing_files_tsv, index=False, sep="\t")
+        warnings.warn(
+            f"There are missing files at {missing_files_tsv}, \n"
+            f"see info on https://github.com/turpaultn/desed on how to get them",
+            DesedWarning,
+        )
+
+    if os.path.exists(TMP_FOLDER):
+        shutil.rmtree(TMP_FOLDER)
+    warnings.resetwarnings()
+    return missing_files
+
+
+def _download_audioset_batch(
+    filenames,
+    result_dir,
+    n_jobs=1,
+    chunk_size=10,
+    platform="youtube",
+    downloader=None,
+    segment_only=False,
+    res_type="kaiser_best",
+    tmp_folder="tmp/",
+):
+    """ download files from youtube with the engine chosen in download_audioset_files.
+    Returns:
+        list, for each file, an empty list if the file is downloaded, otherwise the filename and the error associated
+    """
     p = None
     files_error = []
     try:
-        if n_jobs == 1:
+        if downloader is not None:
+            fetch = functools.partial(
+                _fetch_audioset_file,
+                result_dir=result_dir,
+                platform=platform,
+                tmp_folder=tmp_folder,
+                segment_only=segment_only,
+            )
+            save_segment = functools.partial(
+                _save_audioset_segment, result_dir=result_dir, res_type=res_type
+            )
+            for filename, val, error in tqdm(
+                downloader.run(filenames, fetch, save_segment, host=platform.lower()),
+                total=len(filenames),
+            ):
+                files_error.append(val if error is None else [filename, str(error)])
+        elif n_jobs == 1:
             for filename in tqdm(filenames):
                 files_error.append(
-                    _download_audioset_file(filename, result_dir, platform)
+                    _download_audioset_file(
+                        filename,
+                        result_dir,
+                        platform,
+                        segment_only=segment_only,
+                        res_type=res_type,
+                    )
                 )
         # multiprocessing
         else:
@@ -178,7 +381,9 @@ def download_audioset_files(
                     _download_audioset_file,
                     result_dir=result_dir,
                     platform=platform,
-                    tmp_folder=TMP_FOLDER,
+                    tmp_folder=tmp_folder,
+                    segment_only=segment_only,
+                    res_type=res_type,
                 )
 
                 for val in tqdm(
@@ -187,31 +392,23 @@ def download_audioset_files(
                 ):
                     files_error.append(val)
 
-        # Store files which gave error
-        missing_files = pd.DataFrame(files_error).dropna()
-        if not missing_files.empty:
-            # Save missing_files to be able to ask them
-            missing_files.columns = ["filename", "error"]
-            missing_files.to_csv(missing_files_tsv, index=False, sep="\t")
-            warnings.warn(
-                f"There are missing files at {missing_files_tsv}, \n"
-                f"see info on https://github.com/turpaultn/desed on how to get them",
-                DesedWarning,
-            )
-
     except KeyboardInterrupt:
         if p is not None:
             p.terminate()
         raise KeyboardInterrupt
-
-    if os.path.exists(TMP_FOLDER):
-        shutil.rmtree(TMP_FOLDER)
-    warnings.resetwarnings()
-    return missing_files
+    return files_error
 
 
 def download_audioset_files_from_csv(
-    tsv_path, result_dir, missing_files_tsv=None, n_jobs=3, chunk_size=10
+    tsv_path,
+    result_dir,
+    missing_files_tsv=None,
+    n_jobs=3,
+    chunk_size=10,
+    downloader=None,
+    segment_only=False,
+    res_type="kaiser_best",
+    state_db=None,
 ):
     """ Download audioset files from a tsv_path containing a column "filename"
 
@@ -223,6 +420,11 @@ def download_audioset_files_from_csv(
         n_jobs : int, number of download to execute in parallel
         chunk_size : int, number of files to download before updating the progress bar. Bigger it is, faster it goes
             because data is filled in memory but progress bar only updates after a chunk is finished.
+        downloader: ThreadedDownloader, optional, the download engine (see download_audioset_files).
+        segment_only: bool, whether to download only the segments of the files (see download_audioset_files).
+        res_type: str, the resampling method of the whole audio downloads (see download_audioset_files).
+        state_db: str, optional, path of the SQLite database of the state of the downloads, only the files not
+            downloaded yet are downloaded (see download_audioset_files).
 
     Returns:
 
@@ -243,6 +445,10 @@ def download_audioset_files_from_csv(
         n_jobs=n_jobs,
         chunk_size=chunk_size,
         missing_files_tsv=missing_files_tsv,
+        downloader=downloader,
+        segment_only=segment_only,
+        res_type=res_type,
+        state_db=state_db,
     )
     logger.info("###### DONE #######")
     return missing_files
@@ -262,7 +468,7 @@ def download_eval_public(dataset_folder):
     url_public_eval = (
         f"https://zenodo.org/record/4560759/files/DESED_public_eval.tar.gz?download=1"
     )
-    download_and_unpack_archive(url_public_eval, dataset_folder)
+    download_and_unpack_archive(url_public_eval, dataset_folder, stream=True)
 
 
 def download_audioset_data(
@@ -273,6 +479,10 @@ def download_audioset_data(
     audioset=False,
     n_jobs=3,
     chunk_size=10,
+    downloader=None,
+    segment_only=False,
+    res_type="kaiser_best",
+    state_db=None,
 ):
     """ Download the DESED dataset files from Audioset.
 
@@ -285,6 +495,11 @@ def download_audioset_data(
         n_jobs : int, number of download to execute in parallel
         chunk_size : int, number of files to download before updating the progress bar. Bigger it is, faster it goes
             because data is filled in memory but progress bar only updates after a chunk is finished.
+        downloader: ThreadedDownloader, optional, the download engine (see download_audioset_files).
+        segment_only: bool, whether to download only the segments of the files (see download_audioset_files).
+        res_type: str, the resampling method of the whole audio downloads (see download_audioset_files).
+        state_db: str, optional, path of the SQLite database of the state of the downloads, only the files not
+            downloaded yet are downloaded (see download_audioset_files).
 
     Returns:
         list, list of missing files paths
@@ -313,6 +528,10 @@ def download_audioset_data(
             missing_files_tsv=path_missing_files_weak,
             n_jobs=n_jobs,
             chunk_size=chunk_size,
+            downloader=downloader,
+            segment_only=segment_only,
+            res_type=res_type,
+            state_db=state_db,
         )
         missing_files_paths.append(path_missing_files_weak)
 
@@ -327,6 +546,10 @@ def download_audioset_data(
             missing_files_tsv=path_missing_files_unlabel,
             n_jobs=n_jobs,
             chunk_size=chunk_size,
+            downloader=downloader,
+            segment_only=segment_only,
+            res_type=res_type,
+            state_db=state_db,
         )
         missing_files_paths.append(path_missing_files_unlabel)
 
@@ -341,6 +564,10 @@ def download_audioset_data(
             missing_files_tsv=path_missing_files_valid,
             n_jobs=n_jobs,
             chunk_size=chunk_size,
+            downloader=downloader,
+            segment_only=segment_only,
+            res_type=res_type,
+            state_db=state_db,
         )
         missing_files_paths.append(path_missing_files_valid)
 
@@ -360,7 +587,11 @@ def download_audioset_data(
             os.path.join(dataset_folder, "audio", "train", "strong_label_real"),
             missing_files_tsv=path_missing_files_audioset,
             n_jobs=n_jobs,
-            chunk_size=chunk_size
+            chunk_size=chunk_size,
+            downloader=downloader,
+            segment_only=segment_only,
+            res_type=res_type,
+            state_db=state_db,
         )
         missing_files_paths.append(path_missing_files_audioset)
 
@@ -382,6 +613,10 @@ def download_real(
     eval=True,
     n_jobs=3,
     chunk_size=10,
+    downloader=None,
+    segment_only=False,
+    res_type="kaiser_best",
+    state_db=None,
 ):
     """ Download the DESED real part of the dataset.
 
@@ -395,6 +630,13 @@ def download_real(
         n_jobs : int, number of download to execute in parallel
         chunk_size : int, number of files to download before updating the progress bar. Bigger it is, faster it goes
             because data is filled in memory but progress bar only updates after a chunk is finished.
+        downloader: ThreadedDownloader, optional, the download engine of the Audioset files, on threads
+            (see download_audioset_files).
+        segment_only: bool, whether to download only the segments of the Audioset files
+            (see download_audioset_files).
+        res_type: str, the resampling method of the whole audio downloads (see download_audioset_files).
+        state_db: str, optional, path of the SQLite database of the state of the Audioset downloads, a rerun only
+            downloads the files not downloaded yet (see download_audioset_files).
 
     Returns:
         list, list of missing files paths
@@ -409,6 +651,10 @@ def download_real(
         audioset=audioset,
         n_jobs=n_jobs,
         chunk_size=chunk_size,
+        downloader=downloader,
+        segment_only=segment_only,
+        res_type=res_type,
+        state_db=state_db,
     )
     return missing_files_paths
 
@@ -440,26 +686,114 @@ def _copy_files_kept(meta_df, input_dir, output_dir):
     )
 
 
-def download_and_unpack_archive(url, destination_folder, archive_format="gztar"):
+# Modes of tarfile reading a stream, for the formats of shutil.unpack_archive
+TAR_STREAM_MODES = {"tar": "r|", "gztar": "r|gz", "bztar": "r|bz2", "xztar": "r|xz"}
+
+
+class _HashingReader:
+    """ File-like object reading a stream, updating a md5 checksum and a progress bar with the bytes read """
+
+    def __init__(self, raw, progress_bar):
+        self.raw = raw
+        self.progress_bar = progress_bar
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.md5.update(data)
+        self.size += len(data)
+        self.progress_bar.update(len(data))
+        return data
+
+
+def _stream_unpack_tar(url, destination_folder, archive_format, md5=None, size=None, timeout=60):
+    """ Unpack a tar archive while downloading it: the HTTP response is read by a tar stream reader, the members
+    are extracted as they arrive (the archive is never written on disk).
+    Args:
+        url: str, URL of the archive.
+        destination_folder: str, the folder in which to extract the content of the archive.
+        archive_format: str, the format of the archive, a key of TAR_STREAM_MODES.
+        md5: str, optional, the expected md5 checksum (hex) of the archive.
+        size: int, optional, the expected size (in bytes) of the archive.
+        timeout: float, the timeout (in seconds) of the connection and of each read.
+    Returns:
+        None
+    """
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+    # Only the members inside destination_folder (and no special files) are extracted, if supported
+    extract_kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        # Undo the HTTP content encoding (not the compression of the archive)
+        response.raw.decode_content = True
+        total_length = response.headers.get("content-length")
+        if total_length is not None and "content-encoding" not in response.headers:
+            total_length = int(total_length)
+        else:
+            total_length = size
+        with tqdm(total=total_length, unit="B", unit_scale=True, mininterval=1) as progress_bar:
+            reader = _HashingReader(response.raw, progress_bar)
+            with tarfile.open(fileobj=reader, mode=TAR_STREAM_MODES[archive_format]) as tar:
+                tar.extractall(destination_folder, **extract_kwargs)
+            # The end of the archive (padding) is not read by tarfile, read for the checksum
+            for chunk in iter(lambda: reader.read(1024 * 1024), b""):
+                pass
+
+    if size is not None and reader.size != size:
+        raise DownloadDesedError(
+            f"Wrong size of {url}: {reader.size} bytes instead of {size}, the files extracted in "
+            f"{destination_folder} may be corrupted"
+        )
+    if md5 is not None and reader.md5.hexdigest() != md5.lower():
+        raise DownloadDesedError(
+            f"Wrong md5 checksum of {url}: {reader.md5.hexdigest()} instead of {md5}, the files extracted in "
+            f"{destination_folder} may be corrupted"
+        )
+    logger.info(f"{url} extracted in {destination_folder}")
+
+
+def download_and_unpack_archive(url, destination_folder, archive_format="gztar", stream=False):
     """ Download and unpack an archive from the internet. Useful for Zenodo archives.
 
     Args:
         url: str, URL to be download.
         destination_folder: str, the folder in which to extract the content of the archive.
         archive_format: str, the format of the archive to unpack.
+        stream: bool, whether to extract the archive while downloading it (tar based formats only: "tar", "gztar",
+            "bztar" or "xztar"), the archive is not written on disk. A compressed tar stream cannot be restarted in
+            the middle, so an interrupted streamed download starts again from zero (the members already extracted
+            are overwritten). Otherwise, the archive is downloaded in destination_folder/.<archive name>, and
+            removed once unpacked: an interrupted download is resumed by the next call.
 
     Returns:
 
     """
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
     create_folder(destination_folder)
-    # not using tempdir because too big files for some /tmp folders
-    archive_folder = tempfile.mkdtemp(prefix="tmp_", dir="./")
-    path_dl_tar = tempfile.NamedTemporaryFile(
-        dir=archive_folder, suffix="." + os.path.splitext(url.split("?")[0])[1]
-    ).name
-    download_file_from_url(url, path_dl_tar)
-    shutil.unpack_archive(path_dl_tar, destination_folder, format=archive_format)
-    shutil.rmtree(archive_folder)
+    if stream and archive_format in TAR_STREAM_MODES:
+        print(f"Downloading and extracting {os.path.basename(url.split('?')[0])}")
+        try:
+            metadata = zenodo_file_metadata(url)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Zenodo metadata of {url} not available, not verified: {e}")
+            metadata = None
+        md5, size = metadata if metadata is not None else (None, None)
+        _stream_unpack_tar(url, destination_folder, archive_format, md5=md5, size=size)
+        return
+    if stream:
+        logger.warning(f"Streaming not supported for {archive_format} archives, downloading the archive first")
+
+    # not using tempdir because too big files for some /tmp folders. The path does not change between calls, so
+    # the download is resumed from its .part file, and a downloaded archive (complete and verified) is kept until
+    # it is unpacked.
+    archive_path = os.path.join(
+        destination_folder, "." + os.path.basename(url.split("?")[0])
+    )
+    if not os.path.exists(archive_path):
+        download_file_from_url(url, archive_path, zenodo_checksum=True)
+    shutil.unpack_archive(archive_path, destination_folder, format=archive_format)
+    os.remove(archive_path)
 
 
 def download_sins(destination_folder):
@@ -632,7 +966,7 @@ def download_zenodo_soundbank(destination_folder):
     """
     create_folder(destination_folder)
     zip_meta_tut = "https://zenodo.org/record/4307908/files/DESED_synth_soundbank.tar.gz?download=1"
-    download_and_unpack_archive(zip_meta_tut, destination_folder)
+    download_and_unpack_archive(zip_meta_tut, destination_folder, stream=True)
 
 
 def split_desed_soundbank_train_val(basedir):
@@ -703,7 +1037,9 @@ def download_fsd50k(destination_folder, gtruth_only=False):
             logger.info(f"Downloading zip file: FSD50K.dev_audio.z{id}")
             url_dev = f"https://zenodo.org/record/4060432/files/FSD50K.dev_audio.z{id}?download=1"
             download_file_from_url(
-                url_dev, os.path.join(archive_folder, f"FSD50K.dev_audio.z{id}")
+                url_dev,
+                os.path.join(archive_folder, f"FSD50K.dev_audio.z{id}"),
+                zenodo_checksum=True,
             )
         logger.info("Unpacking files")
         subprocess.call(
@@ -725,7 +1061,9 @@ def download_fsd50k(destination_folder, gtruth_only=False):
             logger.info(f"Downloading zip file: FSD50K.eval_audio.z{id}")
             url_eval = f"https://zenodo.org/record/4060432/files/FSD50K.eval_audio.z{id}?download=1"
             download_file_from_url(
-                url_eval, os.path.join(archive_folder, f"FSD50K.eval_audio.z{id}")
+                url_eval,
+                os.path.join(archive_folder, f"FSD50K.eval_audio.z{id}"),
+                zenodo_checksum=True,
             )
         logger.info("Unpacking files")
         subprocess.call(
@@ -758,11 +1096,12 @@ def download_fuss(destination_folder):
         destination_folder: str, the folder in which to extract FUSS data.
     """
     url = "https://zenodo.org/record/3743844/files/FUSS_fsd_data.tar.gz?download=1"
+    # The largest archive: not streamed, to resume an interrupted download
     download_and_unpack_archive(url, destination_folder)
     url_doc = (
         "https://zenodo.org/record/4012661/files/FUSS_license_doc.tar.gz?download=1"
     )
-    download_and_unpack_archive(url_doc, destination_folder)
+    download_and_unpack_archive(url_doc, destination_folder, stream=True)
 
 
 def download_desed_soundbank(
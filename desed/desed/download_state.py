@@ -0,0 +1,310 @@
+"""On disk state of the downloads (SQLite), to retry only the failed files with an exponential backoff"""
+import inspect
+import os
+import sqlite3
+import time
+
+from .logger import create_logger, DesedError
+from .utils import create_folder
+
+DONE = "done"
+FAILED = "failed"  # Transient error, retried
+PERMANENT = "permanent"  # Never retried
+
+# Errors (substrings, lower case) for which a new attempt cannot succeed
+PERMANENT_ERRORS = (
+    "video unavailable",
+    "private video",
+    "has been removed",
+    "account associated with this video has been terminated",
+    "copyright",
+    "not available in your country",
+    "this video is not available",
+    "sign in to confirm your age",
+    "members-only",
+    "no audio format available",
+    "http error 404",
+)
+
+
+# Transient errors (substrings, lower case) used as the category of the failures, "other" if none matches
+TRANSIENT_ERRORS = (
+    "http error 429",
+    "http error 403",
+    "http error 5",
+    "timed out",
+    "connection",
+    "segment not downloaded",
+    "index error",
+)
+
+
+def classify_error(error):
+    """ Class and category of a download error.
+    Args:
+        error: str, the error message.
+    Returns:
+        tuple, (status, category). status is PERMANENT if the error is in PERMANENT_ERRORS (example: removed video),
+        FAILED otherwise (network error, too many requests...). category is the entry of PERMANENT_ERRORS or
+        TRANSIENT_ERRORS found in the error (example: "video unavailable"), "other" if none is found.
+    """
+    error = str(error).lower()
+    for permanent_error in PERMANENT_ERRORS:
+        if permanent_error in error:
+            return PERMANENT, permanent_error
+    for transient_error in TRANSIENT_ERRORS:
+        if transient_error in error:
+            return FAILED, transient_error
+    return FAILED, "other"
+
+
+class DownloadState:
+    """ SQLite database of the state of the downloaded files: status (done, failed or permanent), number of attempts,
+    last error and its category (see classify_error), time of the first and last attempts and of the next retry.
+    The files are identified by their folder and filename.
+
+    Args:
+        db_path: str, path of the SQLite database (created if it does not exist).
+        base_delay: float, the delay (in seconds) before the first retry of a file, doubled after each attempt.
+        max_delay: float, the maximum delay (in seconds) before a retry.
+
+    Examples:
+        >>> download_real("DESED", state_db="download_state.sqlite")
+    """
+
+    def __init__(self, db_path, base_delay=30, max_delay=3600):
+        create_folder(os.path.dirname(db_path))
+        self.db_path = db_path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "folder TEXT, filename TEXT, status TEXT, attempts INTEGER, error TEXT, error_class TEXT, "
+            "first_attempt REAL, last_attempt REAL, next_attempt REAL, PRIMARY KEY (folder, filename))"
+        )
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def _rows(self, folder):
+        cursor = self._connection.execute(
+            "SELECT filename, status, attempts, next_attempt FROM files WHERE folder = ?",
+            (os.path.abspath(folder),),
+        )
+        return {row[0]: row[1:] for row in cursor}
+
+    def outstanding(self, folder, filenames, max_attempts=None):
+        """ Files which are not downloaded and can be retried.
+        Args:
+            folder: str, the folder of the files.
+            filenames: list, the filenames.
+            max_attempts: int, optional, the files having already this number of attempts are not retried.
+        Returns:
+            list, the filenames not done, without permanent errors (in the order of filenames).
+        """
+        rows = self._rows(folder)
+        outstanding = []
+        for filename in filenames:
+            status, attempts, _ = rows.get(filename, (None, 0, None))
+            if status in [DONE, PERMANENT]:
+                continue
+            if max_attempts is not None and attempts >= max_attempts:
+                continue
+            outstanding.append(filename)
+        return outstanding
+
+    def next_attempts(self, folder, filenames):
+        """ Time of the next attempt of files (time.time() values, 0 for the files never tried).
+        Args:
+            folder: str, the folder of the files.
+            filenames: list, the filenames.
+        Returns:
+            dict, {filename: time of the next attempt}
+        """
+        rows = self._rows(folder)
+        return {
+            filename: (rows[filename][2] or 0) if filename in rows else 0
+            for filename in filenames
+        }
+
+    def record(self, folder, filename, error=None, now=None):
+        """ Record an attempt of download.
+        Args:
+            folder: str, the folder of the file.
+            filename: str, the filename.
+            error: str, optional, the error if the download failed, None if it succeeded.
+            now: float, optional, the time of the attempt (time.time() by default).
+        Returns:
+            str, the new status of the file.
+        """
+        self.record_many(folder, [(filename, error)], now)
+        return self._rows(folder)[filename][0]
+
+    def record_many(self, folder, results, now=None):
+        """ Record attempts of download (in a single transaction).
+        Args:
+            folder: str, the folder of the files.
+            results: list, tuples (filename, error), error None if the download succeeded.
+            now: float, optional, the time of the attempts (time.time() by default).
+        Returns:
+            None
+        """
+        if now is None:
+            now = time.time()
+        folder = os.path.abspath(folder)
+        rows = self._rows(folder)
+        values = []
+        for filename, error in results:
+            _, attempts, _ = rows.get(filename, (None, 0, None))
+            attempts += 1
+            if error is None:
+                status, error_class, next_attempt = DONE, None, None
+            else:
+                status, error_class = classify_error(error)
+                next_attempt = None
+                if status == FAILED:
+                    delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+                    next_attempt = now + delay
+            values.append(
+                (
+                    folder,
+                    filename,
+                    status,
+                    attempts,
+                    None if error is None else str(error),
+                    error_class,
+                    now,
+                    now,
+                    next_attempt,
+                )
+            )
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (folder, filename) DO UPDATE SET status = excluded.status, "
+                "attempts = excluded.attempts, error = excluded.error, error_class = excluded.error_class, "
+                "last_attempt = excluded.last_attempt, next_attempt = excluded.next_attempt",
+                values,
+            )
+
+    def reset_failed(self, folder, filenames):
+        """ Reset the attempts of the files having a transient error, so they are retried immediately (the files
+        with a permanent error are not reset).
+        Args:
+            folder: str, the folder of the files.
+            filenames: list, the filenames.
+        Returns:
+            int, the number of files reset.
+        """
+        folder = os.path.abspath(folder)
+        with self._connection:
+            cursor = self._connection.executemany(
+                "UPDATE files SET attempts = 0, next_attempt = NULL "
+                "WHERE folder = ? AND filename = ? AND status = ?",
+                [(folder, filename, FAILED) for filename in filenames],
+            )
+        return cursor.rowcount
+
+    def summary(self, folder=None, by="status"):
+        """ Number of files per status, or per error category.
+        Args:
+            folder: str, optional, only count the files of this folder.
+            by: str, "status" to count the files per status, "error_class" to count the files not downloaded per
+                category of their last error (see classify_error).
+        Returns:
+            dict, {status or error category: number of files}
+        """
+        if by not in ["status", "error_class"]:
+            raise DesedError(f"by has to be 'status' or 'error_class', got {by}")
+        conditions = []
+        values = []
+        if folder is not None:
+            conditions.append("folder = ?")
+            values.append(os.path.abspath(folder))
+        if by == "error_class":
+            conditions.append("status != ?")
+            values.append(DONE)
+        where = f" WHERE {' AND '.join(conditions)}" if len(conditions) > 0 else ""
+        cursor = self._connection.execute(
+            f"SELECT {by}, COUNT(*) FROM files{where} GROUP BY {by}", values
+        )
+        return dict(cursor.fetchall())
+
+    def errors(self, folder, filenames, error_class=False):
+        """ Last error of the files not downloaded.
+        Args:
+            folder: str, the folder of the files.
+            filenames: list, the filenames.
+            error_class: bool, whether to add the category of the error (see classify_error).
+        Returns:
+            list, [filename, error] (or [filename, error, category]) of the files having an error (in the order of
+            filenames).
+        """
+        cursor = self._connection.execute(
+            "SELECT filename, error, error_class FROM files WHERE folder = ? AND status != ?",
+            (os.path.abspath(folder), DONE),
+        )
+        errors = {row[0]: list(row[1:]) for row in cursor}
+        return [
+            [filename] + (errors[filename] if error_class else errors[filename][:1])
+            for filename in filenames
+            if filename in errors
+        ]
+
+
+def download_with_retries(
+    filenames,
+    folder,
+    download_batch,
+    state,
+    max_attempts=3,
+    sleep=time.sleep,
+    retry_failed=True,
+):
+    """ Download files, retrying the transient failures with an exponential backoff (see DownloadState), the files
+    done or having a permanent error in the state are not downloaded.
+    Args:
+        filenames: list, the filenames to download.
+        folder: str, the folder of the files (key of the files in the state).
+        download_batch: function, download_batch(filenames) downloads files and returns the list of errors
+            [filename, error] (or empty lists for the downloaded files).
+        state: DownloadState, the state of the downloads.
+        max_attempts: int, the maximum number of attempts of a file.
+        sleep: function, the function called to wait for the next retry.
+        retry_failed: bool, whether the files with a transient error in a previous run get max_attempts new
+            attempts (their attempts are reset), otherwise the files having already max_attempts are not retried.
+    Returns:
+        list, [filename, error] of the files not downloaded.
+    """
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+    filenames = list(dict.fromkeys(filenames))
+    if retry_failed:
+        n_reset = state.reset_failed(folder, filenames)
+        if n_reset > 0:
+            logger.info(f"Retrying {n_reset} files which failed in a previous run")
+    outstanding = state.outstanding(folder, filenames, max_attempts)
+    logger.info(
+        f"{len(outstanding)} files to download over {len(filenames)} in {folder}"
+    )
+    while len(outstanding) > 0:
+        next_attempts = state.next_attempts(folder, outstanding)
+        now = time.time()
+        due = [filename for filename in outstanding if next_attempts[filename] <= now]
+        if len(due) == 0:
+            wait_time = min(next_attempts.values()) - now
+            logger.info(
+                f"Waiting {wait_time:.0f}s to retry {len(outstanding)} files"
+            )
+            sleep(wait_time)
+            continue
+
+        errors = {
+            error[0]: error[1] for error in download_batch(due) if len(error) > 0
+        }
+        state.record_many(
+            folder, [(filename, errors.get(filename)) for filename in due]
+        )
+        outstanding = state.outstanding(folder, outstanding, max_attempts)
+    return state.errors(folder, filenames)
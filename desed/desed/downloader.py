@@ -0,0 +1,169 @@
+"""Downloads on a thread pool (network bound) with a concurrency limit and a rate limit per host, the processing of
+the downloaded files (CPU bound) on a small process pool"""
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import nullcontext
+from itertools import islice
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """ Token bucket rate limit (thread safe): acquire takes a token, tokens are added at rate per second up to
+    capacity (the number of requests which can be done at once after an idle period).
+
+    Args:
+        rate: float, the number of tokens added per second.
+        capacity: int, the maximum number of tokens.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Wait for a token and take it """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def url_host(url):
+    """ Host of a URL (the key of the per host limits)
+    Args:
+        url: str, the URL.
+    Returns:
+        str, the host, example: "zenodo.org".
+    """
+    return urlparse(url).netloc
+
+
+class ThreadedDownloader:
+    """ Download engine: the fetch of each item runs on a thread pool, at most max_per_host fetches at the same time
+    and rate_limit fetches per second for each host. The fetched results are then processed (decoding, resampling...)
+    on a pool of n_processes processes, so the threads only wait for the network.
+
+    Args:
+        n_threads: int, the number of threads fetching the items.
+        max_per_host: int, the maximum number of fetches at the same time for a host.
+        rate_limit: float, optional, the maximum number of fetches started per second for a host.
+        burst: int, the number of fetches which can start at once for a host (capacity of the token bucket).
+        n_processes: int, the number of processes of the processing, 0 to process the results in the main process.
+
+    Examples:
+        >>> downloader = ThreadedDownloader(n_threads=32, max_per_host=8, rate_limit=5, n_processes=2)
+        >>> download_real("DESED", downloader=downloader)
+    """
+
+    def __init__(
+        self, n_threads=16, max_per_host=4, rate_limit=None, burst=1, n_processes=1
+    ):
+        self.n_threads = n_threads
+        self.max_per_host = max_per_host
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.n_processes = n_processes
+        self._semaphores = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _host_limits(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+                if self.rate_limit is not None:
+                    self._buckets[host] = TokenBucket(self.rate_limit, self.burst)
+            return self._semaphores[host], self._buckets.get(host)
+
+    def _fetch(self, fetch, host, item):
+        semaphore, bucket = self._host_limits(host)
+        with semaphore:
+            if bucket is not None:
+                bucket.acquire()
+            return fetch(item)
+
+    def run(self, items, fetch, process=None, host=None):
+        """ Fetch and process items, the results are yielded as soon as they are ready (not in the order of items).
+        An exception raised by fetch or process for an item is yielded as the error of this item, the other items
+        are still downloaded.
+        Args:
+            items: iterable, the items to download (consumed progressively).
+            fetch: function, fetch(item) downloads an item (run in a thread).
+            process: function, optional, process(fetched) processes the result of fetch (run in a process, has
+                to be picklable: a module level function or functools.partial of it).
+            host: function or str, optional, host(item) is the host of an item (or the host of all the items),
+                the URL host of the item if None.
+        Returns:
+            generator, tuples (item, result, error): the result of process (or fetch if process is None) and None,
+            or None and the exception raised for the item.
+        """
+        if host is None:
+            host = url_host
+        elif isinstance(host, str):
+            host_name = host
+            host = lambda item: host_name
+        items = iter(items)
+        if self.n_processes > 0:
+            process_executor = ProcessPoolExecutor(self.n_processes)
+        else:
+            process_executor = nullcontext()
+
+        with ThreadPoolExecutor(self.n_threads) as threads, process_executor:
+            # {future: item}
+            fetching = {}
+            processing = {}
+
+            def submit_fetch(n_items):
+                for item in islice(items, n_items):
+                    future = threads.submit(self._fetch, fetch, host(item), item)
+                    fetching[future] = item
+
+            # A few items more than threads are queued, the items are not all read at once
+            submit_fetch(2 * self.n_threads)
+            while len(fetching) + len(processing) > 0:
+                done, _ = wait(
+                    set(fetching) | set(processing), return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    if future in processing:
+                        item = processing.pop(future)
+                        yield _future_outcome(item, future)
+                        continue
+                    item = fetching.pop(future)
+                    submit_fetch(1)
+                    if process is None or future.exception() is not None:
+                        yield _future_outcome(item, future)
+                    elif self.n_processes > 0:
+                        processing[
+                            process_executor.submit(process, future.result())
+                        ] = item
+                    else:
+                        try:
+                            yield item, process(future.result()), None
+                        except Exception as e:
+                            yield item, None, e
+
+
+def _future_outcome(item, future):
+    """ (item, result, None) if the future succeeded, (item, None, exception) otherwise """
+    error = future.exception()
+    if error is not None:
+        return item, None, error
+    return item, future.result(), None
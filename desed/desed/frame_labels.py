@@ -0,0 +1,159 @@
+"""Frame level (multi-hot) strong labels of the annotations, exported in a memory mapped array"""
+import inspect
+import json
+import os
+import shutil
+from collections import namedtuple
+from os import path as osp
+
+import numpy as np
+import pandas as pd
+
+from .logger import create_logger, DesedError
+
+FrameLabels = namedtuple(
+    "FrameLabels", ["labels", "filenames", "classes", "hop_size", "duration"]
+)
+
+
+def n_frames(duration, hop_size):
+    """ Number of frames of a clip (the last frame can be partial).
+    Args:
+        duration: float, duration of the clip in seconds.
+        hop_size: float, duration of a frame in seconds.
+    Returns:
+        int, the number of frames.
+    """
+    # Rounded to avoid a frame more because of float errors (10 / 0.02 = 500.00000000000006)
+    return int(np.ceil(np.round(duration / hop_size, 6)))
+
+
+def export_frame_labels(
+    df,
+    out_dir,
+    classes,
+    hop_size=0.02,
+    duration=10.0,
+    filenames=None,
+    dtype=np.uint8,
+    chunk_files=1000,
+):
+    """ Write the frame level labels of annotations in out_dir: labels.npy, array of shape
+    [n_files, n_frames, n_classes] (1 if the class is active in the frame), and meta.json (filenames, classes,
+    hop_size and duration). A frame is active if an event of the class overlaps it.
+    Args:
+        df: pd.DataFrame, the annotations (post processed), columns: ["filename", "onset", "offset", "event_label"].
+        out_dir: str, the folder in which to write the labels, replaced if it exists.
+        classes: list, the classes (order of the last dimension), the events of other labels are ignored.
+        hop_size: float, duration of a frame in seconds.
+        duration: float, duration of the clips in seconds.
+        filenames: list, optional, the files (order of the first dimension), can contain files without events.
+            If None, the sorted filenames of df.
+        dtype: np.dtype, the type of the array (np.uint8 or bool).
+        chunk_files: int, the number of files computed at once (bounds the memory used).
+    Returns:
+        FrameLabels, namedtuple (labels memory mapped, filenames, classes, hop_size, duration).
+    """
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+    if filenames is None:
+        filenames = sorted(df["filename"].unique())
+    filenames = list(filenames)
+    classes = list(classes)
+    frames = n_frames(duration, hop_size)
+
+    file_index = pd.Index(filenames)
+    if not file_index.is_unique:
+        raise DesedError("filenames contains duplicates")
+    file_codes = file_index.get_indexer(df["filename"])
+    class_codes = pd.Index(classes).get_indexer(df["event_label"])
+    if (file_codes == -1).any():
+        raise DesedError("Some filenames of df are not in filenames")
+    ignored = class_codes == -1
+    if ignored.any():
+        logger.warning(
+            f"{ignored.sum()} events ignored, their labels are not in classes: "
+            f"{sorted(df['event_label'][ignored].astype(str).unique())}"
+        )
+    onset_frames = np.floor(
+        np.round(df["onset"].to_numpy(dtype=float) / hop_size, 6)
+    ).astype(int)
+    offset_frames = np.ceil(
+        np.round(df["offset"].to_numpy(dtype=float) / hop_size, 6)
+    ).astype(int)
+    onset_frames = np.clip(onset_frames, 0, frames)
+    offset_frames = np.clip(offset_frames, 0, frames)
+    keep = ~ignored & (offset_frames > onset_frames)
+    file_codes, class_codes = file_codes[keep], class_codes[keep]
+    onset_frames, offset_frames = onset_frames[keep], offset_frames[keep]
+
+    tmp_dir = osp.join(
+        osp.dirname(osp.abspath(out_dir)), f".{osp.basename(out_dir)}.{os.getpid()}"
+    )
+    if osp.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    labels = np.lib.format.open_memmap(
+        osp.join(tmp_dir, "labels.npy"),
+        mode="w+",
+        dtype=dtype,
+        shape=(len(filenames), frames, len(classes)),
+    )
+    order = np.argsort(file_codes, kind="stable")
+    bounds = np.searchsorted(
+        file_codes[order], np.arange(0, len(filenames) + chunk_files, chunk_files)
+    )
+    for start, (first, last) in zip(
+        range(0, len(filenames), chunk_files), zip(bounds[:-1], bounds[1:])
+    ):
+        events = order[first:last]
+        n_files = min(chunk_files, len(filenames) - start)
+        # +1 at the onset frame, -1 after the offset frame, the cumulative sum counts the active events
+        delta = np.zeros((n_files, frames + 1, len(classes)), dtype=np.int32)
+        np.add.at(
+            delta,
+            (file_codes[events] - start, onset_frames[events], class_codes[events]),
+            1,
+        )
+        np.add.at(
+            delta,
+            (file_codes[events] - start, offset_frames[events], class_codes[events]),
+            -1,
+        )
+        labels[start : start + n_files] = np.cumsum(delta[:, :-1], axis=1) > 0
+    labels.flush()
+    del labels
+
+    with open(osp.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "filenames": filenames,
+                "classes": classes,
+                "hop_size": hop_size,
+                "duration": duration,
+            },
+            f,
+        )
+    if osp.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.replace(tmp_dir, out_dir)
+    return load_frame_labels(out_dir)
+
+
+def load_frame_labels(out_dir, mmap=True):
+    """ Load the frame level labels written by export_frame_labels.
+    Args:
+        out_dir: str, the folder of the labels.
+        mmap: bool, whether the labels are memory mapped (read from the disk when sliced) or loaded in memory.
+    Returns:
+        FrameLabels, namedtuple (labels [n_files, n_frames, n_classes], filenames, classes, hop_size, duration).
+    """
+    with open(osp.join(out_dir, "meta.json")) as f:
+        meta = json.load(f)
+    labels = np.load(osp.join(out_dir, "labels.npy"), mmap_mode="r" if mmap else None)
+    return FrameLabels(
+        labels=labels,
+        filenames=meta["filenames"],
+        classes=meta["classes"],
+        hop_size=meta["hop_size"],
+        duration=meta["duration"],
+    )
@@ -1,16 +1,35 @@
 # -*- coding: utf-8 -*-
 """class and functions to generate synthetic data using loops"""
+import functools
+import heapq
+import itertools
+import json
 import os
+import shutil
+import tempfile
 from os import path as osp
 import inspect
+from contextlib import closing
+from multiprocessing import Pool
 
+import numpy as np
 import pandas as pd
 from scaper import generate_from_jams
 
-from .logger import create_logger
+from . import mixing
+from .audio_cache import scaper_audio_cache
+from .logger import create_logger, DesedError
+from .manifest import GenerationManifest, clip_record
+from .mixing import check_backend
 from .post_process import _post_process_labels_file, get_labels_from_jams
-from .soundscape import Soundscape
-from .utils import create_folder, _check_random_state
+from .recipes import sample_balance_recipes, sample_occurence_recipes
+from .soundscape import Soundscape, _tmp_path
+from .utils import (
+    create_folder,
+    _check_random_state,
+    _clip_random_state,
+    _recipes_random_state,
+)
 
 
 class SoundscapesGenerator:
@@ -21,8 +40,17 @@ class SoundscapesGenerator:
         bg_folder: str, path to the "background" folder. Contains one subfolder for each label
         ref_db: float, the dB reference of audio files (See scaper)
         samplerate: int, the sample rate desired of the generated soundscapes (be careful of the soundscape sample rate)
-        random_state: np.random.RandomState or int, the random_state wanted to be able to reproduce the dataset
+        random_state: np.random.RandomState or int, the random_state wanted to be able to reproduce the dataset.
+            Each call to a generate method draws a single seed from it, the random state of each clip is then
+            derived from this seed and the index of the clip.
         delete_if_exists: bool, whether to delete existing files and folders created with the same name.
+        soundbank_index: SoundbankIndex, optional, index of the files of fg_folder and bg_folder
+            (avoid listing the folders and reading the files headers for each event).
+        audio_cache: AudioCache, optional, cache of decoded source audio, shared by the rendered soundscapes
+            (each process rendering soundscapes gets its own cache).
+        transform_cache: TransformCache, optional, disk cache of the pitch shifted and time stretched sources,
+            the pitch shifts and time stretches are then quantized (see desed.transform_cache).
+        backend: str, "scaper" or "numpy", the render backend of the soundscapes (see Soundscape).
     """
 
     def __init__(
@@ -35,7 +63,12 @@ class SoundscapesGenerator:
         random_state=None,
         delete_if_exists=True,
         logger=None,
+        soundbank_index=None,
+        audio_cache=None,
+        transform_cache=None,
+        backend="scaper",
     ):
+        check_backend(backend)
         self.duration = duration
         self.ref_db = ref_db
         self.fg_folder = fg_folder
@@ -43,6 +76,10 @@ class SoundscapesGenerator:
         self.samplerate = samplerate
         self.random_state = _check_random_state(random_state)
         self.delete_if_exists = delete_if_exists
+        self.soundbank_index = soundbank_index
+        self.audio_cache = audio_cache
+        self.transform_cache = transform_cache
+        self.backend = backend
         self.logger = logger
         if self.logger is None:
             self.logger = create_logger(
@@ -67,6 +104,13 @@ class SoundscapesGenerator:
         bg_labels=None,
         txt_file=True,
         start_from=0,
+        n_jobs=1,
+        chunk_size=1,
+        shard_index=0,
+        num_shards=1,
+        resume=False,
+        verify_checksums=False,
+        no_audio=False,
         **kwargs,
     ):
         """ Generate
@@ -91,6 +135,22 @@ class SoundscapesGenerator:
 
             txt_file: bool, whether or not to save the .txt file.
             start_from: int, the number to start from if file already created.
+            n_jobs: int, number of processes rendering the clips in parallel. The generated files do not depend
+                on n_jobs: each clip draws its random numbers from its own seed.
+            chunk_size: int, number of clips sent at once to a process (only used when n_jobs > 1).
+            shard_index: int, the index of the shard to generate, in [0, num_shards).
+            num_shards: int, number of shards the dataset is split in. Only the clips whose position
+                modulo num_shards equals shard_index are generated. Generating all the shards (on different
+                machines, with the same random_state) gives the same files as num_shards=1.
+            resume: bool, whether to skip the clips already generated in out_folder. A clip is generated
+                when all its files are written, and is then added to out_folder/generation_manifest.tsv.
+                Clips missing from the manifest (never generated or interrupted) are generated again, and
+                the temporary files left by the interrupted clips are removed. The random_state and the
+                parameters have to be the same as the interrupted generation (checked with the manifest).
+            verify_checksums: bool, when resuming, whether to check the md5 checksum of the files of the generated
+                clips (reads all of them), otherwise only their size is checked.
+            no_audio: bool, planning mode: only write the JAMS (and txt) files, without rendering any audio.
+                The audio of the planned clips is rendered later with generate_files_from_jams.
             kwargs: arguments accepted by Scaper.generate
 
             * tuple is in the form of a distribution accepted by scaper.
@@ -108,42 +168,123 @@ class SoundscapesGenerator:
             "pitch_shifts": pitch_shifts,
             "time_stretches": time_stretches,
         }
+        generate_one_clip = functools.partial(
+            _generate_one_bg_multi_fg,
+            min_events=min_events,
+            max_events=max_events,
+            out_folder=out_folder,
+            txt_file=txt_file,
+            save_isolated_events=save_isolated_events,
+            bg_labels=bg_labels,
+            no_audio=no_audio,
+            **params,
+            **kwargs,
+        )
 
-        for cnt in range(number):
-            self.logger.debug(
-                "Generating soundscape: {:d}/{:d}".format(cnt + 1, number)
-            )
-            # create a scaper
-            n_events = self.random_state.randint(min_events, max_events + 1)
-
-            if start_from + cnt < 10:
-                filename = "0" + str(start_from + cnt)
-            else:
-                filename = str(start_from + cnt)
-
-            sc = Soundscape(
-                self.duration,
-                self.fg_folder,
-                self.bg_folder,
-                self.ref_db,
-                self.samplerate,
-                random_state=self.random_state,
-                delete_if_exists=self.delete_if_exists,
-            )
-            sc.generate_one_bg_multi_fg(
-                out_folder=out_folder,
-                filename=filename,
-                n_fg_events=n_events,
-                **params,
+        _check_shard(shard_index, num_shards)
+        root_seed = self._root_seed()
+        manifest = GenerationManifest(out_folder)
+        manifest.check_config(
+            self._generation_config(
+                "generate",
+                root_seed,
+                min_events=min_events,
+                max_events=max_events,
                 txt_file=txt_file,
                 save_isolated_events=save_isolated_events,
                 bg_labels=bg_labels,
+                no_audio=no_audio,
+                **params,
                 **kwargs,
+            ),
+            resume,
+        )
+        clips = [
+            (root_seed, start_from + cnt)
+            for cnt in range(number)
+            if cnt % num_shards == shard_index
+            and not (
+                resume and manifest.is_complete(start_from + cnt, verify_checksums)
             )
-            if cnt % 200 == 0:
-                self.logger.info(
-                    f"generating {cnt} / {number} files (updated every 200)"
+        ]
+        if resume:
+            manifest.remove_tmp_files([_clip_filename(index) for _, index in clips])
+
+        if n_jobs == 1:
+            soundscape = Soundscape(**self._soundscape_params())
+            for cnt, clip in enumerate(clips):
+                self.logger.debug(
+                    "Generating soundscape: {:d}/{:d}".format(cnt + 1, number)
+                )
+                manifest.append(generate_one_clip(clip, soundscape=soundscape))
+                if cnt % 200 == 0:
+                    self.logger.info(
+                        f"generating {cnt} / {number} files (updated every 200)"
+                    )
+        else:
+            with closing(
+                Pool(
+                    n_jobs,
+                    initializer=_init_worker_soundscape,
+                    initargs=(self._soundscape_params(),),
                 )
+            ) as p:
+                for cnt, record in enumerate(
+                    p.imap_unordered(generate_one_clip, clips, chunk_size)
+                ):
+                    manifest.append(record)
+                    if cnt % 200 == 0:
+                        self.logger.info(
+                            f"generating {cnt} / {number} files (updated every 200)"
+                        )
+
+    def _root_seed(self):
+        """ Seed from which the random state of each clip is derived (see _clip_random_state) """
+        return self.random_state.randint(np.iinfo(np.int32).max)
+
+    def _generation_config(self, method, root_seed, **params):
+        """ Configuration on which the generated clips depend, saved in the manifest (see GenerationManifest)
+        Args:
+            method: str, the name of the generate method.
+            root_seed: int, the seed of the dataset (see _clip_random_state).
+            params: the parameters of the method changing the clips.
+        Returns:
+            dict, the configuration.
+        """
+        transform_cache = self.transform_cache
+        if transform_cache is not None:
+            transform_cache = [
+                transform_cache.pitch_step,
+                transform_cache.stretch_step,
+                transform_cache.quick,
+            ]
+        return {
+            "method": method,
+            "root_seed": int(root_seed),
+            "duration": self.duration,
+            "fg_folder": osp.abspath(self.fg_folder),
+            "bg_folder": osp.abspath(self.bg_folder),
+            "ref_db": self.ref_db,
+            "samplerate": self.samplerate,
+            "transform_cache": transform_cache,
+            "backend": self.backend,
+            "params": params,
+        }
+
+    def _soundscape_params(self):
+        """ Parameters of the Soundscape reused (see Soundscape.reset) to generate the clips """
+        return {
+            "duration": self.duration,
+            "fg_path": self.fg_folder,
+            "bg_path": self.bg_folder,
+            "ref_db": self.ref_db,
+            "samplerate": self.samplerate,
+            "delete_if_exists": self.delete_if_exists,
+            "soundbank_index": self.soundbank_index,
+            "audio_cache": self.audio_cache,
+            "transform_cache": self.transform_cache,
+            "backend": self.backend,
+        }
 
     def generate_balance(
         self,
@@ -158,12 +299,18 @@ class SoundscapesGenerator:
         pitch_shift=None,
         time_stretch=None,
         bg_labels=None,
+        shard_index=0,
+        num_shards=1,
+        resume=False,
+        verify_checksums=False,
+        no_audio=False,
         **kwargs,
     ):
         """ Generate landscapes by taking into account the probabilities of labels and their co-occurence
         Args:
 
-            number: int, the number of files to generate
+            number: int, the number of files to generate (the same number for each label, the remaining files
+                are given to labels chosen at random)
             out_folder: str, the path of the folder where to save the generated files
             min_events: int, the minimum number of events per files
             max_events: int, the maximum number of labels per file
@@ -176,10 +323,28 @@ class SoundscapesGenerator:
             time_stretch: tuple, tuple accepted by Scaper().add_event()
             bg_labels: list, if None choose in all available files. If a name is given it has to match the name
                 of a folder in 'background'. example: ["sins"]
+            shard_index: int, the index of the shard to generate, in [0, num_shards).
+            num_shards: int, number of shards the dataset is split in. Only the clips whose position
+                modulo num_shards equals shard_index are generated. Generating all the shards (on different
+                machines, with the same random_state) gives the same files as num_shards=1.
+            resume: bool, whether to skip the clips already generated in out_folder. A clip is generated
+                when all its files are written, and is then added to out_folder/generation_manifest.tsv.
+                Clips missing from the manifest (never generated or interrupted) are generated again, and
+                the temporary files left by the interrupted clips are removed. The random_state and the
+                parameters have to be the same as the interrupted generation (checked with the manifest).
+            verify_checksums: bool, when resuming, whether to check the md5 checksum of the files of the generated
+                clips (reads all of them), otherwise only their size is checked.
+            no_audio: bool, planning mode: only write the JAMS (and txt) files, without rendering any audio.
+                The audio of the planned clips is rendered later with generate_files_from_jams.
             kwargs: parametes accepted by Scaper().generate()
+        Returns:
+            pd.DataFrame, the recipes of the clips (see desed.recipes.sample_balance_recipes), sampled for the whole
+            dataset before rendering the clips of the shard.
         """
+        _check_shard(shard_index, num_shards)
         create_folder(out_folder)
-        cnt = 0
+        root_seed = self._root_seed()
+        manifest = GenerationManifest(out_folder)
         if list_labels is None:
             list_labels = []
             for pth in os.listdir(self.fg_folder):
@@ -191,52 +356,51 @@ class SoundscapesGenerator:
             list_labels = sorted(set(list_labels))
             self.logger.debug(f"list of labels: {list_labels}")
 
-        for label in list_labels:
-            self.logger.debug(
-                "Generating soundscape: {:d}/{:d}".format(cnt + 1, number)
-            )
-            number_per_class = max(1, round(number // len(list_labels)))
-            for i in range(number_per_class):
-                sc = Soundscape(
-                    self.duration,
-                    self.fg_folder,
-                    self.bg_folder,
-                    self.ref_db,
-                    self.samplerate,
-                    random_state=self.random_state,
-                    delete_if_exists=self.delete_if_exists,
-                )
-                if start_from + cnt < 10:
-                    filename = "0" + str(start_from + cnt)
-                else:
-                    filename = str(start_from + cnt)
-                if min_events == max_events:
-                    n_events = min_events
-                else:
-                    n_events = self.random_state.randint(min_events, max_events)
-                sc.generate_using_non_noff(
-                    label=label,
-                    list_labels=list_labels,
-                    out_folder=out_folder,
-                    filename=filename,
-                    n_events=n_events,
-                    save_isolated_events=save_isolated_events,
-                    snr=snr,
-                    pitch_shift=pitch_shift,
-                    time_stretch=time_stretch,
-                    bg_labels=bg_labels,
-                    **kwargs,
-                )
-                if cnt % 200 == 0:
-                    self.logger.info(
-                        f"generating {cnt} / {number} files (updated every 200)"
-                    )
-                cnt += 1
-        if cnt != number:
-            self.logger.warn(
-                f"The number of generated examples ({cnt}) is different from the number asked ({number}) "
-                f"because of probabilities of events."
-            )
+        manifest.check_config(
+            self._generation_config(
+                "generate_balance",
+                root_seed,
+                number=number,
+                list_labels=list_labels,
+                min_events=min_events,
+                max_events=max_events,
+                snr=snr,
+                start_from=start_from,
+                save_isolated_events=save_isolated_events,
+                pitch_shift=pitch_shift,
+                time_stretch=time_stretch,
+                bg_labels=bg_labels,
+                no_audio=no_audio,
+                **kwargs,
+            ),
+            resume,
+        )
+        recipes = sample_balance_recipes(
+            number,
+            list_labels,
+            min_events,
+            max_events,
+            snr=snr,
+            random_state=_recipes_random_state(root_seed),
+            start_from=start_from,
+        )
+        self._generate_recipes(
+            recipes,
+            out_folder,
+            root_seed,
+            manifest,
+            shard_index=shard_index,
+            num_shards=num_shards,
+            resume=resume,
+            verify_checksums=verify_checksums,
+            save_isolated_events=save_isolated_events,
+            pitch_shift=pitch_shift,
+            time_stretch=time_stretch,
+            bg_labels=bg_labels,
+            no_audio=no_audio,
+            **kwargs,
+        )
+        return recipes
 
     def generate_by_label_occurence(
         self,
@@ -251,12 +415,18 @@ class SoundscapesGenerator:
         pitch_shift=None,
         time_stretch=None,
         bg_labels=None,
+        shard_index=0,
+        num_shards=1,
+        resume=False,
+        verify_checksums=False,
+        no_audio=False,
         **kwargs,
     ):
         """ Generate landscapes by taking into account the probabilities of labels and their co-occurence
         Args:
             label_occurences: dict, parameters of labels occurences (foreground labels)
-            number: int, the number of files to generate
+            number: int, the number of files to generate (number * "proba" files for each label,
+                the probabilities are normalized to sum to 1)
             out_folder: str, the path of the folder where to save the generated files
             min_events: int, optional, the minimum number of events per files (default=0)
                 (Be careful, if max_events in label_occurences params is less than this it will raise an error)
@@ -270,8 +440,23 @@ class SoundscapesGenerator:
             time_stretch: tuple, tuple accepted by Scaper().add_event()
             bg_labels: list, if None choose in all available files. If a name is given it has to match the name
                 of a folder in 'background'. example: ["sins"]
+            shard_index: int, the index of the shard to generate, in [0, num_shards).
+            num_shards: int, number of shards the dataset is split in. Only the clips whose position
+                modulo num_shards equals shard_index are generated. Generating all the shards (on different
+                machines, with the same random_state) gives the same files as num_shards=1.
+            resume: bool, whether to skip the clips already generated in out_folder. A clip is generated
+                when all its files are written, and is then added to out_folder/generation_manifest.tsv.
+                Clips missing from the manifest (never generated or interrupted) are generated again, and
+                the temporary files left by the interrupted clips are removed. The random_state and the
+                parameters have to be the same as the interrupted generation (checked with the manifest).
+            verify_checksums: bool, when resuming, whether to check the md5 checksum of the files of the generated
+                clips (reads all of them), otherwise only their size is checked.
+            no_audio: bool, planning mode: only write the JAMS (and txt) files, without rendering any audio.
+                The audio of the planned clips is rendered later with generate_files_from_jams.
             kwargs: parametes accepted by Scaper().generate()
         Returns:
+            pd.DataFrame, the recipes of the clips (see desed.recipes.sample_occurence_recipes), sampled for the
+            whole dataset before rendering the clips of the shard.
 
         Examples:
             An example of a JSON looks like this:
@@ -305,97 +490,456 @@ class SoundscapesGenerator:
               }
             }
         """
+        _check_shard(shard_index, num_shards)
         create_folder(out_folder)
-        cnt = 0
-        for label in label_occurences.keys():
+        root_seed = self._root_seed()
+        manifest = GenerationManifest(out_folder)
+        manifest.check_config(
+            self._generation_config(
+                "generate_by_label_occurence",
+                root_seed,
+                label_occurences=label_occurences,
+                number=number,
+                min_events=min_events,
+                max_events=max_events,
+                snr=snr,
+                start_from=start_from,
+                save_isolated_events=save_isolated_events,
+                pitch_shift=pitch_shift,
+                time_stretch=time_stretch,
+                bg_labels=bg_labels,
+                no_audio=no_audio,
+                **kwargs,
+            ),
+            resume,
+        )
+        recipes = sample_occurence_recipes(
+            label_occurences,
+            number,
+            min_events=min_events,
+            max_events=max_events,
+            snr=snr,
+            random_state=_recipes_random_state(root_seed),
+            start_from=start_from,
+        )
+        self._generate_recipes(
+            recipes,
+            out_folder,
+            root_seed,
+            manifest,
+            shard_index=shard_index,
+            num_shards=num_shards,
+            resume=resume,
+            verify_checksums=verify_checksums,
+            save_isolated_events=save_isolated_events,
+            pitch_shift=pitch_shift,
+            time_stretch=time_stretch,
+            bg_labels=bg_labels,
+            no_audio=no_audio,
+            **kwargs,
+        )
+        return recipes
+
+    def _generate_recipes(
+        self,
+        recipes,
+        out_folder,
+        root_seed,
+        manifest,
+        shard_index=0,
+        num_shards=1,
+        resume=False,
+        verify_checksums=False,
+        **kwargs,
+    ):
+        """ Render the clips of recipes (see desed.recipes) belonging to a shard.
+        Args:
+            recipes: pd.DataFrame, the recipes of the clips.
+            out_folder: str, the path of the folder where to save the generated files
+            root_seed: int, the seed of the dataset (see _clip_random_state).
+            manifest: GenerationManifest, the manifest of out_folder.
+            shard_index: int, the index of the shard to generate, in [0, num_shards).
+            num_shards: int, number of shards the dataset is split in.
+            resume: bool, whether to skip the clips already in the manifest.
+            verify_checksums: bool, whether to check the md5 checksum of the clips in the manifest.
+            kwargs: arguments accepted by Soundscape.generate_from_recipe
+        """
+        soundscape = Soundscape(**self._soundscape_params())
+        number = len(recipes)
+        todo = [
+            cnt % num_shards == shard_index
+            and not (resume and manifest.is_complete(index, verify_checksums))
+            for cnt, index in enumerate(recipes["index"])
+        ]
+        if resume:
+            manifest.remove_tmp_files(
+                [_clip_filename(index) for index, do in zip(recipes["index"], todo) if do]
+            )
+        for cnt, (index, classes, snrs) in enumerate(
+            zip(recipes["index"], recipes["classes"], recipes["snrs"])
+        ):
+            if not todo[cnt]:
+                continue
             self.logger.debug(
                 "Generating soundscape: {:d}/{:d}".format(cnt + 1, number)
             )
-            label_params = label_occurences[label]
-            for i in range(round(number * label_params["proba"])):
-                sc = Soundscape(
-                    self.duration,
-                    self.fg_folder,
-                    self.bg_folder,
-                    self.ref_db,
-                    self.samplerate,
-                    random_state=self.random_state,
-                    delete_if_exists=self.delete_if_exists,
-                )
-                if start_from + cnt < 10:
-                    filename = "0" + str(start_from + cnt)
-                else:
-                    filename = str(start_from + cnt)
-
-                sc.generate_co_occurence(
-                    co_occur_params=label_params["co-occurences"],
-                    label=label,
-                    out_folder=out_folder,
-                    filename=filename,
-                    min_events=min_events,
-                    max_events=max_events,
-                    save_isolated_events=save_isolated_events,
-                    snr=snr,
-                    pitch_shift=pitch_shift,
-                    time_stretch=time_stretch,
-                    bg_labels=bg_labels,
-                    **kwargs,
-                )
-                if cnt % 200 == 0:
-                    self.logger.info(
-                        f"generating {cnt} / {number} files (updated every 200)"
-                    )
-                cnt += 1
-        if cnt != number:
-            self.logger.warn(
-                f"The number of generated examples ({cnt}) is different from the number asked ({number}) "
-                f"because of probabilities of events."
+            soundscape.reset(_clip_random_state(root_seed, index)).generate_from_recipe(
+                classes, snrs, out_folder, _clip_filename(index), **kwargs
             )
+            manifest.append(clip_record(out_folder, index, _clip_filename(index)))
+            if cnt % 200 == 0:
+                self.logger.info(
+                    f"generating {cnt} / {number} files (updated every 200)"
+                )
+
 
+_worker_soundscape = None
+
+
+def _init_worker_soundscape(soundscape_params):
+    """ Initializer of the Pool processes, creating the Soundscape reused by all the clips of a process """
+    global _worker_soundscape
+    _worker_soundscape = Soundscape(**soundscape_params)
+
+
+def _generate_one_bg_multi_fg(
+    clip, min_events, max_events, out_folder, soundscape=None, **kwargs
+):
+    """ Generate a single clip of SoundscapesGenerator.generate (defined at module level to be used by a Pool).
+    Args:
+        clip: tuple, (root_seed, index) the seed of the dataset and the index of the clip (see _clip_random_state).
+        min_events: int, the minimum number of foreground events to add (pick at random uniformly).
+        max_events: int, the maximum number of foreground events to add (pick at random uniformly).
+        out_folder: str, path to extract generate file
+        soundscape: Soundscape, the Soundscape reset to generate the clip, default to the one of the Pool process.
+        kwargs: arguments accepted by Soundscape.generate_one_bg_multi_fg
+    Returns:
+        dict, the record of the generated clip in the manifest (see clip_record)
+    """
+    root_seed, index = clip
+    random_state = _clip_random_state(root_seed, index)
+    n_events = random_state.randint(min_events, max_events + 1)
+
+    if soundscape is None:
+        soundscape = _worker_soundscape
+    sc = soundscape.reset(random_state)
+    sc.generate_one_bg_multi_fg(
+        out_folder=out_folder,
+        filename=_clip_filename(index),
+        n_fg_events=n_events,
+        **kwargs,
+    )
+    return clip_record(out_folder, index, _clip_filename(index))
 
-def generate_df_from_jams(list_jams, post_process=True, background_label=False):
+
+def _clip_filename(index):
+    """ Name of a generated clip (without extension) given its index """
+    if index < 10:
+        return "0" + str(index)
+    return str(index)
+
+
+def _check_shard(shard_index, num_shards):
+    if not 0 <= shard_index < num_shards:
+        raise DesedError(
+            f"shard_index has to be in [0, num_shards), got shard_index={shard_index}, num_shards={num_shards}"
+        )
+
+
+def generate_df_from_jams(
+    list_jams,
+    post_process=True,
+    background_label=False,
+    n_jobs=1,
+    chunk_size=10,
+    cache_path=None,
+):
+    """ Get the labels of JAMS files in a single DataFrame.
+    Args:
+        list_jams: list, list of paths of JAMS files. Assume WAV files have the same name as JAMS files.
+        post_process: bool, post_process removes small blanks, clean the overlapping same events in the labels and
+            make the smallest event 250ms long.
+        background_label: bool, include the background label in the annotations.
+        n_jobs: int, number of processes reading the JAMS files in parallel.
+        chunk_size: int, number of JAMS files sent at once to a process (only used when n_jobs > 1).
+        cache_path: str, optional, path of a JSON file in which the labels of each JAMS file are saved. If the file
+            exists, only the JAMS files which are new or have been modified (mtime or size changed) since the cache
+            was saved are read.
+    Returns:
+        pd.DataFrame, columns: filename, onset, offset, event_label. Sorted by filename and onset
+        (the events having the same filename and onset keep the order of the JAMS, whatever n_jobs).
+    """
     if len(list_jams) == 0:
         raise IndexError(
             "Cannot generate df from JAMS, the list of jams given is empty"
         )
 
-    final_df = pd.DataFrame()
-    for jam_file in list_jams:
-        fbase = osp.basename(jam_file)
-        df, length = get_labels_from_jams(
-            jam_file, background_label=background_label, return_length=True
+    labels_from_jams = functools.partial(
+        _labels_rows_from_jams, post_process=post_process, background_label=background_label
+    )
+    if cache_path is None:
+        list_rows = _map_labels_rows(labels_from_jams, list_jams, n_jobs, chunk_size)
+    else:
+        settings = {"post_process": post_process, "background_label": background_label}
+        list_rows = _cached_labels_rows(
+            labels_from_jams, list_jams, cache_path, settings, n_jobs, chunk_size
         )
+    rows = [row for file_rows in list_rows for row in file_rows]
 
-        if post_process:
-            df, _ = _post_process_labels_file(df, length)
+    final_df = pd.DataFrame(rows, columns=["filename", "onset", "offset", "event_label"])
+    final_df = final_df.sort_values(by=["filename", "onset"], kind="mergesort")
+    return final_df
 
-        df["filename"] = f"{osp.splitext(fbase)[0]}.wav"
-        final_df = pd.concat([final_df, df[["filename", "onset", "offset", "event_label"]]], ignore_index=True
-        )
 
-    final_df = final_df.sort_values(by=["filename", "onset"])
-    return final_df
+def _map_labels_rows(labels_from_jams, list_jams, n_jobs=1, chunk_size=10):
+    """ Labels rows of each JAMS file, in the order of list_jams (see generate_df_from_jams). """
+    if n_jobs == 1 or len(list_jams) == 0:
+        return list(map(labels_from_jams, list_jams))
+    # imap (ordered) keeps the order of list_jams
+    with closing(Pool(n_jobs)) as p:
+        return list(p.imap(labels_from_jams, list_jams, chunk_size))
+
+
+def _cached_labels_rows(
+    labels_from_jams, list_jams, cache_path, settings, n_jobs=1, chunk_size=10
+):
+    """ Labels rows of each JAMS file, read from the cache if the file did not change (see generate_df_from_jams).
+    Args:
+        labels_from_jams: function, returns the labels rows of a JAMS file.
+        list_jams: list, list of paths of JAMS files.
+        cache_path: str, path of the JSON cache.
+        settings: dict, the parameters of labels_from_jams, the cache is not used if they changed.
+        n_jobs: int, number of processes reading the JAMS files in parallel.
+        chunk_size: int, number of JAMS files sent at once to a process (only used when n_jobs > 1).
+    Returns:
+        list, the labels rows of each JAMS file.
+    """
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+    # {abspath: [mtime_ns, size, rows]}
+    cached = {}
+    if osp.exists(cache_path):
+        with open(cache_path) as f:
+            saved = json.load(f)
+        if saved.get("settings") == settings:
+            cached = saved["files"]
+        else:
+            logger.info(f"Settings changed since {cache_path} was saved, not used")
+
+    keys = [osp.abspath(jam_file) for jam_file in list_jams]
+    stats = [os.stat(jam_file) for jam_file in list_jams]
+    to_read = [
+        cnt
+        for cnt, (key, stat) in enumerate(zip(keys, stats))
+        if key not in cached
+        or cached[key][0] != stat.st_mtime_ns
+        or cached[key][1] != stat.st_size
+    ]
+    logger.info(
+        f"Reading {len(to_read)} new or modified JAMS files over {len(list_jams)}"
+    )
+    list_rows = _map_labels_rows(
+        labels_from_jams, [list_jams[cnt] for cnt in to_read], n_jobs, chunk_size
+    )
+    for cnt, file_rows in zip(to_read, list_rows):
+        cached[keys[cnt]] = [stats[cnt].st_mtime_ns, stats[cnt].st_size, file_rows]
+
+    # Only the files of list_jams are kept in the cache
+    files = {key: cached[key] for key in keys}
+    if len(to_read) > 0 or len(files) != len(cached):
+        create_folder(osp.dirname(cache_path))
+        tmp_path = _tmp_path(cache_path)
+        with open(tmp_path, "w") as f:
+            json.dump({"settings": settings, "files": files}, f)
+        os.replace(tmp_path, cache_path)
+    return [files[key][2] for key in keys]
+
+
+def _labels_rows_from_jams(jam_file, post_process=True, background_label=False):
+    """ Labels of a JAMS file (see generate_df_from_jams).
+    Returns:
+        list, the rows [filename, onset, offset, event_label] of the file.
+    """
+    df, length = get_labels_from_jams(
+        jam_file, background_label=background_label, return_length=True
+    )
+    if post_process:
+        df, _ = _post_process_labels_file(df, length)
+
+    filename = f"{osp.splitext(osp.basename(jam_file))[0]}.wav"
+    return [
+        [filename, onset, offset, event_label]
+        for onset, offset, event_label in zip(
+            df["onset"], df["offset"], df["event_label"]
+        )
+    ]
 
 
 def generate_tsv_from_jams(
-    list_jams, tsv_out, post_process=True, background_label=False
+    list_jams,
+    tsv_out,
+    post_process=True,
+    background_label=False,
+    n_jobs=1,
+    cache_path=None,
+    chunk_rows=None,
+    assume_sorted=False,
 ):
     """ In scaper.generate they create a txt file for each audio file.
     Using the same idea, we create a single tsv file with all the audio files and their labels.
     Args:
         list_jams: list, list of paths of JAMS files. Assume WAV files have the same name as JAMS files.
+            Can be an iterator if chunk_rows or assume_sorted is defined.
         tsv_out: str, path of the tsv to be saved
         post_process: bool, post_process removes small blanks, clean the overlapping same events in the labels and
         make the smallest event 250ms long.
         background_label: bool, include the background label in the annotations.
+        n_jobs: int, number of processes reading the JAMS files in parallel.
+        cache_path: str, optional, path of the JSON cache of the labels of each JAMS file, only the new or modified
+            JAMS files are read (see generate_df_from_jams). Not used when streaming.
+        chunk_rows: int, optional, if defined, the tsv is written by streaming: runs of about chunk_rows rows are
+            sorted and written in temporary files, then merged, so at most chunk_rows rows are kept in memory.
+        assume_sorted: bool, if True, the JAMS files are given sorted by name, and their rows are written to the tsv
+            as soon as they are read (no sort, nor temporary files).
         # source_sep_path: str, the path to save the csv of separated source files. Assume
 
     Returns:
         None
     """
     create_folder(osp.dirname(tsv_out))
-    final_df = generate_df_from_jams(list_jams, post_process, background_label)
-    final_df.to_csv(tsv_out, sep="\t", index=False, float_format="%.3f")
+    if chunk_rows is None and not assume_sorted:
+        final_df = generate_df_from_jams(
+            list_jams,
+            post_process,
+            background_label,
+            n_jobs=n_jobs,
+            cache_path=cache_path,
+        )
+        final_df.to_csv(tsv_out, sep="\t", index=False, float_format="%.3f")
+    else:
+        if cache_path is not None:
+            raise DesedError("cache_path cannot be used with chunk_rows or assume_sorted")
+        labels_from_jams = functools.partial(
+            _labels_rows_from_jams,
+            post_process=post_process,
+            background_label=background_label,
+        )
+        _stream_tsv_from_jams(
+            list_jams, tsv_out, labels_from_jams, chunk_rows, assume_sorted, n_jobs
+        )
+
+
+def _stream_tsv_from_jams(
+    list_jams, tsv_out, labels_from_jams, chunk_rows, assume_sorted, n_jobs=1
+):
+    """ Write the labels of JAMS files in a tsv, with at most about chunk_rows rows in memory
+    (see generate_tsv_from_jams). The rows are sorted like generate_df_from_jams: by filename and onset, then in
+    the order of list_jams and of the rows of a file.
+    Args:
+        list_jams: iterable, paths of JAMS files.
+        tsv_out: str, path of the tsv to be saved.
+        labels_from_jams: function, returns the labels rows of a JAMS file.
+        chunk_rows: int, the number of rows of a sorted run.
+        assume_sorted: bool, whether list_jams is sorted by name (the rows are then written directly).
+        n_jobs: int, number of processes reading the JAMS files in parallel.
+    Returns:
+        None
+    """
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+    tmp_out = _tmp_path(tsv_out)
+    runs_dir = tempfile.mkdtemp(prefix=".runs_", dir=osp.dirname(osp.abspath(tsv_out)))
+    try:
+        runs = []
+        # (filename, onset, index of the JAMS, index of the row, row)
+        run = []
+        last_filename = None
+        with open(tmp_out, "w") as f:
+            f.write("filename\tonset\toffset\tevent_label\n")
+            for index, file_rows in enumerate(
+                _imap_labels_rows(labels_from_jams, list_jams, n_jobs)
+            ):
+                if len(file_rows) == 0:
+                    continue
+                if assume_sorted:
+                    # The rows of a file are sorted by onset, a filename must not be repeated
+                    filename = file_rows[0][0]
+                    if last_filename is not None and filename <= last_filename:
+                        raise DesedError(
+                            f"assume_sorted but the JAMS files are not sorted or repeated: "
+                            f"{filename} after {last_filename}"
+                        )
+                    last_filename = filename
+                    f.writelines(_format_labels_row(row) for row in file_rows)
+                    continue
+                run.extend(
+                    (row[0], row[1], index, cnt, row) for cnt, row in enumerate(file_rows)
+                )
+                if len(run) >= chunk_rows:
+                    runs.append(_write_run(run, runs_dir, len(runs)))
+                    run = []
+
+            if len(runs) == 0:
+                run.sort(key=lambda x: x[:4])
+                f.writelines(_format_labels_row(x[4]) for x in run)
+            else:
+                if len(run) > 0:
+                    runs.append(_write_run(run, runs_dir, len(runs)))
+                logger.debug(f"Merging {len(runs)} sorted runs")
+                run_files = [open(run_path) for run_path in runs]
+                try:
+                    merged = heapq.merge(
+                        *[_read_run(run_file) for run_file in run_files],
+                        key=lambda x: x[:4],
+                    )
+                    f.writelines(x[4] for x in merged)
+                finally:
+                    for run_file in run_files:
+                        run_file.close()
+        os.replace(tmp_out, tsv_out)
+    finally:
+        shutil.rmtree(runs_dir)
+        if osp.exists(tmp_out):
+            os.remove(tmp_out)
+
+
+def _imap_labels_rows(labels_from_jams, list_jams, n_jobs=1, chunk_size=10):
+    """ Lazily read the labels rows of each JAMS file of an iterable, in order """
+    if n_jobs == 1:
+        yield from map(labels_from_jams, list_jams)
+    else:
+        # Batches of JAMS files, the pool would otherwise consume the whole iterable at once
+        jams_iter = iter(list_jams)
+        with closing(Pool(n_jobs)) as p:
+            batch = list(itertools.islice(jams_iter, n_jobs * chunk_size * 4))
+            while len(batch) > 0:
+                yield from p.imap(labels_from_jams, batch, chunk_size)
+                batch = list(itertools.islice(jams_iter, n_jobs * chunk_size * 4))
+
+
+def _format_labels_row(row):
+    """ Line of the tsv of a labels row [filename, onset, offset, event_label] """
+    filename, onset, offset, event_label = row
+    return f"{filename}\t{onset:.3f}\t{offset:.3f}\t{event_label}\n"
+
+
+def _write_run(run, runs_dir, run_index):
+    """ Write a run of labels rows sorted by filename, onset, JAMS index and row index. Each line is the tsv line
+    prefixed by the JAMS index, the row index and the exact onset (to merge the runs).
+    """
+    run_path = osp.join(runs_dir, f"run_{run_index}.tsv")
+    run.sort(key=lambda x: x[:4])
+    with open(run_path, "w") as f:
+        f.writelines(
+            f"{index}\t{cnt}\t{onset!r}\t{_format_labels_row(row)}"
+            for _, onset, index, cnt, row in run
+        )
+    return run_path
+
+
+def _read_run(run_file):
+    """ (filename, onset, JAMS index, row index, tsv line) of the lines of a run written by _write_run """
+    for line in run_file:
+        index, cnt, onset, row = line.split("\t", 3)
+        yield row.split("\t", 1)[0], float(onset), int(index), int(cnt), row
 
 
 def generate_files_from_jams(
@@ -406,9 +950,15 @@ def generate_files_from_jams(
     out_folder_jams=None,
     save_isolated_events=False,
     overwrite_exist_audio=False,
+    audio_cache=None,
+    n_jobs=1,
+    chunk_size=1,
+    backend="scaper",
+    transform_cache=None,
     **kwargs,
 ):
-    """ Generate audio files from jams files generated by Scaper
+    """ Generate audio files from jams files generated by Scaper.
+    It is the rendering stage of a dataset planned with SoundscapesGenerator (no_audio=True).
 
     Args:
         list_jams: list, list of jams filepath generated by Scaper.
@@ -419,33 +969,109 @@ def generate_files_from_jams(
             if None, jams not saved
         save_isolated_events: bool, whether or not to save isolated events in a separate folder
         overwrite_exist_audio: bool, whether to regenerate existing audio files or not
+        audio_cache: AudioCache, optional, cache of decoded audio from which the source files are read.
+        n_jobs: int, number of processes rendering the files in parallel.
+        chunk_size: int, number of files sent at once to a process (only used when n_jobs > 1).
+        backend: str, "scaper" to render the files with scaper.generate_from_jams, or "numpy" to mix them
+            in memory with desed.mixing.generate_from_jams (no reverb, pitch shifting and time stretching).
+        transform_cache: TransformCache, optional, only with backend="numpy", the pitch shifts and time stretches
+            are quantized and the transformed source files read from this cache (pitch shifting and time stretching
+            are then supported by the numpy backend).
         kwargs: dict, scaper.generate_from_jams params (fg_path, bg_path, ...)
     Returns: None
 
     """
     logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+    check_backend(backend)
+    if transform_cache is not None and backend != "numpy":
+        raise DesedError("transform_cache is only supported with backend='numpy'")
     logger.info(f"generating audio files to {out_folder}")
     create_folder(out_folder)
-    for n, jam_file in enumerate(list_jams):
-        logger.debug(jam_file)
-        audiofile = osp.join(
-            out_folder, f"{osp.splitext(osp.basename(jam_file))[0]}.wav"
-        )
-        if not osp.exists(audiofile) or overwrite_exist_audio:
-            if out_folder_jams is not None:
-                jams_outfile = osp.join(out_folder_jams, osp.basename(jam_file))
+    if out_folder_jams is not None:
+        create_folder(out_folder_jams)
+    generate_file = functools.partial(
+        _generate_file_from_jams,
+        out_folder=out_folder,
+        fg_path=fg_path,
+        bg_path=bg_path,
+        out_folder_jams=out_folder_jams,
+        save_isolated_events=save_isolated_events,
+        overwrite_exist_audio=overwrite_exist_audio,
+        audio_cache=audio_cache,
+        backend=backend,
+        transform_cache=transform_cache,
+        **kwargs,
+    )
+    if n_jobs == 1:
+        results = map(generate_file, list_jams)
+        for n, _ in enumerate(results):
+            if n % 200 == 0:
+                logger.info(
+                    f"generating {n} / {len(list_jams)} files (updated every 200)"
+                )
+    else:
+        with closing(Pool(n_jobs)) as p:
+            for n, _ in enumerate(
+                p.imap_unordered(generate_file, list_jams, chunk_size)
+            ):
+                if n % 200 == 0:
+                    logger.info(
+                        f"generating {n} / {len(list_jams)} files (updated every 200)"
+                    )
+    logger.info("Done")
+
+
+def _generate_file_from_jams(
+    jam_file,
+    out_folder,
+    out_folder_jams=None,
+    save_isolated_events=False,
+    overwrite_exist_audio=False,
+    audio_cache=None,
+    backend="scaper",
+    transform_cache=None,
+    **kwargs,
+):
+    """ Generate the audio file of a single JAMS (see generate_files_from_jams).
+    The audio is written in a temporary file renamed when complete, so an existing audio file is never partial.
+
+    Returns:
+        str, the path of the audio file.
+    """
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+    logger.debug(jam_file)
+    name = osp.splitext(osp.basename(jam_file))[0]
+    audiofile = osp.join(out_folder, f"{name}.wav")
+    if not osp.exists(audiofile) or overwrite_exist_audio:
+        if save_isolated_events and kwargs.get("isolated_events_path") is None:
+            kwargs["isolated_events_path"] = osp.join(out_folder, f"{name}_events")
+        tmp_audiofile = _tmp_path(audiofile)
+        try:
+            if backend == "numpy":
+                _, soundscape_jam, _, _ = mixing.generate_from_jams(
+                    jam_file,
+                    tmp_audiofile,
+                    save_isolated_events=save_isolated_events,
+                    audio_cache=audio_cache,
+                    transform_cache=transform_cache,
+                    **kwargs,
+                )
             else:
-                jams_outfile = None
-            generate_from_jams(
-                jam_file,
-                audiofile,
-                fg_path=fg_path,
-                bg_path=bg_path,
-                jams_outfile=jams_outfile,
-                save_isolated_events=save_isolated_events,
-                **kwargs,
-            )
+                with scaper_audio_cache(audio_cache):
+                    _, soundscape_jam, _, _ = generate_from_jams(
+                        jam_file,
+                        tmp_audiofile,
+                        save_isolated_events=save_isolated_events,
+                        **kwargs,
+                    )
+            os.replace(tmp_audiofile, audiofile)
+        except BaseException:
+            if osp.exists(tmp_audiofile):
+                os.remove(tmp_audiofile)
+            raise
 
-        if n % 200 == 0:
-            logger.info(f"generating {n} / {len(list_jams)} files (updated every 200)")
-    logger.info("Done")
+        if out_folder_jams is not None:
+            ann = soundscape_jam.annotations.search(namespace="scaper")[0]
+            ann.sandbox.scaper.soundscape_audio_path = audiofile
+            soundscape_jam.save(osp.join(out_folder_jams, osp.basename(jam_file)))
+    return audiofile
@@ -64,5 +64,5 @@ class DownloadDesedError(DesedError):
 
     def __init__(self, msg, exc_info=None):
         """ exc_info, if given, is the original exception that caused the trouble (as returned by sys.exc_info()). """
-        super(DownloadError, self).__init__(msg)
+        super(DownloadDesedError, self).__init__(msg)
         self.exc_info = exc_info
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""Manifest of the clips generated in a folder, used to resume an interrupted generation"""
+import json
+import os
+from os import path as osp
+
+from .logger import DesedError
+from .utils import file_md5
+
+MANIFEST_FILENAME = "generation_manifest.tsv"
+CONFIG_PREFIX = "#config\t"
+
+
+def clip_record(out_folder, index, filename, extensions=(".wav", ".jams", ".txt")):
+    """ Record of a generated clip: the size and md5 checksum of each of its files.
+    Args:
+        out_folder: str, the folder containing the files of the clip.
+        index: int, the index of the clip.
+        filename: str, the name of the clip files (without extension).
+        extensions: tuple, extensions of the files of the clip (missing files are ignored).
+    Returns:
+        dict, {"index": int, "filename": str, "files": {extension: (size, md5)}}
+    """
+    files = {}
+    for ext in extensions:
+        fpath = osp.join(out_folder, filename + ext)
+        if osp.isfile(fpath):
+            files[ext] = (osp.getsize(fpath), file_md5(fpath))
+    return {"index": index, "filename": filename, "files": files}
+
+
+class GenerationManifest:
+    """ Append-only list of the clips completely generated in a folder, with the size and md5 checksum of their files.
+    A line is appended once all the files of a clip are written, so a clip missing from the manifest, or whose
+    files are missing or do not have the recorded size (and md5 checksum if verified), has to be generated again.
+    The first line of the manifest is the configuration of the generation (seed and parameters, see check_config).
+
+    Args:
+        out_folder: str, the folder of the generated clips (the manifest is saved in it).
+    """
+
+    def __init__(self, out_folder):
+        self.out_folder = out_folder
+        self.path = osp.join(out_folder, MANIFEST_FILENAME)
+        self.config = None
+        self.records = {}
+        if osp.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    if line.startswith(CONFIG_PREFIX):
+                        self.config = json.loads(line[len(CONFIG_PREFIX) :])
+                        continue
+                    record = self._parse_line(line)
+                    if record is not None:
+                        self.records[record["index"]] = record
+
+    @staticmethod
+    def _parse_line(line):
+        # An interrupted write can leave a truncated last line, it is ignored.
+        if not line.endswith("\n"):
+            return None
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) != 3 or not fields[0].isdigit():
+            return None
+        files = {}
+        for file_field in fields[2].split(","):
+            if file_field:
+                ext, size, md5 = file_field.split(":")
+                files[ext] = (int(size), md5)
+        return {"index": int(fields[0]), "filename": fields[1], "files": files}
+
+    def check_config(self, config, resume=False):
+        """ Compare the configuration of a generation to the one of the clips in the manifest.
+        If the configurations differ, resuming is refused (the clips would come from the old configuration),
+        otherwise the manifest is started over.
+        Args:
+            config: dict, the configuration of the generation (JSON serializable, other values are saved as str),
+                example: {"root_seed": 12, "duration": 10, ...}
+            resume: bool, whether the generation resumes from the manifest.
+        Returns:
+            None
+        """
+        config = json.loads(json.dumps(config, default=str))
+        if config == self.config:
+            return
+        if resume and len(self.records) > 0:
+            raise DesedError(
+                f"Cannot resume the generation in {self.out_folder}: its clips were generated with another "
+                f"configuration (seed or parameters).\nManifest: {self.config}\nGeneration: {config}"
+            )
+        self.config = config
+        self.records = {}
+        with open(self.path, "w") as f:
+            f.write(f"{CONFIG_PREFIX}{json.dumps(config)}\n")
+            f.write("index\tfilename\tfiles\n")
+
+    def is_complete(self, index, verify_checksums=False):
+        """ Whether a clip has been completely generated (its files exist and have the recorded size, and md5).
+        Args:
+            index: int, the index of the clip.
+            verify_checksums: bool, whether to also compare the md5 checksum of the files (reads all the files).
+        Returns:
+            bool
+        """
+        record = self.records.get(index)
+        if record is None:
+            return False
+        for ext, (size, md5) in record["files"].items():
+            fpath = osp.join(self.out_folder, record["filename"] + ext)
+            if not osp.isfile(fpath) or osp.getsize(fpath) != size:
+                return False
+            if verify_checksums and file_md5(fpath) != md5:
+                return False
+        return True
+
+    def remove_tmp_files(self, filenames):
+        """ Remove the temporary files left in the folder by an interrupted generation of clips
+        (".<filename>.tmp<ext>", see soundscape._tmp_path). Only the files of the given clips are removed, other
+        clips can be generating in the same folder (other shards).
+        Args:
+            filenames: list, the names of the clips (without extension).
+        Returns:
+            int, the number of files removed.
+        """
+        filenames = set(filenames)
+        n_removed = 0
+        for entry in os.scandir(self.out_folder):
+            if not entry.name.startswith(".") or ".tmp" not in entry.name:
+                continue
+            if entry.name[1:].rsplit(".tmp", 1)[0] in filenames and entry.is_file():
+                os.remove(entry.path)
+                n_removed += 1
+        return n_removed
+
+    def append(self, record):
+        """ Add a generated clip to the manifest (see clip_record). """
+        files = ",".join(
+            f"{ext}:{size}:{md5}" for ext, (size, md5) in record["files"].items()
+        )
+        write_header = not osp.exists(self.path)
+        with open(self.path, "a") as f:
+            if write_header:
+                f.write("index\tfilename\tfiles\n")
+            f.write(f"{record['index']}\t{record['filename']}\t{files}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.records[record["index"]] = record
@@ -1,16 +1,18 @@
 """Post processing of desed synthetic generation of soundscapes"""
+import functools
 import glob
 import inspect
 import os
 import shutil
+from contextlib import closing
+from multiprocessing import Pool
 from os import path as osp
 
-import jams
 import numpy as np
 import pandas as pd
 import soundfile as sf
 from .logger import create_logger
-from .utils import create_folder
+from .utils import create_folder, read_scaper_jams
 
 
 def save_tsv(df, filepath):
@@ -20,7 +22,13 @@ def save_tsv(df, filepath):
 
 
 def rm_high_polyphony(
-    folder, max_polyphony=3, save_tsv_associated=None, pattern_sources="_events"
+    folder,
+    max_polyphony=3,
+    save_tsv_associated=None,
+    pattern_sources="_events",
+    n_jobs=1,
+    chunk_size=10,
+    dry_run=False,
 ):
     """ Remove the files having a too high polyphony in the deignated folder
 
@@ -30,42 +38,94 @@ def rm_high_polyphony(
         save_tsv_associated: str, optional, the path to generate the tsv files of associated sounds.
         pattern_sources: str, optional, the pattern that is added to the source to get isolated events
             (to be able to delete them if needed)
+        n_jobs: int, optional, the number of processes used to read the JAMS files.
+        chunk_size: int, optional, the number of JAMS files sent at once to a process (if n_jobs > 1).
+        dry_run: bool, optional, if True, nothing is deleted nor saved, only the histogram is computed.
     Returns:
-        None
+        pd.Series, the histogram of the polyphony of the files (number of files indexed by polyphony).
 
     """
     logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
-    # Select training
-    i = 0
-    df = pd.DataFrame(columns=["scaper", "bg", "fg"])
-    fnames_to_rmv = []
-    for jam_file in sorted(glob.glob(osp.join(folder, "*.jams"))):
-        param = jams.load(jam_file)
-        ann = param.annotations.search(namespace="scaper")[0]
-        if ann["sandbox"]["scaper"]["polyphony_max"] <= max_polyphony:
-            fg = [osp.basename(line.value["source_file"]) for line in ann.data]
-            bg = osp.basename(ann.data[0].value["source_file"])
-            fname = osp.basename(jam_file)
-            df_tmp = pd.DataFrame(
-                np.array([[fname, bg, ",".join(fg)]]), columns=["scaper", "bg", "fg"]
-            )
-            df = pd.concat([df, df_tmp], ignore_index=True)
-            i += 1
-        else:
-            fnames_to_rmv.append(jam_file)
+    list_jams = sorted(glob.glob(osp.join(folder, "*.jams")))
+    if n_jobs == 1:
+        results = list(map(_scan_polyphony, list_jams))
+    else:
+        with closing(Pool(n_jobs)) as p:
+            results = list(p.imap(_scan_polyphony, list_jams, chunk_size))
+
+    df = pd.DataFrame(results, columns=["scaper", "bg", "fg", "polyphony"])
+    histogram = df["polyphony"].value_counts().sort_index()
+    too_high = (df["polyphony"] > max_polyphony).to_numpy()
+    logger.info(f"Polyphony of the files (polyphony: number of files):\n{histogram}")
+    if dry_run:
+        return histogram
+
     if save_tsv_associated is not None:
-        df.to_csv(save_tsv_associated, sep="\t", index=False)
+        df.loc[~too_high, ["scaper", "bg", "fg"]].to_csv(
+            save_tsv_associated, sep="\t", index=False
+        )
 
     logger.warning(
-        f"{i} files with less than {max_polyphony} overlapping events. Delting others..."
+        f"{(~too_high).sum()} files with less than {max_polyphony} overlapping events. Delting others..."
     )
-    for fname in fnames_to_rmv:
-        names = glob.glob(osp.splitext(fname)[0] + ".*")
-        for file in names:
-            os.remove(file)
-        dirs_sources = glob.glob(osp.splitext(fname)[0] + pattern_sources)
-        for dir_path in dirs_sources:
-            shutil.rmtree(dir_path)
+    # The folder is listed once, the files of a JAMS are its name with any extension
+    stems_to_rmv = {osp.splitext(fname)[0] for fname in df.loc[too_high, "scaper"]}
+    for name in os.listdir(folder):
+        if _matching_stem(name, stems_to_rmv, pattern_sources):
+            path = osp.join(folder, name)
+            if osp.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    return histogram
+
+
+def _scan_polyphony(jam_file):
+    """ Sources and polyphony of a JAMS file of rm_high_polyphony.
+    Args:
+        jam_file: str, path of the JAMS file generated by scaper.
+    Returns:
+        tuple, (name of the JAMS, background source, comma separated sources, polyphony)
+    """
+    scaper_jams = read_scaper_jams(jam_file)
+    polyphony = scaper_jams.polyphony_max
+    if polyphony is None:
+        fg = scaper_jams.role == "foreground"
+        polyphony = _max_polyphony(
+            scaper_jams.time[fg], scaper_jams.time[fg] + scaper_jams.duration[fg]
+        )
+    fg = ",".join(osp.basename(source_file) for source_file in scaper_jams.source_file)
+    bg = osp.basename(scaper_jams.source_file[0])
+    return osp.basename(jam_file), bg, fg, int(polyphony)
+
+
+def _max_polyphony(onsets, offsets):
+    """ Maximum number of events heard at the same time (an event ending when another starts does not overlap it)
+    Args:
+        onsets: np.array, the onsets of the events.
+        offsets: np.array, the offsets of the events.
+    Returns:
+        int, the maximum polyphony.
+    """
+    if len(onsets) == 0:
+        return 0
+    times = np.concatenate((onsets, offsets))
+    steps = np.concatenate((np.ones(len(onsets)), -np.ones(len(offsets))))
+    # At the same time, the offsets are counted before the onsets
+    order = np.lexsort((steps, times))
+    return int(np.cumsum(steps[order]).max())
+
+
+def _matching_stem(name, stems, pattern_sources):
+    """ Whether the file name is one of stems with an extension, or the folder of isolated events of one of stems """
+    if name.endswith(pattern_sources) and name[: -len(pattern_sources)] in stems:
+        return True
+    dot = name.find(".")
+    while dot != -1:
+        if name[:dot] in stems:
+            return True
+        dot = name.find(".", dot + 1)
+    return False
 
 
 def sanity_check(df, length_sec=None):
@@ -97,8 +157,9 @@ def get_data(file, wav_file=None, background_label=False):
 
     """
     if wav_file is not None:
-        data, sr = sf.read(wav_file)
-        length_sec = data.shape[0] / sr
+        # Only the header of the wav file is read
+        info = sf.info(wav_file)
+        length_sec = info.frames / info.samplerate
     else:
         length_sec = None
 
@@ -147,57 +208,89 @@ def _post_process_labels_file(
     fix_count = 0
     df = sanity_check(df, length_sec)
     df = df.sort_values("onset")
-    for class_name in df["event_label"].unique():
-        logger.debug(class_name)
-        i = 0
-        while i is not None:
-            indexes = df[df["event_label"] == class_name].index
-            ref_onset = df.loc[indexes[i], "onset"]
-            ref_offset = df.loc[indexes[i], "offset"]
-            if ref_offset - ref_onset < min_dur_event:
-                ref_offset = ref_onset + min_dur_event
-                # Too short event, and at the offset (onset sorted),
-                # so if it overlaps with others, they are also too short.
-                if ref_offset > length_sec:
-                    df = df.drop(indexes[i:])
-                    fix_count += len(indexes[i:])
-                    break
-                else:
-                    df.loc[indexes[i], "offset"] = ref_onset + min_dur_event
-            j = i + 1
-            while j < len(indexes):
-                if df.loc[indexes[j], "offset"] < ref_offset:
-                    df = df.drop(indexes[j])
-                    logger.debug("Merging overlapping annotations")
-                    fix_count += 1
-                elif df.loc[indexes[j], "onset"] - ref_offset < min_dur_inter:
-                    df.loc[indexes[i], "offset"] = df.loc[indexes[j], "offset"]
-                    ref_offset = df.loc[indexes[j], "offset"]
-                    df = df.drop(indexes[j])
-                    logger.debug("Merging consecutive annotation with pause" + "<150ms")
-                    fix_count += 1
-                elif (
-                    df.loc[indexes[j], "onset"] - ref_onset
-                    < min_dur_event + min_dur_inter
-                ):
-                    df.loc[indexes[i], "offset"] = df.loc[indexes[j], "offset"]
-                    ref_offset = df.loc[indexes[j], "offset"]
-                    df = df.drop(indexes[j])
-                    logger.debug(
-                        "Merging consecutive annotations" + " with onset diff<400ms"
-                    )
-                    fix_count += 1
-                else:
-                    # Quitting the loop
-                    break
-                j += 1
-            i += 1
-            if i >= len(df[df["event_label"] == class_name].index):
-                i = None
-    df = df.sort_values("onset")
+
+    onsets = df["onset"].to_numpy(dtype=float)
+    offsets = df["offset"].to_numpy(dtype=float)
+    new_offsets = offsets.copy()
+    keep = np.zeros(len(df), dtype=bool)
+    # Positions of the events of each class, in onset order
+    codes, class_names = pd.factorize(df["event_label"])
+    class_order = np.argsort(codes, kind="stable")
+    class_positions = np.split(class_order, np.cumsum(np.bincount(codes))[:-1])
+    for class_name, positions in zip(class_names, class_positions):
+        kept, class_offsets, class_fix_count = _merge_class_events(
+            onsets[positions],
+            offsets[positions],
+            length_sec,
+            min_dur_event,
+            min_dur_inter,
+        )
+        logger.debug(f"{class_name}: {class_fix_count} fixes")
+        keep[positions[kept]] = True
+        new_offsets[positions] = class_offsets
+        fix_count += class_fix_count
+
+    df["offset"] = new_offsets
+    df = df[keep].sort_values("onset")
     return df, fix_count
 
 
+def _merge_class_events(onsets, offsets, length_sec, min_dur_event, min_dur_inter):
+    """ Sweep the events of a class sorted by onset (see _post_process_labels_file). An event is:
+        * removed if it is contained in the current event.
+        * merged with the current event if there are less than min_dur_inter between them, or less than
+        min_dur_event + min_dur_inter between their onsets.
+        * the new current event otherwise, extended to last min_dur_event if needed. If it then ends after length_sec,
+        it is removed with all the next events of the class (all too short and at the end of the file).
+    Args:
+        onsets: np.array, the onsets of the events of the class, sorted.
+        offsets: np.array, the offsets of the events.
+        length_sec: float, duration of the file, None if unknown.
+        min_dur_event: float, in sec, minimum duration of an event
+        min_dur_inter: float, in sec, minimum duration between 2 events
+    Returns:
+        tuple, (positions of the kept events, np.array of the new offsets, number of fixes)
+    """
+    onsets_list = onsets.tolist()
+    offsets_list = offsets.tolist()
+    new_offsets = offsets.copy()
+    n_events = len(onsets_list)
+    kept = []
+    fix_count = 0
+    i = 0
+    while i < n_events:
+        ref_onset = onsets_list[i]
+        ref_offset = offsets_list[i]
+        if ref_offset - ref_onset < min_dur_event:
+            ref_offset = ref_onset + min_dur_event
+            # Too short event, and at the offset (onset sorted),
+            # so if it overlaps with others, they are also too short.
+            if length_sec is not None and ref_offset > length_sec:
+                fix_count += n_events - i
+                break
+            new_offsets[i] = ref_offset
+        j = i + 1
+        while j < n_events:
+            if offsets_list[j] < ref_offset:
+                # Overlapping annotation, contained in the current one
+                fix_count += 1
+            elif (
+                onsets_list[j] - ref_offset < min_dur_inter
+                or onsets_list[j] - ref_onset < min_dur_event + min_dur_inter
+            ):
+                # Consecutive annotation with a pause < min_dur_inter or an onset difference
+                # < min_dur_event + min_dur_inter
+                ref_offset = offsets_list[j]
+                new_offsets[i] = ref_offset
+                fix_count += 1
+            else:
+                break
+            j += 1
+        kept.append(i)
+        i = j
+    return np.array(kept, dtype=int), new_offsets, fix_count
+
+
 def post_process_df_labels(
     df,
     files_duration=None,
@@ -205,12 +298,17 @@ def post_process_df_labels(
     min_dur_event=0.250,
     min_dur_inter=0.150,
     rm_nOn_nOff=True,
+    n_jobs=1,
+    chunk_size=100,
 ):
     """ clean the .txt files of each file. It is the same processing as the real data
         - overlapping events of the same class are mixed
         - if silence < 150ms between two conscutive events of the same class, they are mixed
         - if event < 250ms, the event lasts 250ms
 
+        The annotations are sorted once by file, class and onset, then each group of events of a class in a file is
+        processed like in _post_process_labels_file.
+
         Args:
             df: pd.DataFrame, dataframe of annotations containing columns ["filename", "onset", "offset", "event_label"]
             files_duration: pd.DataFrame or float, dataframe containing columns ["filename", "duration"]
@@ -220,39 +318,93 @@ def post_process_df_labels(
             min_dur_event: float, optional in sec, minimum duration of an event
             min_dur_inter: float, optional in sec, minimum duration between 2 events
             rm_nOn_nOff: bool, whether to delete the additional _nOn _nOff at the end of labels.
+            n_jobs: int, optional, the number of processes used to process the groups of events.
+            chunk_size: int, optional, the number of groups of events sent at once to a process (if n_jobs > 1).
 
         Returns:
-            None
+            pd.DataFrame, the post processed annotations, the files in the order of df, the events sorted by onset.
         """
     logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
-    fix_count = 0
     logger.info(
         "Correcting annotations ... \n"
         "* annotations with negative duration will be removed\n"
         + "* annotations with duration <250ms will be extended on the offset side)"
     )
 
-    result_df = pd.DataFrame()
-    for fn in df.filename.unique():
-        logger.debug(fn)
-        if files_duration is not None:
-            if type(files_duration) is pd.DataFrame:
-                length_sec = files_duration[files_duration.filename == fn].duration
-            elif type(files_duration) in [float, int]:
-                length_sec = files_duration
-            else:
-                raise TypeError("files duration is pd.DataFrame or a float only")
-        else:
-            length_sec = None
-        df_ann, fc = _post_process_labels_file(
-            df[df.filename == fn], length_sec, min_dur_event, min_dur_inter, rm_nOn_nOff
+    df = df[["filename", "onset", "offset", "event_label"]].copy()
+    if rm_nOn_nOff:
+        df["event_label"] = (
+            df["event_label"]
+            .astype(str)
+            .str.replace("_nOff", "", regex=False)
+            .str.replace("_nOn", "", regex=False)
         )
-        fix_count += fc
-
-        result_df = pd.concat([result_df,
-                               df_ann[["filename", "onset", "offset", "event_label"]]
-                               ], ignore_index=True
+    file_codes, filenames = pd.factorize(df["filename"])
+    if files_duration is None:
+        files_length = np.full(len(filenames), np.nan)
+    elif type(files_duration) is pd.DataFrame:
+        durations = dict(zip(files_duration.filename, files_duration.duration))
+        files_length = np.array(
+            [durations.get(fn, np.nan) for fn in filenames], dtype=float
         )
+    elif type(files_duration) in [float, int]:
+        files_length = np.full(len(filenames), float(files_duration))
+    else:
+        raise TypeError("files duration is pd.DataFrame or a float only")
+
+    # np.fmin ignores the nan of the files without duration
+    df["offset"] = np.fmin(
+        df["offset"].to_numpy(dtype=float), files_length[file_codes]
+    )
+    df = sanity_check(df)
+
+    # Events grouped by file and class, sorted by onset in the groups
+    class_codes, class_names = pd.factorize(df["event_label"])
+    onsets = df["onset"].to_numpy(dtype=float)
+    order = np.lexsort((onsets, class_codes, file_codes))
+    df = df.iloc[order]
+    file_codes = file_codes[order]
+    onsets = onsets[order]
+    offsets = df["offset"].to_numpy(dtype=float)
+    group_keys = file_codes * max(len(class_names), 1) + class_codes[order]
+    boundaries = np.flatnonzero(np.diff(group_keys)) + 1
+    starts = np.concatenate(([0], boundaries)).astype(int)
+    ends = np.concatenate((boundaries, [len(df)])).astype(int)
+    # No group when df is empty
+    starts, ends = starts[ends > starts], ends[ends > starts]
+    groups_length = [
+        None if np.isnan(length) else length
+        for length in files_length[file_codes[starts]].tolist()
+    ]
+    groups = [
+        (onsets[start:end], offsets[start:end], length_sec)
+        for start, end, length_sec in zip(starts, ends, groups_length)
+    ]
+
+    merge_group = functools.partial(
+        _merge_group, min_dur_event=min_dur_event, min_dur_inter=min_dur_inter
+    )
+    if n_jobs == 1:
+        results = map(merge_group, groups)
+    else:
+        with closing(Pool(n_jobs)) as p:
+            results = list(p.imap(merge_group, groups, chunk_size))
+
+    fix_count = 0
+    keep = np.zeros(len(df), dtype=bool)
+    new_offsets = offsets.copy()
+    for start, end, (kept, group_offsets, group_fix_count) in zip(
+        starts, ends, results
+    ):
+        keep[start + kept] = True
+        new_offsets[start:end] = group_offsets
+        fix_count += group_fix_count
+
+    df["offset"] = new_offsets
+    df = df[keep]
+    # Back to the order of the files in df, the events of a file sorted by onset
+    result_df = df.iloc[np.lexsort((df["onset"].to_numpy(), file_codes[keep]))]
+    result_df = result_df.reset_index(drop=True)
 
     if output_tsv:
         save_tsv(result_df, output_tsv)
@@ -261,6 +413,15 @@ def post_process_df_labels(
     return result_df
 
 
+def _merge_group(group, min_dur_event=0.250, min_dur_inter=0.150):
+    """ _merge_class_events of a group (onsets, offsets, length_sec), used by the processes of post_process_df_labels
+    """
+    onsets, offsets, length_sec = group
+    return _merge_class_events(
+        onsets, offsets, length_sec, min_dur_event, min_dur_inter
+    )
+
+
 def post_process_txt_labels(
     txtdir,
     wavdir=None,
@@ -270,6 +431,8 @@ def post_process_txt_labels(
     min_dur_inter=0.150,
     background_label=False,
     rm_nOn_nOff=True,
+    n_jobs=1,
+    chunk_size=10,
 ):
     """ clean the .txt files of each file. It is the same processing as the real data
     - overlapping events of the same class are mixed
@@ -285,9 +448,11 @@ def post_process_txt_labels(
         min_dur_inter: float, optional in sec, minimum duration between 2 events
         background_label: bool, whether to include the background label in the annotations.
         rm_nOn_nOff: bool, whether to delete the additional _nOn _nOff at the end of labels.
+        n_jobs: int, optional, the number of processes used to process the files.
+        chunk_size: int, optional, the number of files sent at once to a process (if n_jobs > 1).
 
     Returns:
-        None
+        pd.DataFrame, the annotations of all the files, columns: filename, onset, offset, event_label.
     """
     logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
     if wavdir is None:
@@ -302,8 +467,6 @@ def post_process_txt_labels(
     if output_folder is not None:
         create_folder(output_folder)
 
-    df_single = pd.DataFrame()  # only useful if output_csv defined
-
     if background_label:
         list_files = glob.glob(osp.join(txtdir, "*.jams"))
     else:
@@ -311,30 +474,30 @@ def post_process_txt_labels(
         if len(list_files) == 0:
             list_files = glob.glob(osp.join(txtdir, "*.jams"))
 
-    out_extension = ".txt"
-    for fn in list_files:
-        logger.debug(fn)
-        df, length_sec = get_data(
-            fn,
-            osp.join(wavdir, osp.splitext(osp.basename(fn))[0] + ".wav"),
-            background_label=background_label,
-        )
+    post_process_file = functools.partial(
+        _post_process_txt_file,
+        wavdir=wavdir,
+        output_folder=output_folder,
+        min_dur_event=min_dur_event,
+        min_dur_inter=min_dur_inter,
+        background_label=background_label,
+        rm_nOn_nOff=rm_nOn_nOff,
+    )
+    if n_jobs == 1:
+        results = list(map(post_process_file, list_files))
+    else:
+        with closing(Pool(n_jobs)) as p:
+            results = list(p.imap(post_process_file, list_files, chunk_size))
 
-        df, fc = _post_process_labels_file(
-            df, length_sec, min_dur_event, min_dur_inter, rm_nOn_nOff
-        )
+    list_df = []
+    for df, fc in results:
+        list_df.append(df)
         fix_count += fc
-
-        if output_folder is not None:
-            filepath = os.path.splitext(os.path.basename(fn))[0] + out_extension
-            df[["onset", "offset", "event_label"]].to_csv(
-                osp.join(output_folder, filepath), header=False, index=False, sep="\t"
-            )
-        df["filename"] = osp.join(osp.splitext(osp.basename(fn))[0] + ".wav")
-        df_single = pd.concat([df_single,
-                               df[["filename", "onset", "offset", "event_label"]]
-                               ], ignore_index=True
-        )
+    columns = ["filename", "onset", "offset", "event_label"]
+    if len(list_df) > 0:
+        df_single = pd.concat(list_df, ignore_index=True)
+    else:
+        df_single = pd.DataFrame(columns=columns)
 
     if output_tsv:
         save_tsv(df_single, output_tsv)
@@ -343,18 +506,63 @@ def post_process_txt_labels(
     return df_single
 
 
+def _post_process_txt_file(
+    fn,
+    wavdir,
+    output_folder=None,
+    min_dur_event=0.250,
+    min_dur_inter=0.150,
+    background_label=False,
+    rm_nOn_nOff=True,
+):
+    """ Post process the annotations of a file of post_process_txt_labels
+    Args:
+        fn: str, path of the .txt or .jams file.
+        wavdir: str, directory path where the associated wav file is.
+        output_folder: str, optional, folder in which to put the checked .txt file.
+        min_dur_event: float, optional in sec, minimum duration of an event
+        min_dur_inter: float, optional in sec, minimum duration between 2 events
+        background_label: bool, whether to include the background label in the annotations.
+        rm_nOn_nOff: bool, whether to delete the additional _nOn _nOff at the end of labels.
+
+    Returns:
+        tuple, (pd.DataFrame of the annotations, columns: filename, onset, offset, event_label, number of fixes)
+    """
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+    logger.debug(fn)
+    name = osp.splitext(osp.basename(fn))[0]
+    df, length_sec = get_data(
+        fn, osp.join(wavdir, name + ".wav"), background_label=background_label,
+    )
+
+    df, fix_count = _post_process_labels_file(
+        df, length_sec, min_dur_event, min_dur_inter, rm_nOn_nOff
+    )
+
+    if output_folder is not None:
+        df[["onset", "offset", "event_label"]].to_csv(
+            osp.join(output_folder, name + ".txt"), header=False, index=False, sep="\t"
+        )
+    df["filename"] = name + ".wav"
+    return df[["filename", "onset", "offset", "event_label"]], fix_count
+
+
 def get_labels_from_jams(jam_file, background_label=False, return_length=False):
-    tsv_data = []
-    param = jams.load(jam_file)
-    ann = param["annotations"][0]
-    for obs in ann.data:
-        if obs.value["role"] == "foreground" or (
-            background_label and obs.value["role"] == "background"
-        ):
-            tsv_data.append([obs.time, obs.time + obs.duration, obs.value["label"]])
-    df = pd.DataFrame(tsv_data, columns=["onset", "offset", "event_label"])
+    scaper_jams = read_scaper_jams(jam_file)
+    if background_label:
+        keep = np.isin(scaper_jams.role, ["foreground", "background"])
+    else:
+        keep = scaper_jams.role == "foreground"
+    df = pd.DataFrame(
+        {
+            "onset": scaper_jams.time[keep],
+            "offset": scaper_jams.time[keep] + scaper_jams.duration[keep],
+            "event_label": scaper_jams.label[keep],
+        },
+        columns=["onset", "offset", "event_label"],
+    )
 
     if return_length:
-        return df, ann.duration
+        return df, scaper_jams.length
     else:
         return df
@@ -0,0 +1,185 @@
+"""Recipes of the soundscapes of a dataset (main label, classes and SNRs of the events of each clip),
+sampled for the whole dataset at once, before rendering any clip"""
+import numpy as np
+import pandas as pd
+import scipy.stats
+
+from .logger import DesedError
+from .utils import _check_random_state
+
+RECIPE_COLUMNS = ["index", "label", "n_events", "classes", "snrs"]
+
+
+def sample_balance_recipes(
+    number,
+    list_labels,
+    min_events,
+    max_events,
+    snr=("uniform", 6, 30),
+    random_state=None,
+    start_from=0,
+):
+    """ Recipes of SoundscapesGenerator.generate_balance: the same number of clips for each main label.
+    When number is not a multiple of the number of labels, the remaining clips are given to labels chosen at random,
+    so exactly number recipes are returned.
+    Args:
+        number: int, the number of clips.
+        list_labels: list, the foreground labels (main label of the clips and labels of the other events).
+        min_events: int, the minimum number of events per clip.
+        max_events: int, the maximum number of events per clip (excluded, like np.random.randint).
+        snr: tuple, distribution of the SNR of the events (tuple accepted by Scaper().add_event()).
+        random_state: int or np.random.RandomState, the random state used to sample the recipes.
+        start_from: int, index of the first clip.
+    Returns:
+        pd.DataFrame, one row per clip, columns: index, label, n_events, classes (list of the labels of the events,
+        the main label first), snrs (list of the SNRs of the events).
+    """
+    random_state = _check_random_state(random_state)
+    list_labels = np.asarray(list_labels)
+    number_per_class = np.full(len(list_labels), number // len(list_labels))
+    remaining = random_state.choice(
+        len(list_labels), number % len(list_labels), replace=False
+    )
+    number_per_class[remaining] += 1
+    labels = np.repeat(list_labels, number_per_class)
+
+    if min_events == max_events:
+        n_events = np.full(number, min_events)
+    else:
+        n_events = random_state.randint(min_events, max_events, size=number)
+    # The main label is the first event, the others are chosen uniformly in list_labels
+    n_others = np.maximum(n_events - 1, 0)
+    others = random_state.choice(list_labels, size=n_others.sum())
+    classes = [
+        [label] + others_clip if n_ev > 0 else []
+        for label, n_ev, others_clip in zip(
+            labels.tolist(), n_events, _split(others, n_others)
+        )
+    ]
+    return _recipes_frame(labels.tolist(), classes, snr, random_state, start_from)
+
+
+def sample_occurence_recipes(
+    label_occurences,
+    number,
+    min_events=0,
+    max_events=None,
+    snr=("uniform", 6, 30),
+    random_state=None,
+    start_from=0,
+):
+    """ Recipes of SoundscapesGenerator.generate_by_label_occurence: the main label of a clip is chosen with the
+    probability "proba" of the label, the other events with the "co-occurences" probabilities of the main label.
+    The number of clips of each label is number * proba (probabilities normalized to sum to 1), rounded with the
+    largest remainder method, so exactly number recipes are returned.
+    Args:
+        label_occurences: dict, parameters of labels occurences (see generate_by_label_occurence).
+        number: int, the number of clips.
+        min_events: int, optional, the minimum number of events per clip, overwrite the "min_events" of the
+            co-occurences parameters if defined.
+        max_events: int, optional, the maximum number of events per clip (excluded), overwrite the "max_events" of
+            the co-occurences parameters (number of co-occurring events) if defined.
+        snr: tuple, distribution of the SNR of the events (tuple accepted by Scaper().add_event()).
+        random_state: int or np.random.RandomState, the random state used to sample the recipes.
+        start_from: int, index of the first clip.
+    Returns:
+        pd.DataFrame, one row per clip, columns: index, label, n_events, classes (list of the labels of the events,
+        the main label first), snrs (list of the SNRs of the events).
+    """
+    random_state = _check_random_state(random_state)
+    list_labels = list(label_occurences.keys())
+    probas = np.array([label_occurences[label]["proba"] for label in list_labels])
+    expected = number * probas / probas.sum()
+    number_per_class = np.floor(expected).astype(int)
+    largest_remainders = np.argsort(-(expected - number_per_class), kind="stable")
+    number_per_class[largest_remainders[: number - number_per_class.sum()]] += 1
+
+    labels = []
+    classes = []
+    for label, n_clips in zip(list_labels, number_per_class):
+        co_occur_params = label_occurences[label]["co-occurences"]
+        min_cooc, max_cooc = _cooccurences_bounds(
+            co_occur_params, min_events, max_events
+        )
+        if min_cooc == max_cooc:
+            n_cooc = np.full(n_clips, min_cooc)
+        else:
+            n_cooc = random_state.randint(min_cooc, max_cooc, size=n_clips)
+        n_cooc = np.maximum(n_cooc, 0)
+        cooc = random_state.choice(
+            co_occur_params["classes"], p=co_occur_params["probas"], size=n_cooc.sum()
+        )
+        labels.extend([label] * n_clips)
+        classes.extend([label] + cooc_clip for cooc_clip in _split(cooc, n_cooc))
+    return _recipes_frame(labels, classes, snr, random_state, start_from)
+
+
+def _cooccurences_bounds(co_occur_params, min_events, max_events):
+    """ Bounds of the number of co-occurring events (main event excluded), as in Soundscape.generate_co_occurence """
+    if max_events is None:
+        max_events = co_occur_params.get("max_events")
+        if max_events is None:
+            raise DesedError("max_events has to be specified")
+    else:
+        max_events = max_events - 1
+
+    if min_events is None:
+        min_events = co_occur_params.get("min_events")
+        if min_events is None:
+            raise DesedError(
+                "min_events has to be specified in generate co occurence or in params"
+            )
+    else:
+        min_events = min_events - 1
+    return min_events, max_events
+
+
+def _recipes_frame(labels, classes, snr, random_state, start_from):
+    n_events = np.array([len(classes_clip) for classes_clip in classes], dtype=int)
+    snrs = sample_distribution(snr, n_events.sum(), random_state)
+    return pd.DataFrame(
+        {
+            "index": np.arange(start_from, start_from + len(classes)),
+            "label": labels,
+            "n_events": n_events,
+            "classes": classes,
+            "snrs": _split(snrs, n_events),
+        },
+        columns=RECIPE_COLUMNS,
+    )
+
+
+def _split(values, counts):
+    """ Split an array of values in lists of the given lengths """
+    ends = np.cumsum(counts, dtype=int)
+    return [values[end - count : end].tolist() for count, end in zip(counts, ends)]
+
+
+def sample_distribution(dist, size, random_state=None):
+    """ Sample values of a distribution tuple accepted by Scaper().add_event(), all at once.
+    Args:
+        dist: tuple, the distribution, example: ("uniform", 6, 30).
+        size: int, the number of values to sample.
+        random_state: int or np.random.RandomState, the random state used to sample the values.
+    Returns:
+        np.array, the sampled values.
+    """
+    random_state = _check_random_state(random_state)
+    name, params = dist[0], dist[1:]
+    if name == "const":
+        return np.full(size, params[0])
+    elif name == "uniform":
+        return random_state.uniform(params[0], params[1], size=size)
+    elif name == "normal":
+        return random_state.normal(params[0], params[1], size=size)
+    elif name == "truncnorm":
+        mu, sigma, trunc_min, trunc_max = params
+        a, b = (trunc_min - mu) / float(sigma), (trunc_max - mu) / float(sigma)
+        return scipy.stats.truncnorm.rvs(
+            a, b, mu, sigma, size=size, random_state=random_state
+        )
+    elif name == "choose":
+        return random_state.choice(params[0], size=size)
+    elif name == "choose_weighted":
+        return random_state.choice(params[0], p=params[1], size=size)
+    raise DesedError(f"Distribution {dist} is not supported")
@@ -0,0 +1,226 @@
+"""Index of the soundbank files, to avoid listing the class folders and reading audio headers for every event"""
+import inspect
+import json
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+from os import path as osp
+
+import scaper.core
+import soundfile as sf
+
+from .logger import create_logger
+from .utils import create_folder
+
+SoundInfo = namedtuple("SoundInfo", ["frames", "samplerate", "channels", "duration"])
+
+
+class SoundbankIndex:
+    """ Index of the audio files of a soundbank (a folder containing one subfolder per class).
+    Each class folder is listed once, and the header of a file (duration, samplerate, channels) is only read
+    when the file is new or has been modified (mtime or size changed) since the index was saved.
+
+    Args:
+        folders: list, paths of the folders to index, each of them containing one subfolder per class
+            (example: [fg_folder, bg_folder]). Other class folders are indexed the first time they are used.
+        index_path: str, optional, path of the JSON file in which the index is saved. If the file exists,
+            the index is loaded from it and only the modified files are read again.
+
+    Examples:
+        >>> index = SoundbankIndex([fg_folder, bg_folder], "soundbank_index.json")
+        >>> sg = SoundscapesGenerator(10, fg_folder, bg_folder, soundbank_index=index)
+    """
+
+    def __init__(self, folders=(), index_path=None):
+        self.index_path = index_path
+        # {class_folder: {filename: [mtime_ns, size, frames, samplerate, channels]}}
+        self._saved = {}  # Loaded from index_path, not checked against the filesystem yet
+        self._classes = {}  # Checked against the filesystem
+        self._parents = {}  # {parent folder: class folders}, listed once for the "*" lookups
+        if index_path is not None and osp.exists(index_path):
+            with open(index_path) as f:
+                self._saved = json.load(f)["classes"]
+
+        changed = False
+        for folder in folders:
+            for entry in sorted(os.scandir(folder), key=lambda x: x.name):
+                if entry.is_dir() and not entry.name.startswith("."):
+                    changed |= self._index_class(osp.join(folder, entry.name))
+        if changed and index_path is not None:
+            self.save()
+
+    def _index_class(self, class_folder):
+        """ List a class folder and read the header of the new or modified files.
+        Args:
+            class_folder: str, path of the folder containing the files of a class.
+        Returns:
+            bool, True if the index of this folder changed compared to the saved index.
+        """
+        logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+        key = osp.normpath(class_folder)
+        saved = self._saved.get(key, {})
+        files = {}
+        changed = False
+        for entry in os.scandir(class_folder):
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            values = saved.get(entry.name)
+            if (
+                values is None
+                or values[0] != stat.st_mtime_ns
+                or values[1] != stat.st_size
+            ):
+                logger.debug(f"reading header of {entry.path}")
+                info = sf.info(entry.path)
+                values = [
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                    info.frames,
+                    info.samplerate,
+                    info.channels,
+                ]
+                changed = True
+            files[entry.name] = values
+        changed |= len(files) != len(saved)
+        self._classes[key] = files
+        self._saved[key] = files
+        return changed
+
+    def _class_files(self, class_folder):
+        key = osp.normpath(class_folder)
+        if key not in self._classes:
+            self._index_class(class_folder)
+        return self._classes[key]
+
+    def files(self, class_path):
+        """ The files of a class folder, sorted as glob.glob(os.path.join(class_path, "*")) would sort them.
+        Args:
+            class_path: str, path of the class folder. If its basename is "*", the files of all the classes
+                of the parent folder are returned.
+        Returns:
+            list, the paths of the files.
+        """
+        if osp.basename(class_path) == "*":
+            parent = osp.normpath(osp.dirname(class_path))
+            if parent not in self._parents:
+                self._parents[parent] = [
+                    osp.join(osp.dirname(class_path), entry.name)
+                    for entry in os.scandir(parent)
+                    if entry.is_dir() and not entry.name.startswith(".")
+                ]
+            class_paths = self._parents[parent]
+        else:
+            class_paths = [class_path]
+
+        list_files = []
+        for pth in class_paths:
+            list_files.extend(osp.join(pth, fname) for fname in self._class_files(pth))
+        return sorted(list_files)
+
+    def has_class(self, class_path):
+        """ Whether a class folder exists (read from the index, the folder is indexed if it is not yet).
+        Args:
+            class_path: str, path of the class folder.
+        Returns:
+            bool
+        """
+        try:
+            self._class_files(class_path)
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+        return True
+
+    def info(self, filepath):
+        """ Header information of an audio file of the soundbank (same values as soundfile.info).
+        Args:
+            filepath: str, path of the audio file.
+        Returns:
+            SoundInfo, namedtuple (frames, samplerate, channels, duration).
+        """
+        values = self._class_files(osp.dirname(filepath)).get(osp.basename(filepath))
+        if values is None:
+            raise FileNotFoundError(f"{filepath} is not in the soundbank index")
+        frames, samplerate, channels = values[2:]
+        return SoundInfo(frames, samplerate, channels, float(frames) / samplerate)
+
+    def save(self, index_path=None):
+        """ Save the index in a JSON file.
+        Args:
+            index_path: str, optional, path of the JSON file. Default to the index_path given at initialization.
+        Returns:
+            None
+        """
+        if index_path is None:
+            index_path = self.index_path
+        create_folder(osp.dirname(index_path))
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"classes": self._saved}, f)
+        os.replace(tmp_path, index_path)
+
+
+class _IndexedSoundfile:
+    """ Stand-in of the soundfile module used by scaper to get the duration of the sources, reading the headers
+    from a SoundbankIndex. The files not in the index, and the other functions, are the ones of soundfile.
+    """
+
+    def __init__(self, soundbank_index, soundfile_module):
+        self.soundbank_index = soundbank_index
+        self.soundfile_module = soundfile_module
+
+    def __getattr__(self, name):
+        return getattr(self.soundfile_module, name)
+
+    def info(self, file, verbose=False):
+        try:
+            return self.soundbank_index.info(file)
+        except (FileNotFoundError, NotADirectoryError):
+            return self.soundfile_module.info(file, verbose)
+
+
+def _indexed_validate_source_file(soundbank_index, validate_source_file):
+    """ scaper.core._validate_source_file checking the existence of a "const" source file in a SoundbankIndex """
+
+    def validate(source_file_tuple, label_tuple):
+        if source_file_tuple[0] == "const":
+            try:
+                soundbank_index.info(source_file_tuple[1])
+            except (FileNotFoundError, NotADirectoryError):
+                return validate_source_file(source_file_tuple, label_tuple)
+            parent_name = osp.basename(osp.dirname(source_file_tuple[1]))
+            if label_tuple[0] != "const" or label_tuple[1] != parent_name:
+                raise scaper.core.ScaperError(
+                    "Source file's parent folder name does not match label."
+                )
+            return None
+        return validate_source_file(source_file_tuple, label_tuple)
+
+    return validate
+
+
+@contextmanager
+def scaper_soundbank_index(soundbank_index):
+    """ Context manager making scaper get the source files headers (soundfile.info) and check their existence from
+    a SoundbankIndex, instead of the filesystem.
+    Args:
+        soundbank_index: SoundbankIndex, the index to use. If None, nothing is changed.
+
+    Examples:
+        >>> with scaper_soundbank_index(index):
+        ...     sc.add_event(...)
+    """
+    if soundbank_index is None:
+        yield
+        return
+    soundfile_module = scaper.core.soundfile
+    validate_source_file = scaper.core._validate_source_file
+    scaper.core.soundfile = _IndexedSoundfile(soundbank_index, soundfile_module)
+    scaper.core._validate_source_file = _indexed_validate_source_file(
+        soundbank_index, validate_source_file
+    )
+    try:
+        yield
+    finally:
+        scaper.core.soundfile = soundfile_module
+        scaper.core._validate_source_file = validate_source_file
@@ -10,7 +10,10 @@ from os import path as osp
 import scaper
 import soundfile as sf
 
+from .audio_cache import scaper_audio_cache
 from .logger import create_logger, DesedWarning, DesedError
+from .mixing import check_backend, generate_audio
+from .soundbank import scaper_soundbank_index
 from .utils import choose_cooccurence_class, create_folder
 
 
@@ -23,6 +26,15 @@ class Soundscape(scaper.Scaper):
                 ref_db: float, the reference dB of the clip.
                 samplerate: int, the sr of the final soundscape
                 delete_if_exists: bool, whether to delete existing files and folders created with the same name.
+                soundbank_index: SoundbankIndex, optional, index of fg_path and bg_path files used to choose the
+                    files and get their duration without listing the folders and reading the files.
+                audio_cache: AudioCache, optional, cache of decoded audio from which the source files are read
+                    when rendering.
+                transform_cache: TransformCache, optional, the pitch shifts and time stretches of the foreground
+                    events are quantized, and their transformed source files are read from this cache.
+                backend: str, "scaper" to render the audio with scaper (sox), or "numpy" to mix the events in memory
+                    (see desed.mixing, faster but without reverb, pitch shifting and time stretching:
+                    use reverb=None, pitch_shift=None and time_stretch=None).
 
             Returns:
                 scaper.Scaper object
@@ -37,7 +49,12 @@ class Soundscape(scaper.Scaper):
         samplerate=16000,
         random_state=None,
         delete_if_exists=True,
+        soundbank_index=None,
+        audio_cache=None,
+        transform_cache=None,
+        backend="scaper",
     ):
+        check_backend(backend)
         super(Soundscape, self).__init__(
             duration, fg_path, bg_path, random_state=random_state
         )
@@ -48,6 +65,25 @@ class Soundscape(scaper.Scaper):
         if self.sr is not None:
             self.sr = samplerate
         self.delete_if_exists = delete_if_exists
+        self.soundbank_index = soundbank_index
+        self.audio_cache = audio_cache
+        self.transform_cache = transform_cache
+        self.backend = backend
+
+    def reset(self, random_state=None):
+        """ Remove the events added for the previous soundscape, to reuse the object for a new one.
+        It avoids validating the foreground and background folders again (done when creating a Scaper).
+        Args:
+            random_state: int or np.random.RandomState, optional, the random state of the new soundscape.
+
+        Returns:
+            Soundscape, the object itself.
+        """
+        self.reset_fg_event_spec()
+        self.reset_bg_event_spec()
+        if random_state is not None:
+            self.set_random_state(random_state)
+        return self
 
     def add_random_background(self, label=None):
         """ Add a random background to a scaper object
@@ -67,7 +103,7 @@ class Soundscape(scaper.Scaper):
         else:
             bg_label = "*"
         chosen_file = self._choose_file(osp.join(self.bg_path, bg_label))
-        file_duration = sf.info(chosen_file).duration
+        file_duration = self._file_duration(chosen_file)
         starting_source = min(
             self.random_state.rand() * file_duration,
             max(file_duration - self.duration, 0),
@@ -100,12 +136,16 @@ class Soundscape(scaper.Scaper):
         """
         logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
         label_path = os.path.join(self.fg_path, label)
-        assert osp.exists(
-            label_path
+        if self.soundbank_index is not None:
+            label_exists = self.soundbank_index.has_class(label_path)
+        else:
+            label_exists = osp.exists(label_path)
+        assert (
+            label_exists
         ), f"The label provided ({label}) does not point to a valid folder: {label_path}"
         chosen_file = self._choose_file(os.path.join(self.fg_path, label))
         file_duration = round(
-            sf.info(chosen_file).duration, 6
+            self._file_duration(chosen_file), 6
         )  # because Scaper uses sox with truncate 6 digits
         if "_nOn_nOff" in label:
             # If no onset and offset, the file should be bigger than the duration of the file
@@ -172,11 +212,11 @@ class Soundscape(scaper.Scaper):
             logger.debug("onset offset")
             if file_duration > self.duration:
                 if file_duration // self.duration > 2:
-                    choice = np.random.choice(
+                    choice = self.random_state.choice(
                         ["onset", "middle", "offset"], p=[0.375, 0.25, 0.375]
                     )
                 else:
-                    choice = np.random.choice(["onset", "offset"])
+                    choice = self.random_state.choice(["onset", "offset"])
                 logger.debug(f"choice: {choice}")
                 if choice == "onset":
                     event_start = self.random_state.uniform(
@@ -237,14 +277,19 @@ class Soundscape(scaper.Scaper):
         Returns:
             str, path of the file.
         """
-        event_files = sorted(glob.glob(os.path.join(class_path, "*")))
-        if non_noff:
-            event_files.append(glob.glob(os.path.join(class_path + "_nOn", "*")))
-            event_files.append(glob.glob(os.path.join(class_path + "_nOff", "*")))
-            event_files.append(glob.glob(os.path.join(class_path + "_nOn_nOff", "*")))
-            event_files = sorted(event_files)
-
-        event_files = [f for f in event_files if os.path.isfile(f)]
+        if self.soundbank_index is not None and not non_noff:
+            event_files = self.soundbank_index.files(class_path)
+        else:
+            event_files = sorted(glob.glob(os.path.join(class_path, "*")))
+            if non_noff:
+                event_files.append(glob.glob(os.path.join(class_path + "_nOn", "*")))
+                event_files.append(glob.glob(os.path.join(class_path + "_nOff", "*")))
+                event_files.append(
+                    glob.glob(os.path.join(class_path + "_nOn_nOff", "*"))
+                )
+                event_files = sorted(event_files)
+            # The index only contains regular files, glob can also return folders
+            event_files = [f for f in event_files if os.path.isfile(f)]
         assert len(event_files) > 0, (
             f"no event files to be chosen in this path: {os.path.join(class_path, '*')}"
             f" (pattern used by glob)"
@@ -252,6 +297,160 @@ class Soundscape(scaper.Scaper):
         ind = self.random_state.randint(0, len(event_files))
         return event_files[ind]
 
+    def _file_duration(self, filepath):
+        """ Duration (in seconds) of an audio file, read from the soundbank index if defined. """
+        if self.soundbank_index is not None:
+            return self.soundbank_index.info(filepath).duration
+        return sf.info(filepath).duration
+
+    def add_event(self, *args, **kwargs):
+        """ Scaper.add_event checking the source file in self.soundbank_index (if defined) """
+        with scaper_soundbank_index(self.soundbank_index):
+            return super(Soundscape, self).add_event(*args, **kwargs)
+
+    def add_background(self, *args, **kwargs):
+        """ Scaper.add_background checking the source file in self.soundbank_index (if defined) """
+        with scaper_soundbank_index(self.soundbank_index):
+            return super(Soundscape, self).add_background(*args, **kwargs)
+
+    def _instantiate(self, *args, **kwargs):
+        """ Scaper._instantiate quantizing the pitch shifts and time stretches if self.transform_cache is defined
+        (the JAMS keeps the quantized values). The durations of the sources are read from self.soundbank_index
+        (if defined). """
+        with scaper_soundbank_index(self.soundbank_index):
+            jam = super(Soundscape, self)._instantiate(*args, **kwargs)
+        if self.transform_cache is not None:
+            ann = jam.annotations.search(namespace="scaper")[0]
+            self.transform_cache.quantize(ann, self.duration)
+        return jam
+
+    def _generate_audio(self, audio_path, ann, **kwargs):
+        """ Scaper._generate_audio reading the source files through self.audio_cache (if defined),
+        or desed.mixing.generate_audio if self.backend is "numpy".
+        If self.transform_cache is defined, the transformed source files are read from it. """
+        render_ann = ann
+        if self.transform_cache is not None:
+            render_ann = self.transform_cache.substitute(ann, self.sr, self.n_channels)
+        if self.backend == "numpy":
+            outputs = generate_audio(
+                audio_path,
+                render_ann,
+                self.duration,
+                self.sr,
+                self.ref_db,
+                n_channels=self.n_channels,
+                fade_in_len=self.fade_in_len,
+                fade_out_len=self.fade_out_len,
+                audio_cache=self.audio_cache,
+                **kwargs,
+            )
+        else:
+            with scaper_audio_cache(self.audio_cache):
+                outputs = super(Soundscape, self)._generate_audio(
+                    audio_path, render_ann, **kwargs
+                )
+        ann.sandbox.scaper.soundscape_audio_path = audio_path
+        ann.sandbox.scaper.isolated_events_audio_path = (
+            render_ann.sandbox.scaper.isolated_events_audio_path
+        )
+        return outputs
+
+    def _generate_atomic(self, audio_path, jams_path, txt_path=None, **kwargs):
+        """ Scaper.generate writing the files in temporary files, renamed once all of them are written.
+        An interrupted generation does not leave a partially written file under its final name.
+        Args:
+            audio_path: str, path of the audio file.
+            jams_path: str, path of the JAMS file.
+            txt_path: str, optional, path of the txt file.
+            kwargs: arguments accepted by Scaper.generate
+        Returns:
+            tuple, the values returned by Scaper.generate
+        """
+        no_audio = kwargs.get("no_audio", False)
+        final_paths = [jams_path]
+        if not no_audio:
+            final_paths.append(audio_path)
+        if txt_path is not None:
+            final_paths.append(txt_path)
+        tmp_paths = {pth: _tmp_path(pth) for pth in final_paths}
+        try:
+            outputs = self.generate(
+                audio_path=tmp_paths.get(audio_path),
+                jams_path=None,
+                txt_path=tmp_paths.get(txt_path),
+                **kwargs,
+            )
+            # The JAMS keeps the paths of the final files, not the temporary ones.
+            ann = outputs[1].annotations.search(namespace="scaper")[0]
+            ann.sandbox.scaper.audio_path = audio_path
+            ann.sandbox.scaper.jams_path = jams_path
+            ann.sandbox.scaper.txt_path = txt_path
+            if not no_audio:
+                ann.sandbox.scaper.soundscape_audio_path = audio_path
+            outputs[1].save(tmp_paths[jams_path])
+            for pth in final_paths:
+                os.replace(tmp_paths[pth], pth)
+        except BaseException:
+            for tmp_path in tmp_paths.values():
+                if osp.exists(tmp_path):
+                    os.remove(tmp_path)
+            raise
+        return outputs
+
+    def _generate_files(
+        self, out_folder, filename, reverb=None, save_isolated_events=False, **kwargs
+    ):
+        """ Generate the .wav, .jams and .txt files of the soundscape, with the events already added.
+        Args:
+            out_folder: str, path to extract generate file
+            filename: str, name of the generated file, without extension (.wav, .jams and .txt will be created)
+            reverb: float, the reverb to be applied to the foreground events
+            save_isolated_events: bool, whether or not to save isolated events in a subfolder
+                (called <filename>_events by default)
+            kwargs: arguments accepted by Scaper.generate
+        Returns:
+            None
+        """
+        # Just in case an extension has been added
+        ext = osp.splitext(filename)[-1]
+        if ext in [".wav", ".jams", ".txt"]:
+            filename = osp.splitext(filename)[0]
+
+        # generate
+        audio_file = osp.join(out_folder, f"{filename}.wav")
+        jams_file = osp.join(out_folder, f"{filename}.jams")
+        txt_file = osp.join(out_folder, f"{filename}.txt")
+
+        if self.delete_if_exists:
+            self._remove(audio_file)
+            self._remove(jams_file)
+            self._remove(txt_file)
+
+        # To get isolated events in a subfolder
+        isolated_events_path = kwargs.pop("isolated_events_path", None)
+        if save_isolated_events:
+            if isolated_events_path is None:
+                isolated_events_path = osp.join(out_folder, f"{filename}_events")
+            if self.delete_if_exists:
+                self._remove(isolated_events_path)
+            else:
+                if osp.exists(isolated_events_path):
+                    warnings.warn(
+                        f"The folder {isolated_events_path} already exists, it means there could be some "
+                        f"unwanted audio files from previous generated audio files in it.",
+                        DesedWarning,
+                    )
+
+        self._generate_atomic(
+            audio_file,
+            jams_file,
+            reverb=reverb,
+            txt_path=txt_file,
+            save_isolated_events=save_isolated_events,
+            isolated_events_path=isolated_events_path,
+            **kwargs,
+        )
+
     def _remove(self, path):
         if osp.exists(path):
             if osp.isdir(path):
@@ -357,43 +556,11 @@ class Soundscape(scaper.Scaper):
                 time_stretch=time_stretch,
             )
 
-        # Just in case an extension has been added
-        ext = osp.splitext(filename)[-1]
-        if ext in [".wav", ".jams", ".txt"]:
-            filename = osp.splitext(filename)[0]
-
-        # generate
-        audio_file = osp.join(out_folder, f"{filename}.wav")
-        jams_file = osp.join(out_folder, f"{filename}.jams")
-        txt_file = osp.join(out_folder, f"{filename}.txt")
-
-        if self.delete_if_exists:
-            self._remove(audio_file)
-            self._remove(jams_file)
-            self._remove(txt_file)
-
-        # To get isolated events in a subfolder
-        isolated_events_path = kwargs.get("isolated_events_path")
-        if save_isolated_events:
-            if isolated_events_path is None:
-                isolated_events_path = osp.join(out_folder, f"{filename}_events")
-            if self.delete_if_exists:
-                self._remove(isolated_events_path)
-            else:
-                if osp.exists(isolated_events_path):
-                    warnings.warn(
-                        f"The folder {isolated_events_path} already exists, it means there could be some "
-                        f"unwanted audio files from previous generated audio files in it.",
-                        DesedWarning,
-                    )
-
-        self.generate(
-            audio_file,
-            jams_file,
+        self._generate_files(
+            out_folder,
+            filename,
             reverb=reverb,
-            txt_path=txt_file,
             save_isolated_events=save_isolated_events,
-            isolated_events_path=isolated_events_path,
             **kwargs,
         )
 
@@ -451,43 +618,59 @@ class Soundscape(scaper.Scaper):
                     time_stretch=time_stretch,
                 )
 
-        # Just in case an extension has been added
-        ext = osp.splitext(filename)[-1]
-        if ext in [".wav", ".jams", ".txt"]:
-            filename = osp.splitext(filename)[0]
-
-        # generate
-        audio_file = osp.join(out_folder, f"{filename}.wav")
-        jams_file = osp.join(out_folder, f"{filename}.jams")
-        txt_file = osp.join(out_folder, f"{filename}.txt")
-
-        if self.delete_if_exists:
-            self._remove(audio_file)
-            self._remove(jams_file)
-            self._remove(txt_file)
-
-        # To get isolated events in a subfolder
-        isolated_events_path = kwargs.get("isolated_events_path")
-        if save_isolated_events:
-            if isolated_events_path is None:
-                isolated_events_path = osp.join(out_folder, f"{filename}_events")
-            if self.delete_if_exists:
-                self._remove(isolated_events_path)
-            else:
-                if osp.exists(isolated_events_path):
-                    warnings.warn(
-                        f"The folder {isolated_events_path} already exists, it means there could be some "
-                        f"unwanted audio files from previous generated audio files in it.",
-                        DesedWarning,
-                    )
+        self._generate_files(
+            out_folder,
+            filename,
+            reverb=reverb,
+            save_isolated_events=save_isolated_events,
+            **kwargs,
+        )
 
-        self.generate(
-            audio_file,
-            jams_file,
+    def generate_from_recipe(
+        self,
+        classes,
+        snrs,
+        out_folder,
+        filename,
+        reverb=None,
+        save_isolated_events=False,
+        pitch_shift=None,
+        time_stretch=None,
+        bg_labels=None,
+        **kwargs,
+    ):
+        """ Generate a single file from a recipe (see desed.recipes), using the information of onset or offset present
+        (see DESED dataset and folders in soundbank foreground)
+        Args:
+            classes: list, the labels of the foreground events.
+            snrs: list, the SNRs of the foreground events (same length as classes).
+            out_folder: str, path to extract generate file
+            filename: str, name of the generated file, without extension (.wav, .jams and .txt will be created)
+            reverb: float, the reverb to be applied to the foreground events
+            save_isolated_events: bool, whether or not to save isolated events in a subfolder
+                (called <filename>_events by default)
+            pitch_shift: tuple, tuple accepted by Scaper().add_event()
+            time_stretch: tuple, tuple accepted by Scaper().add_event()
+            bg_labels: list or str, if None choose in all available files.
+                If a name or list is given it has to match the name of a folder in 'background'. example: "sins"
+            kwargs: arguments accepted by Scaper.generate
+        Returns:
+            None
+        """
+        create_folder(out_folder)
+        self.add_random_background(bg_labels)
+        for label, snr in zip(classes, snrs):
+            self.add_fg_event_non_noff(
+                label,
+                snr=("const", snr),
+                pitch_shift=pitch_shift,
+                time_stretch=time_stretch,
+            )
+        self._generate_files(
+            out_folder,
+            filename,
             reverb=reverb,
-            txt_path=txt_file,
             save_isolated_events=save_isolated_events,
-            isolated_events_path=isolated_events_path,
             **kwargs,
         )
 
@@ -594,7 +777,7 @@ class Soundscape(scaper.Scaper):
             if self.delete_if_exists:
                 self._remove(isolated_events_path)
 
-        self.generate(
+        self._generate_atomic(
             audio_path=audiofile,
             jams_path=jamsfile,
             reverb=reverb,
@@ -603,3 +786,9 @@ class Soundscape(scaper.Scaper):
             isolated_events_path=isolated_events_path,
             **kwargs,
         )
+
+
+def _tmp_path(filepath):
+    """ Hidden temporary file next to filepath, with the same extension (needed by soundfile to write audio) """
+    base, ext = osp.splitext(osp.basename(filepath))
+    return osp.join(osp.dirname(filepath), f".{base}.tmp{ext}")
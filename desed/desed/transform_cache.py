@@ -0,0 +1,163 @@
+"""Disk cache of pitch shifted and time stretched source files, with the shifts and stretches quantized to a grid
+so the same transformed source is reused by many events"""
+import copy
+import hashlib
+import inspect
+import os
+from os import path as osp
+
+import numpy as np
+import soundfile as sf
+import sox
+
+from .logger import create_logger
+from .utils import create_folder
+
+
+class TransformCache:
+    """ Cache of the source files transformed (pitch shift and time stretch) by sox, saved in a folder.
+    The pitch shifts and time stretches of the foreground events are rounded to a grid (see quantize), and each
+    transformed source is computed once for a (file, pitch shift, time stretch, samplerate, channels), then reused
+    by all the events using it, in all the clips and later rebuilds of the dataset (a modified source file gets a
+    new key).
+
+    The whole source file is transformed, then the segment of the event is read from it: the beginning and end of an
+    event can slightly differ from transforming only the segment (what scaper does).
+
+    Args:
+        cache_dir: str, the folder of the transformed files.
+        pitch_step: float, the pitch shifts (in semitones) are rounded to a multiple of pitch_step.
+        stretch_step: float, the time stretches are rounded to a multiple of stretch_step.
+        quick: bool, whether sox uses its quick (lower quality) pitch and tempo algorithms.
+
+    Examples:
+        >>> cache = TransformCache("transform_cache", pitch_step=0.5, stretch_step=0.05)
+        >>> sg = SoundscapesGenerator(10, fg_folder, bg_folder, transform_cache=cache)
+    """
+
+    def __init__(self, cache_dir, pitch_step=0.5, stretch_step=0.05, quick=False):
+        self.cache_dir = cache_dir
+        self.pitch_step = pitch_step
+        self.stretch_step = stretch_step
+        self.quick = quick
+        create_folder(cache_dir)
+
+    @staticmethod
+    def _round(value, step):
+        # + 0.0 avoids -0.0 in the JAMS
+        return float(np.round(np.round(value / step) * step, 6)) + 0.0
+
+    def quantize(self, ann, duration=None):
+        """ Round the pitch shifts and time stretches of the foreground events of an annotation (in place).
+        Args:
+            ann: jams.Annotation, annotation of the scaper namespace.
+            duration: float, optional, the duration of the soundscape, the stretched events are cut to end before it.
+        Returns:
+            jams.Annotation, the annotation.
+        """
+        observations = list(ann.data)
+        ann.data.clear()
+        for obs in observations:
+            value = obs.value
+            obs_duration = obs.duration
+            if value["role"] == "foreground":
+                if value["pitch_shift"] is not None:
+                    value["pitch_shift"] = self._round(
+                        value["pitch_shift"], self.pitch_step
+                    )
+                if value["time_stretch"] is not None:
+                    value["time_stretch"] = max(
+                        self._round(value["time_stretch"], self.stretch_step),
+                        self.stretch_step,
+                    )
+                    obs_duration = value["event_duration"] * value["time_stretch"]
+                    if duration is not None:
+                        obs_duration = min(obs_duration, duration - obs.time)
+            ann.append(
+                time=obs.time,
+                duration=obs_duration,
+                value=value,
+                confidence=obs.confidence,
+            )
+        return ann
+
+    def _key(self, source_file, pitch_shift, time_stretch, samplerate, n_channels):
+        stat = os.stat(source_file)
+        key = (
+            f"{osp.abspath(source_file)}|{stat.st_mtime_ns}|{stat.st_size}|"
+            f"{pitch_shift}|{time_stretch}|{samplerate}|{n_channels}|{self.quick}"
+        )
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def transformed_file(
+        self, source_file, pitch_shift, time_stretch, samplerate, n_channels=1
+    ):
+        """ Path of the transformed source file, computed with sox if it is not in the cache.
+        Args:
+            source_file: str, path of the source file.
+            pitch_shift: float, the pitch shift (in semitones), None for no pitch shift.
+            time_stretch: float, the time stretch factor (>1 is slower), None for no time stretch.
+            samplerate: int, the samplerate of the transformed file.
+            n_channels: int, the number of channels of the transformed file.
+        Returns:
+            str, path of the transformed file.
+        """
+        logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+        cached_file = osp.join(
+            self.cache_dir,
+            self._key(source_file, pitch_shift, time_stretch, samplerate, n_channels)
+            + ".wav",
+        )
+        if osp.exists(cached_file):
+            return cached_file
+
+        logger.debug(
+            f"transforming {source_file}, pitch_shift: {pitch_shift}, time_stretch: {time_stretch}"
+        )
+        # Same transformations as scaper.Scaper._generate_audio
+        tfm = sox.Transformer()
+        tfm.convert(samplerate=samplerate, n_channels=n_channels, bitdepth=None)
+        tfm.set_output_format(rate=samplerate, channels=n_channels)
+        if pitch_shift is not None:
+            tfm.pitch(pitch_shift, quick=self.quick)
+        if time_stretch is not None:
+            tfm.tempo(1.0 / float(time_stretch), audio_type="s", quick=self.quick)
+        audio, source_sr = sf.read(source_file, always_2d=True)
+        audio = tfm.build_array(input_array=audio, sample_rate_in=source_sr)
+
+        # Written in a temporary file renamed when complete (other processes can use the cache at the same time)
+        tmp_file = osp.join(self.cache_dir, f".{os.getpid()}.{osp.basename(cached_file)}")
+        sf.write(tmp_file, audio.reshape(-1, n_channels), samplerate, subtype="FLOAT")
+        os.replace(tmp_file, cached_file)
+        return cached_file
+
+    def substitute(self, ann, samplerate, n_channels=1):
+        """ Copy of an annotation in which the pitch shifted or time stretched foreground events read their
+        transformed source file (see transformed_file), without pitch shift and time stretch left to apply.
+        Args:
+            ann: jams.Annotation, annotation of the scaper namespace (already quantized).
+            samplerate: int, the samplerate of the soundscape.
+            n_channels: int, the number of channels of the soundscape.
+        Returns:
+            jams.Annotation, the annotation to render.
+        """
+        ann = copy.deepcopy(ann)
+        for obs in ann.data:
+            value = obs.value
+            pitch_shift = value["pitch_shift"] if value["pitch_shift"] != 0 else None
+            time_stretch = (
+                value["time_stretch"] if value["time_stretch"] != 1 else None
+            )
+            if value["role"] != "foreground" or (
+                pitch_shift is None and time_stretch is None
+            ):
+                continue
+            value["source_file"] = self.transformed_file(
+                value["source_file"], pitch_shift, time_stretch, samplerate, n_channels
+            )
+            if time_stretch is not None:
+                value["source_time"] *= time_stretch
+                value["event_duration"] *= time_stretch
+            value["pitch_shift"] = None
+            value["time_stretch"] = None
+        return ann
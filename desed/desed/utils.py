@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import functools
+import hashlib
 import inspect
+import json
 import numbers
 
 import jams
@@ -9,10 +11,14 @@ import os
 import os.path as osp
 import shutil
 import pprint
+import re
 import requests
 import sys
+import time
+from collections import namedtuple
+from urllib.parse import unquote
 
-from .logger import create_logger, DesedError
+from .logger import create_logger, DesedError, DownloadDesedError
 
 
 def _check_random_state(seed):
@@ -38,6 +44,35 @@ def _check_random_state(seed):
         )
 
 
+def _clip_random_state(root_seed, index):
+    """ Random state of a single clip, derived from the seed of a dataset and the index of the clip.
+    The streams of two different indexes are independent (see numpy.random.SeedSequence), so a clip
+    can be generated without generating the clips before it.
+
+    Args:
+        root_seed: int, the seed shared by all the clips of a dataset.
+        index: int, the index of the clip in the dataset.
+
+    Returns:
+        np.random.RandomState, the random state of the clip.
+    """
+    seed_sequence = np.random.SeedSequence(root_seed, spawn_key=(index,))
+    return np.random.RandomState(np.random.MT19937(seed_sequence))
+
+
+def _recipes_random_state(root_seed):
+    """ Random state used to sample the recipes of all the clips of a dataset (see desed.recipes),
+    independent from the random states of the clips (see _clip_random_state).
+
+    Args:
+        root_seed: int, the seed shared by all the clips of a dataset.
+
+    Returns:
+        np.random.RandomState, the random state of the recipes.
+    """
+    return np.random.RandomState(np.random.MT19937(np.random.SeedSequence(root_seed)))
+
+
 def create_folder(folder, exist_ok=True, delete_if_exists=False):
     """ Create folder (and parent folders) if not exists.
 
@@ -97,6 +132,69 @@ def choose_cooccurence_class(co_occur_params, random_state=None):
     return chosen_class
 
 
+ScaperJams = namedtuple(
+    "ScaperJams",
+    [
+        "time",
+        "duration",
+        "label",
+        "role",
+        "snr",
+        "source_file",
+        "event_time",
+        "polyphony_max",
+        "length",
+    ],
+)
+
+
+def read_scaper_jams(jams_path):
+    """ Read the scaper annotation of a JAMS file by parsing the JSON directly, without the validation and the
+    objects built by jams.load (use jams.load to modify a JAMS).
+    Args:
+        jams_path: str, path of the JAMS file generated by scaper.
+    Returns:
+        ScaperJams, namedtuple of the observations as arrays (time, duration, label, role, snr, source_file,
+        event_time), sorted by time like jams.load sorts them, the polyphony_max of the sandbox (None if missing)
+        and the length (duration of the annotation).
+    """
+    with open(jams_path) as f:
+        jam = json.load(f)
+    anns = [ann for ann in jam["annotations"] if ann["namespace"] == "scaper"]
+    if len(anns) == 0:
+        raise DesedError(
+            f"JAMS file {jams_path} does not contain any annotation with namespace scaper."
+        )
+    ann = anns[0]
+    data = ann["data"]
+    if isinstance(data, dict):
+        # Columns format: {"time": [...], "duration": [...], "value": [...], "confidence": [...]}
+        data = [
+            {"time": time, "duration": duration, "value": value}
+            for time, duration, value in zip(
+                data["time"], data["duration"], data["value"]
+            )
+        ]
+    time = np.array([obs["time"] for obs in data], dtype=float)
+    order = np.argsort(time, kind="stable")
+    data = [data[i] for i in order]
+
+    def value_array(key, dtype=object):
+        return np.array([obs["value"][key] for obs in data], dtype=dtype)
+
+    return ScaperJams(
+        time=time[order],
+        duration=np.array([obs["duration"] for obs in data], dtype=float),
+        label=value_array("label"),
+        role=value_array("role"),
+        snr=value_array("snr", float),
+        source_file=value_array("source_file"),
+        event_time=value_array("event_time", float),
+        polyphony_max=ann.get("sandbox", {}).get("scaper", {}).get("polyphony_max"),
+        length=ann.get("duration"),
+    )
+
+
 def change_snr(jams_path, db_change):
     """ Modify the background SNR of a JAMS generated by scaper
     Args:
@@ -192,30 +290,161 @@ def modify_jams(list_jams, modify_function, out_dir=None, **kwargs):
     return new_list_jams
 
 
-def download_file_from_url(url, target_destination):
-    """ Download a file from a URL.
+def file_md5(filepath, chunk_size=1024 * 1024):
+    """ md5 checksum of a file (hex string) """
+    md5 = hashlib.md5()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def zenodo_file_metadata(url, api_url="https://zenodo.org/api/records", timeout=60):
+    """ MD5 checksum and size of a file published on Zenodo (metadata of the record).
+
+    Args:
+        url: str, Zenodo URL of the file, example: "https://zenodo.org/record/4307908/files/soundbank_validation.tsv".
+        api_url: str, the URL of the records API.
+        timeout: float, the timeout (in seconds) of the request.
+
+    Returns:
+        tuple, (md5, size) of the file, None if the URL is not a Zenodo file or the file is not in the record.
+    """
+    match = re.search(r"/records?/(\d+)/files/([^?#]+)", url)
+    if match is None:
+        return None
+    record_id, filename = match.group(1), unquote(match.group(2))
+    response = requests.get(f"{api_url}/{record_id}", timeout=timeout)
+    response.raise_for_status()
+    for file_meta in response.json().get("files", []):
+        if file_meta.get("key", file_meta.get("filename")) == filename:
+            md5 = file_meta.get("checksum", "")
+            md5 = md5.split(":", 1)[1] if md5.startswith("md5:") else None
+            return md5, file_meta.get("size")
+    return None
+
+
+def _content_range_total(content_range):
+    """ Total size of the remote file in a Content-Range header ("bytes */N" or "bytes start-end/N"), None if
+    the header is missing or the size is unknown ("*") """
+    if content_range is None:
+        return None
+    match = re.fullmatch(r"\s*bytes\s+(?:\*|\d+-\d+)/(\d+)\s*", content_range)
+    return int(match.group(1)) if match is not None else None
+
+
+def _progress(size_dl, total_length):
+    if total_length is None:
+        sys.stdout.write(f"\r{size_dl / 1e6:.1f} MB")
+    else:
+        done = int(50 * size_dl / total_length)
+        sys.stdout.write(f"\r[{'=' * done}{' ' * (50 - done)}]")
+    sys.stdout.flush()
+
+
+def download_file_from_url(
+    url,
+    target_destination,
+    md5=None,
+    size=None,
+    zenodo_checksum=False,
+    resume=True,
+    chunk_size=1024 * 1024,
+    progress_interval=1.0,
+    timeout=60,
+):
+    """ Download a file from a URL. The content is written in target_destination + ".part", renamed
+    target_destination when the download is complete and verified. If the download is interrupted, the next call
+    resumes it from the .part file (HTTP Range request).
 
     Args:
         url: str, URL to be download.
         target_destination: str, the file in which to output the content of the URL.
+        md5: str, optional, the expected md5 checksum (hex) of the file.
+        size: int, optional, the expected size (in bytes) of the file.
+        zenodo_checksum: bool, whether to get md5 and size (if not given) from the Zenodo metadata of the file.
+        resume: bool, whether to resume the download from an existing .part file.
+        chunk_size: int, the size (in bytes) of the chunks written to the file.
+        progress_interval: float, the minimum time (in seconds) between two updates of the progress bar.
+        timeout: float, the timeout (in seconds) of the connection and of each read.
 
     Returns:
-
+        str, target_destination.
     """
-    print(f"Downloading {os.path.basename(url)}")
-    response = requests.get(url, stream=True)
-    handle = open(target_destination, "wb")
-    total_length = response.headers.get("content-length")
-    if total_length is None:  # no content length header
-        handle.write(response.content)
-    else:
-        size_dl = 0
-        total_length = int(total_length)
-        for chunk in response.iter_content(chunk_size=512):
-            if chunk:  # filter out keep-alive new chunks
-                size_dl += len(chunk)
-                handle.write(chunk)
-                done = int(50 * size_dl / total_length)
-                sys.stdout.write(f"\r[{'=' * done}{' ' * (50-done)}]")
-                sys.stdout.flush()
-    print("\n")
+    logger = create_logger(__name__ + "/" + inspect.currentframe().f_code.co_name)
+    print(f"Downloading {os.path.basename(url.split('?')[0])}")
+    if zenodo_checksum and (md5 is None or size is None):
+        try:
+            metadata = zenodo_file_metadata(url, timeout=timeout)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Zenodo metadata of {url} not available, not verified: {e}")
+            metadata = None
+        if metadata is not None:
+            md5 = md5 if md5 is not None else metadata[0]
+            size = size if size is not None else metadata[1]
+
+    part_destination = target_destination + ".part"
+    size_dl = 0
+    if resume and os.path.exists(part_destination):
+        size_dl = os.path.getsize(part_destination)
+        if size is not None and size_dl > size:
+            size_dl = 0
+    headers = {"Range": f"bytes={size_dl}-"} if size_dl > 0 else {}
+
+    response = requests.get(url, stream=True, headers=headers, timeout=timeout)
+    if size_dl > 0 and response.status_code == 416:
+        # Nothing after the .part file: it is complete only if it has the size of the remote file
+        remote_size = _content_range_total(response.headers.get("content-range"))
+        response.close()
+        if remote_size == size_dl:
+            response = None
+        else:
+            logger.info(
+                f"{part_destination} ({size_dl} bytes) does not match the remote file ({remote_size} bytes), "
+                f"restarting the download"
+            )
+            size_dl = 0
+            response = requests.get(url, stream=True, timeout=timeout)
+
+    if response is not None:
+        with response:
+            response.raise_for_status()
+            if size_dl > 0 and response.status_code != 206:
+                logger.info("The server does not support resuming, restarting the download")
+                size_dl = 0
+            elif size_dl > 0:
+                logger.info(f"Resuming the download after {size_dl} bytes")
+            total_length = response.headers.get("content-length")
+            if total_length is not None and "content-encoding" not in response.headers:
+                total_length = size_dl + int(total_length)
+            else:
+                total_length = size
+
+            last_progress = 0
+            with open(part_destination, "ab" if size_dl > 0 else "wb") as handle:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:  # filter out keep-alive new chunks
+                        size_dl += len(chunk)
+                        handle.write(chunk)
+                        now = time.monotonic()
+                        if now - last_progress >= progress_interval:
+                            _progress(size_dl, total_length)
+                            last_progress = now
+            _progress(size_dl, total_length)
+            print("\n")
+
+    size_dl = os.path.getsize(part_destination)
+    if size is not None and size_dl != size:
+        os.remove(part_destination)
+        raise DownloadDesedError(
+            f"Wrong size of {url}: {size_dl} bytes instead of {size}, file removed"
+        )
+    if md5 is not None:
+        md5_dl = file_md5(part_destination)
+        if md5_dl != md5.lower():
+            os.remove(part_destination)
+            raise DownloadDesedError(
+                f"Wrong md5 checksum of {url}: {md5_dl} instead of {md5}, file removed"
+            )
+    os.replace(part_destination, target_destination)
+    return target_destination
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from desed.annotation_store import save_annotations, load_annotations
+from desed.logger import DesedError
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+
+
+def test_save_load_annotations():
+    store_dir = os.path.join(absolute_dir_path, "generated", "annotation_store")
+    df = pd.DataFrame(
+        {
+            "filename": ["5.wav", "5.wav", "7.wav"],
+            "onset": [0.008, 4.969, 2.183],
+            "offset": [5.546, 9.609, 2.488],
+            "event_label": ["Cat", "Speech", None],
+        }
+    )
+    save_annotations(df, store_dir)
+    # Saving again replaces the store
+    save_annotations(df, store_dir)
+
+    df_loaded = load_annotations(store_dir, categorical=False)
+    assert df_loaded.columns.tolist() == df.columns.tolist()
+    assert df_loaded.onset.dtype == np.float32
+    assert np.allclose(df_loaded[["onset", "offset"]], df[["onset", "offset"]])
+    assert df_loaded.filename.tolist() == df.filename.tolist()
+    assert df_loaded.event_label.iloc[:2].tolist() == ["Cat", "Speech"]
+    assert pd.isna(df_loaded.event_label.iloc[2])
+
+    df_selected = load_annotations(store_dir, ["event_label", "onset"], mmap=False)
+    assert df_selected.columns.tolist() == ["event_label", "onset"]
+    assert df_selected.event_label.cat.categories.tolist() == ["Cat", "Speech"]
+
+    with pytest.raises(DesedError):
+        load_annotations(store_dir, ["duration"])
@@ -0,0 +1,70 @@
+import os
+import pickle
+
+import numpy as np
+import scaper
+import soundfile as sf
+
+from desed.audio_cache import AudioCache, scaper_audio_cache
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+fg_file = os.path.join(
+    absolute_dir_path, "material", "soundbank", "foreground", "label", "26104_0.wav"
+)
+bg_file = os.path.join(
+    absolute_dir_path,
+    "material",
+    "soundbank",
+    "background",
+    "label",
+    "noise-free-sound-0055.wav",
+)
+
+
+def test_read_hits():
+    cache = AudioCache()
+    audio, sr = cache.read(fg_file)
+    audio_sf, sr_sf = sf.read(fg_file, always_2d=True)
+    assert sr == sr_sf
+    assert np.array_equal(audio, audio_sf)
+    cache.read(fg_file)
+    assert cache.hits == 1 and cache.misses == 1
+
+    audio_8k, sr_8k = cache.read(fg_file, samplerate=8000)
+    assert sr_8k == 8000
+    assert abs(audio_8k.shape[0] - round(audio_sf.shape[0] * 8000 / sr_sf)) <= 1
+    assert len(cache) == 2
+
+
+def test_lru_budget():
+    fg_bytes = sf.info(fg_file).frames * 8
+    bg_bytes = sf.info(bg_file).frames * 8
+    cache = AudioCache(max_bytes=max(fg_bytes, bg_bytes))
+    cache.read(fg_file)
+    cache.read(bg_file)
+    assert len(cache) == 1
+    assert cache.n_bytes <= cache.max_bytes
+    cache.read(bg_file)
+    assert cache.hits == 1
+
+
+def test_pickled_cache_shared():
+    cache = AudioCache(max_bytes=10 ** 9 + 1)
+    cache_unpickled = pickle.loads(pickle.dumps(cache))
+    cache_unpickled.read(fg_file)
+    assert pickle.loads(pickle.dumps(cache)) is cache_unpickled
+    assert len(cache_unpickled) == 1
+
+
+def test_scaper_reads_from_cache():
+    cache = AudioCache()
+    with scaper_audio_cache(cache):
+        audio, sr = scaper.core.soundfile.read(
+            fg_file, always_2d=True, start=100, stop=1000
+        )
+        info = scaper.core.soundfile.info(fg_file)
+    audio_sf, _ = sf.read(fg_file, always_2d=True, start=100, stop=1000)
+    assert np.array_equal(audio, audio_sf)
+    assert info.duration == sf.info(fg_file).duration
+    assert scaper.core.soundfile is sf
+    assert cache.misses == 1 and cache.hits == 1
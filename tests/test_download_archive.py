@@ -0,0 +1,105 @@
+import hashlib
+import io
+import os
+import shutil
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from desed.download import _stream_unpack_tar, download_and_unpack_archive
+from desed.logger import DownloadDesedError
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+
+
+def _tar_gz(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+FILES = {
+    "audio/eval/public/a.wav": os.urandom(200000),
+    "metadata/eval/public.tsv": b"filename\tonset\toffset\tevent_label\n",
+}
+
+
+class _ArchiveHandler(BaseHTTPRequestHandler):
+    archive = _tar_gz(FILES)
+    ranges = []
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        _ArchiveHandler.ranges.append(range_header)
+        if range_header is not None:
+            start = int(range_header.split("=")[1].split("-")[0])
+            body = self.archive[start:]
+            self.send_response(206)
+            self.send_header(
+                "Content-Range",
+                f"bytes {start}-{len(self.archive) - 1}/{len(self.archive)}",
+            )
+        else:
+            body = self.archive
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def archive_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ArchiveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/files/archive.tar.gz?download=1"
+    server.shutdown()
+    server.server_close()
+
+
+def _check_extracted(folder):
+    for name, content in FILES.items():
+        with open(os.path.join(folder, name), "rb") as f:
+            assert f.read() == content
+
+
+def test_stream_unpack_archive(archive_url):
+    folder = os.path.join(absolute_dir_path, "generated", "archive")
+    shutil.rmtree(folder, ignore_errors=True)
+    download_and_unpack_archive(archive_url, os.path.join(folder, "stream"), stream=True)
+    _check_extracted(os.path.join(folder, "stream"))
+
+    archive = _ArchiveHandler.archive
+    _stream_unpack_tar(
+        archive_url,
+        os.path.join(folder, "checked"),
+        "gztar",
+        md5=hashlib.md5(archive).hexdigest(),
+        size=len(archive),
+    )
+    _check_extracted(os.path.join(folder, "checked"))
+    with pytest.raises(DownloadDesedError):
+        _stream_unpack_tar(archive_url, os.path.join(folder, "bad"), "gztar", md5="0" * 32)
+
+
+def test_unpack_archive_resume(archive_url):
+    folder = os.path.join(absolute_dir_path, "generated", "archive", "resume")
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    # Download interrupted after 1000 bytes
+    with open(os.path.join(folder, ".archive.tar.gz.part"), "wb") as f:
+        f.write(_ArchiveHandler.archive[:1000])
+    _ArchiveHandler.ranges = []
+    download_and_unpack_archive(archive_url, folder)
+    assert _ArchiveHandler.ranges == ["bytes=1000-"]
+    _check_extracted(folder)
+    assert sorted(os.listdir(folder)) == ["audio", "metadata"]
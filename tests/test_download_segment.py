@@ -0,0 +1,72 @@
+import os
+import shutil
+
+import numpy as np
+import soundfile as sf
+
+import desed.download
+from desed.download import _fetch_audioset_file, _move_segment
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+
+
+class _FakeYoutubeDL:
+    """ yt_dlp.YoutubeDL keeping its options, writing the segment that ffmpeg would extract (with 0.5s too much) """
+
+    opts = []
+
+    def __init__(self, ydl_opts):
+        _FakeYoutubeDL.opts.append(ydl_opts)
+        self.ydl_opts = ydl_opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def extract_info(self, url, download=True):
+        query_id = url.split("v=")[-1]
+        tmp_filename = self.ydl_opts["outtmpl"].replace("%(id)s.%(ext)s", query_id + ".wav")
+        sf.write(tmp_filename, np.zeros((int(10.5 * 44100), 1)), 44100)
+        return {"formats": [{"vcodec": "none", "ext": "m4a"}]}
+
+
+def test_fetch_segment_only(monkeypatch):
+    out_dir = os.path.join(absolute_dir_path, "generated", "download_segment")
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    result_dir = os.path.join(out_dir, "audio")
+    tmp_folder = os.path.join(out_dir, "tmp") + os.sep
+    os.makedirs(result_dir)
+    os.makedirs(tmp_folder)
+    monkeypatch.setattr(desed.download.yt_dlp, "YoutubeDL", _FakeYoutubeDL)
+    _FakeYoutubeDL.opts = []
+
+    filename = "Y--0w1YA1Hm4_30.000_40.000.wav"
+    fetched = _fetch_audioset_file(
+        filename, result_dir, tmp_folder=tmp_folder, segment_only=True
+    )
+    assert fetched == (filename, None, [])
+
+    ydl_opts = _FakeYoutubeDL.opts[0]
+    ranges = list(ydl_opts["download_ranges"]({"duration": 600, "id": "--0w1YA1Hm4"}, None))
+    assert ranges == [{"start_time": 30.0, "end_time": 40.0}]
+    assert ydl_opts["postprocessors"] == [
+        {"key": "FFmpegExtractAudio", "preferredcodec": "wav"}
+    ]
+    assert ydl_opts["postprocessor_args"] == {"extractaudio": ["-ar", "44100"]}
+
+    # The segment is moved in result_dir, cut to the duration of the segment
+    assert os.listdir(tmp_folder) == []
+    info = sf.info(os.path.join(result_dir, filename))
+    assert info.samplerate == 44100
+    assert info.frames == 10 * 44100
+
+    # A segment not longer than the duration is renamed
+    tmp_filename = os.path.join(tmp_folder, "short.wav")
+    sf.write(tmp_filename, np.ones((5 * 44100, 1)) * 0.5, 44100)
+    destination = os.path.join(result_dir, "short.wav")
+    _move_segment(tmp_filename, destination, 10)
+    assert not os.path.exists(tmp_filename)
+    assert sf.info(destination).frames == 5 * 44100
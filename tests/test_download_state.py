@@ -0,0 +1,113 @@
+import os
+import time
+
+from desed.download_state import (
+    DONE,
+    FAILED,
+    PERMANENT,
+    DownloadState,
+    classify_error,
+    download_with_retries,
+)
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+
+
+def test_classify_error():
+    assert classify_error("ERROR: [youtube] abc: Video unavailable") == (
+        PERMANENT,
+        "video unavailable",
+    )
+    assert classify_error("HTTP Error 429: Too Many Requests") == (
+        FAILED,
+        "http error 429",
+    )
+    assert classify_error("Unexpected error") == (FAILED, "other")
+
+
+def test_download_with_retries():
+    db_path = os.path.join(absolute_dir_path, "generated", "download_state.sqlite")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    attempts = []
+    waits = []
+
+    def sleep(wait_time):
+        waits.append(wait_time)
+        time.sleep(wait_time)
+
+    def download_batch(filenames):
+        attempts.append(list(filenames))
+        errors = {
+            "removed.wav": "Video unavailable",
+            "flaky.wav": "HTTP Error 503" if len(attempts) < 3 else None,
+        }
+        return [
+            [filename, errors[filename]] if errors.get(filename) else []
+            for filename in filenames
+        ]
+
+    filenames = ["ok.wav", "removed.wav", "flaky.wav"]
+    state = DownloadState(db_path, base_delay=0.01)
+    errors = download_with_retries(
+        filenames, "audio", download_batch, state, max_attempts=3, sleep=sleep
+    )
+    assert errors == [["removed.wav", "Video unavailable"]]
+    # The removed video is never retried, the transient error is retried twice
+    assert attempts == [filenames, ["flaky.wav"], ["flaky.wav"]]
+    assert state.summary() == {DONE: 2, PERMANENT: 1}
+    assert state.summary(by="error_class") == {"video unavailable": 1}
+    assert state.errors("audio", filenames, error_class=True) == [
+        ["removed.wav", "Video unavailable", "video unavailable"]
+    ]
+    state.close()
+
+    # A rerun only downloads the outstanding files
+    attempts.clear()
+    state = DownloadState(db_path)
+    errors = download_with_retries(
+        filenames + ["new.wav"], "audio", download_batch, state, sleep=sleep
+    )
+    assert attempts == [["new.wav"]]
+    assert errors == [["removed.wav", "Video unavailable"]]
+    # Other folder, other files
+    assert state.outstanding("other_audio", filenames) == filenames
+    state.close()
+
+
+def test_download_with_retries_next_run():
+    db_path = os.path.join(absolute_dir_path, "generated", "download_state_rerun.sqlite")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    attempts = []
+
+    def download_batch(filenames):
+        attempts.append(list(filenames))
+        return [[filename, "HTTP Error 503"] for filename in filenames]
+
+    def first_run_batch(filenames):
+        errors = {"flaky.wav": "HTTP Error 503", "removed.wav": "Video unavailable"}
+        return [[filename, errors[filename]] for filename in filenames]
+
+    state = DownloadState(db_path, base_delay=0)
+    download_with_retries(
+        ["flaky.wav", "removed.wav"], "audio", first_run_batch, state, max_attempts=1
+    )
+    assert state.outstanding("audio", ["flaky.wav"], max_attempts=1) == []
+
+    # Transient errors of a previous run are retried (max_attempts times), not the permanent ones
+    download_with_retries(
+        ["flaky.wav", "removed.wav"], "audio", download_batch, state, max_attempts=2
+    )
+    assert attempts == [["flaky.wav"], ["flaky.wav"]]
+    attempts.clear()
+    download_with_retries(
+        ["flaky.wav", "removed.wav"],
+        "audio",
+        download_batch,
+        state,
+        max_attempts=2,
+        retry_failed=False,
+    )
+    assert attempts == []
+    state.close()
@@ -0,0 +1,109 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from desed.downloader import ThreadedDownloader, TokenBucket
+
+
+class _CountingHandler(BaseHTTPRequestHandler):
+    """ Answers the path after 50ms, counting the requests served at the same time """
+
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    def do_GET(self):
+        with self.lock:
+            _CountingHandler.active += 1
+            _CountingHandler.max_active = max(
+                _CountingHandler.max_active, _CountingHandler.active
+            )
+        time.sleep(0.05)
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.lock:
+            _CountingHandler.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def _fetch(url):
+    return requests.get(url).content
+
+
+def _process(content):
+    return content.decode().upper()
+
+
+def _fetch_fail(url):
+    if url.endswith("/file3"):
+        raise ValueError("fetch failed")
+    return _fetch(url)
+
+
+def _process_fail(content):
+    if content.endswith(b"/file5"):
+        raise ValueError("process failed")
+    return _process(content)
+
+
+def test_threaded_downloader():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CountingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        urls = [f"http://127.0.0.1:{server.server_port}/file{i}" for i in range(20)]
+        downloader = ThreadedDownloader(n_threads=8, max_per_host=3, n_processes=1)
+        results = list(downloader.run(iter(urls), _fetch, _process))
+        assert sorted(result for _, result, _ in results) == sorted(
+            f"/FILE{i}" for i in range(20)
+        )
+        assert all(error is None for _, _, error in results)
+        assert 1 < _CountingHandler.max_active <= 3
+
+        # 5 requests per second after the first one
+        downloader = ThreadedDownloader(n_threads=8, rate_limit=5, n_processes=0)
+        start = time.monotonic()
+        assert len(list(downloader.run(urls[:4], _fetch))) == 4
+        assert time.monotonic() - start >= 0.55
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_threaded_downloader_errors():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CountingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        urls = [f"http://127.0.0.1:{server.server_port}/file{i}" for i in range(10)]
+        for n_processes in [0, 1]:
+            downloader = ThreadedDownloader(n_threads=2, n_processes=n_processes)
+            results = {
+                item: (result, error)
+                for item, result, error in downloader.run(urls, _fetch_fail, _process_fail)
+            }
+            assert sorted(results) == sorted(urls)
+            assert str(results[urls[3]][1]) == "fetch failed"
+            assert str(results[urls[5]][1]) == "process failed"
+            assert results[urls[3]][0] is None and results[urls[5]][0] is None
+            for i in [0, 1, 2, 4, 6, 7, 8, 9]:
+                assert results[urls[i]] == (f"/FILE{i}", None)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=100, capacity=5)
+    start = time.monotonic()
+    for _ in range(15):
+        bucket.acquire()
+    # 5 tokens at once, then 10 tokens at 100 per second
+    assert 0.08 <= time.monotonic() - start < 1
@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from desed.frame_labels import export_frame_labels, load_frame_labels, n_frames
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+
+
+def test_export_frame_labels():
+    out_dir = os.path.join(absolute_dir_path, "generated", "frame_labels")
+    df = pd.DataFrame(
+        [
+            ["b.wav", 0.0, 0.25, "Dog"],
+            ["b.wav", 0.2, 0.3, "Dog"],  # overlapping the previous event
+            ["b.wav", 0.95, 1.5, "Cat"],  # ends after the clip
+            ["a.wav", 0.1, 0.15, "Speech"],  # not in the classes
+        ],
+        columns=["filename", "onset", "offset", "event_label"],
+    )
+    assert n_frames(10, 0.02) == 500
+    frame_labels = export_frame_labels(
+        df, out_dir, ["Cat", "Dog"], hop_size=0.1, duration=1.0, chunk_files=1
+    )
+    assert frame_labels.filenames == ["a.wav", "b.wav"]
+    expected = np.zeros((2, 10, 2), dtype=np.uint8)
+    expected[1, 0:3, 1] = 1
+    expected[1, 9, 0] = 1
+    assert (frame_labels.labels == expected).all()
+
+    loaded = load_frame_labels(out_dir, mmap=False)
+    assert loaded.classes == ["Cat", "Dog"]
+    assert (loaded.labels == expected).all()
+
+    # Files without events
+    frame_labels = export_frame_labels(
+        df, out_dir, ["Cat", "Dog"], 0.1, 1.0, filenames=["c.wav", "b.wav", "a.wav"]
+    )
+    assert (frame_labels.labels[1] == expected[1]).all()
+    assert frame_labels.labels[[0, 2]].sum() == 0
@@ -1,12 +1,19 @@
+import glob
 import json
 import os
+import shutil
+import numpy as np
 import pandas as pd
+import pytest
 import soundfile as sf
+from desed.audio_cache import AudioCache
 from desed.generate_synthetic import (
     SoundscapesGenerator,
+    generate_df_from_jams,
     generate_tsv_from_jams,
     generate_files_from_jams,
 )
+from desed.logger import DesedError
 
 absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
 fg_folder = os.path.join(absolute_dir_path, "material", "soundbank", "foreground")
@@ -64,6 +71,79 @@ def test_generate_tsv_from_jams():
     assert (df_gen == df_mat).all().all()  # all on DataFrame and then on Series
 
 
+def test_generate_df_from_jams_n_jobs():
+    list_jams = [os.path.join(absolute_dir_path, "material", "5.jams")] * 3
+    df = generate_df_from_jams(list_jams)
+    df_jobs = generate_df_from_jams(list_jams, n_jobs=2, chunk_size=1)
+    assert df.equals(df_jobs)
+    assert len(df) == 3 * len(generate_df_from_jams(list_jams[:1]))
+
+
+def test_generate_df_from_jams_cache():
+    out_dir = os.path.join(absolute_dir_path, "generated", "df_from_jams_cache")
+    os.makedirs(out_dir, exist_ok=True)
+    list_jams = []
+    for name in ["5", "7"]:
+        jams_path = os.path.join(out_dir, name + ".jams")
+        shutil.copy(
+            os.path.join(absolute_dir_path, "material", "post_processing", name + ".jams"),
+            jams_path,
+        )
+        list_jams.append(jams_path)
+    cache_path = os.path.join(out_dir, "labels_cache.json")
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+    df = generate_df_from_jams(list_jams, cache_path=cache_path)
+    assert df.equals(generate_df_from_jams(list_jams))
+    assert df.equals(generate_df_from_jams(list_jams, cache_path=cache_path))
+
+    # The labels of the unchanged file are read from the cache
+    with open(cache_path) as f:
+        cache = json.load(f)
+    cache["files"][list_jams[0]][2] = [["5.wav", 0.0, 1.0, "Cached"]]
+    with open(cache_path, "w") as f:
+        json.dump(cache, f)
+    # The modified file is read again
+    with open(list_jams[1]) as f:
+        jam = json.load(f)
+    jam["annotations"][0]["data"] = jam["annotations"][0]["data"][:2]
+    with open(list_jams[1], "w") as f:
+        json.dump(jam, f)
+
+    df_cached = generate_df_from_jams(list_jams, cache_path=cache_path)
+    assert df_cached.values.tolist() == [
+        ["5.wav", 0.0, 1.0, "Cached"],
+        ["7.wav", 2.183, 2.488, "Dishes"],
+    ]
+    # Other settings do not use the cache
+    assert len(generate_df_from_jams(list_jams, False, cache_path=cache_path)) > 2
+
+
+def test_generate_tsv_from_jams_streaming():
+    out_dir = os.path.join(absolute_dir_path, "generated", "tsv_streaming")
+    material_dir = os.path.join(absolute_dir_path, "material", "post_processing")
+    list_jams = [
+        os.path.join(material_dir, name + ".jams") for name in ["7", "5", "7", "5"]
+    ]
+    tsv = os.path.join(out_dir, "in_memory.tsv")
+    generate_tsv_from_jams(list_jams, tsv)
+    tsv_chunks = os.path.join(out_dir, "chunks.tsv")
+    generate_tsv_from_jams(iter(list_jams), tsv_chunks, chunk_rows=3)
+    with open(tsv) as f, open(tsv_chunks) as f_chunks:
+        assert f.read() == f_chunks.read()
+
+    # assume_sorted: the names of the JAMS files are sorted and not repeated
+    generate_tsv_from_jams(list_jams[:2], tsv)
+    tsv_sorted = os.path.join(out_dir, "sorted.tsv")
+    generate_tsv_from_jams(iter(sorted(list_jams[:2])), tsv_sorted, assume_sorted=True)
+    with open(tsv) as f, open(tsv_sorted) as f_sorted:
+        assert f.read() == f_sorted.read()
+    with pytest.raises(DesedError):
+        generate_tsv_from_jams(list_jams, tsv_sorted, assume_sorted=True)
+    assert sorted(os.listdir(out_dir)) == ["chunks.tsv", "in_memory.tsv", "sorted.tsv"]
+
+
 def test_generate_files_from_jams():
     generate_files_from_jams(
         [os.path.join(absolute_dir_path, "material", "5.jams")],
@@ -71,6 +151,42 @@ def test_generate_files_from_jams():
     )
 
 
+def test_generate_files_from_jams_audio_cache():
+    out_dir = os.path.join(absolute_dir_path, "generated", "generated_from_jams")
+    out_dir_cache = os.path.join(
+        absolute_dir_path, "generated", "generated_from_jams_cache"
+    )
+    list_jams = [os.path.join(absolute_dir_path, "material", "5.jams")]
+    generate_files_from_jams(list_jams, out_dir, overwrite_exist_audio=True)
+    generate_files_from_jams(list_jams, out_dir_cache, audio_cache=AudioCache())
+    aud, sr = sf.read(os.path.join(out_dir, "5.wav"))
+    aud_c, sr_c = sf.read(os.path.join(out_dir_cache, "5.wav"))
+    assert (aud == aud_c).all()
+    assert sr == sr_c
+
+
+def test_plan_then_render():
+    plan_dir = os.path.join(absolute_dir_path, "generated", "plan_render", "plan")
+    audio_dir = os.path.join(absolute_dir_path, "generated", "plan_render", "audio")
+    direct_dir = os.path.join(absolute_dir_path, "generated", "plan_render", "direct")
+    SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020).generate(
+        3, plan_dir, no_audio=True
+    )
+    assert len(glob.glob(os.path.join(plan_dir, "*.jams"))) == 3
+    assert len(glob.glob(os.path.join(plan_dir, "*.wav"))) == 0
+    generate_files_from_jams(
+        sorted(glob.glob(os.path.join(plan_dir, "*.jams"))), audio_dir, n_jobs=2
+    )
+    SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020).generate(
+        3, direct_dir
+    )
+    for fname in ["00.wav", "01.wav", "02.wav"]:
+        aud, sr = sf.read(os.path.join(direct_dir, fname))
+        aud_r, sr_r = sf.read(os.path.join(audio_dir, fname))
+        assert np.allclose(aud, aud_r)
+        assert sr == sr_r
+
+
 def test_random_state():
     rand_dir = os.path.join(absolute_dir_path, "generated", "random_state")
     rand_dir_rep = os.path.join(absolute_dir_path, "generated", "random_state_rep")
@@ -90,6 +206,88 @@ def test_random_state():
         assert sr == sr_r
 
 
+def test_generate_n_jobs():
+    serial_dir = os.path.join(absolute_dir_path, "generated", "n_jobs", "serial")
+    parallel_dir = os.path.join(absolute_dir_path, "generated", "n_jobs", "parallel")
+    SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020).generate(
+        3, serial_dir
+    )
+    SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020).generate(
+        3, parallel_dir, n_jobs=2
+    )
+    for fname in ["00.wav", "01.wav", "02.wav"]:
+        aud, sr = sf.read(os.path.join(serial_dir, fname))
+        aud_p, sr_p = sf.read(os.path.join(parallel_dir, fname))
+        assert (aud == aud_p).all()
+        assert sr == sr_p
+
+
+def test_generate_shards():
+    single_dir = os.path.join(absolute_dir_path, "generated", "shards", "single")
+    shards_dir = os.path.join(absolute_dir_path, "generated", "shards", "merged")
+    SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020).generate_balance(
+        4, single_dir, min_events=1, max_events=3
+    )
+    for shard_index in range(2):
+        sg_shard = SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020)
+        sg_shard.generate_balance(
+            4,
+            shards_dir,
+            min_events=1,
+            max_events=3,
+            shard_index=shard_index,
+            num_shards=2,
+        )
+    for fname in ["00.wav", "01.wav", "02.wav", "03.wav"]:
+        aud, sr = sf.read(os.path.join(single_dir, fname))
+        aud_s, sr_s = sf.read(os.path.join(shards_dir, fname))
+        assert (aud == aud_s).all()
+        assert sr == sr_s
+
+
+def test_generate_resume():
+    out_dir = os.path.join(absolute_dir_path, "generated", "resume")
+    sg_resume = SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020)
+    sg_resume.generate(3, out_dir)
+    aud, _ = sf.read(os.path.join(out_dir, "01.wav"))
+    os.remove(os.path.join(out_dir, "01.jams"))
+    mtime = os.path.getmtime(os.path.join(out_dir, "00.wav"))
+
+    sg_resume = SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020)
+    sg_resume.generate(3, out_dir, resume=True)
+    assert os.path.getmtime(os.path.join(out_dir, "00.wav")) == mtime
+    assert os.path.exists(os.path.join(out_dir, "01.jams"))
+    aud_resume, _ = sf.read(os.path.join(out_dir, "01.wav"))
+    assert (aud == aud_resume).all()
+
+
+def test_generate_resume_config():
+    out_dir = os.path.join(absolute_dir_path, "generated", "resume_config")
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020).generate(
+        3, out_dir, no_audio=True
+    )
+    os.remove(os.path.join(out_dir, "01.jams"))
+    # Temporary file left by an interrupted clip
+    tmp_file = os.path.join(out_dir, ".01.tmp.jams")
+    open(tmp_file, "w").close()
+
+    with pytest.raises(DesedError):
+        SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2021).generate(
+            3, out_dir, no_audio=True, resume=True
+        )
+    with pytest.raises(DesedError):
+        SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020).generate(
+            3, out_dir, no_audio=True, resume=True, max_events=2
+        )
+    SoundscapesGenerator(10, fg_folder, bg_folder, random_state=2020).generate(
+        3, out_dir, no_audio=True, resume=True
+    )
+    assert os.path.exists(os.path.join(out_dir, "01.jams"))
+    assert not os.path.exists(tmp_file)
+
+
 def test_randomness():
     rand_dir = os.path.join(absolute_dir_path, "generated", "random")
     rand_dir_rep = os.path.join(absolute_dir_path, "generated", "random_rep")
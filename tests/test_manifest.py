@@ -0,0 +1,89 @@
+import os
+import shutil
+
+import pytest
+
+from desed.logger import DesedError
+from desed.manifest import GenerationManifest, clip_record
+from desed.utils import file_md5
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+
+
+def test_manifest_resume():
+    out_dir = os.path.join(absolute_dir_path, "generated", "manifest")
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    for ext in [".wav", ".jams"]:
+        shutil.copy(
+            os.path.join(absolute_dir_path, "material", "5" + ext),
+            os.path.join(out_dir, "05" + ext),
+        )
+
+    manifest = GenerationManifest(out_dir)
+    assert not manifest.is_complete(5)
+    record = clip_record(out_dir, 5, "05")
+    assert set(record["files"]) == {".wav", ".jams"}
+    assert record["files"][".wav"][1] == file_md5(os.path.join(out_dir, "05.wav"))
+    manifest.append(record)
+
+    # A line truncated by an interruption is ignored
+    with open(manifest.path, "a") as f:
+        f.write("6\t06\t.wav:12")
+    manifest_reloaded = GenerationManifest(out_dir)
+    assert manifest_reloaded.records == {5: record}
+    assert manifest_reloaded.is_complete(5)
+
+    with open(os.path.join(out_dir, "05.wav"), "ab") as f:
+        f.write(b"0")
+    assert not GenerationManifest(out_dir).is_complete(5)
+
+
+def test_manifest_config():
+    out_dir = os.path.join(absolute_dir_path, "generated", "manifest_config")
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    shutil.copy(
+        os.path.join(absolute_dir_path, "material", "5.jams"),
+        os.path.join(out_dir, "05.jams"),
+    )
+    config = {"root_seed": 12, "labels": ("choose", []), "duration": 10.0}
+    manifest = GenerationManifest(out_dir)
+    manifest.check_config(config)
+    manifest.append(clip_record(out_dir, 5, "05"))
+
+    manifest_reloaded = GenerationManifest(out_dir)
+    manifest_reloaded.check_config(config, resume=True)
+    assert manifest_reloaded.is_complete(5)
+    with pytest.raises(DesedError):
+        manifest_reloaded.check_config(dict(config, root_seed=13), resume=True)
+    # Not resuming, the manifest is started over
+    manifest_reloaded.check_config(dict(config, root_seed=13))
+    assert not GenerationManifest(out_dir).is_complete(5)
+
+
+def test_manifest_md5_tmp_files():
+    out_dir = os.path.join(absolute_dir_path, "generated", "manifest_md5")
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    jams_path = os.path.join(out_dir, "05.jams")
+    shutil.copy(os.path.join(absolute_dir_path, "material", "5.jams"), jams_path)
+    manifest = GenerationManifest(out_dir)
+    manifest.append(clip_record(out_dir, 5, "05"))
+    assert manifest.is_complete(5)
+    # Same size, other content
+    with open(jams_path, "rb") as f:
+        content = bytearray(f.read())
+    content[-2:] = content[-1:-3:-1]
+    with open(jams_path, "wb") as f:
+        f.write(bytes(content))
+    assert manifest.is_complete(5)
+    assert not manifest.is_complete(5, verify_checksums=True)
+
+    for name in [".05.tmp.wav", ".06.tmp.jams", ".5.tmp.wav"]:
+        open(os.path.join(out_dir, name), "w").close()
+    assert manifest.remove_tmp_files(["05", "06"]) == 2
+    assert sorted(os.listdir(out_dir)) == [".5.tmp.wav", "05.jams", "generation_manifest.tsv"]
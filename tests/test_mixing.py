@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from desed.logger import DesedError
+from desed.audio_cache import AudioCache
+from desed.mixing import generate_from_jams, mix_annotation
+from desed.soundscape import Soundscape
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+fg_folder = os.path.join(absolute_dir_path, "material", "soundbank", "foreground")
+bg_folder = os.path.join(absolute_dir_path, "material", "soundbank", "background")
+out_dir = os.path.join(absolute_dir_path, "generated", "mixing")
+os.makedirs(out_dir, exist_ok=True)
+
+
+def test_generate_from_jams_matches_scaper():
+    jams_file = os.path.join(absolute_dir_path, "material", "scaper", "test_bg_fg.jams")
+    audio_file = os.path.join(out_dir, "test_bg_fg.wav")
+    generate_from_jams(jams_file, audio_file, fg_path=fg_folder, bg_path=bg_folder)
+
+    audio, sr = sf.read(audio_file)
+    scaper_audio, scaper_sr = sf.read(
+        os.path.join(absolute_dir_path, "material", "scaper", "test_bg_fg.wav")
+    )
+    assert sr == scaper_sr and audio.shape == scaper_audio.shape
+    # The foreground event (resampled from 44100Hz) is between 5s and 5.79s
+    fg_samples = slice(5 * sr, int(5.79 * sr) + 1)
+    bg_only = np.ones(len(audio), dtype=bool)
+    bg_only[fg_samples] = False
+    assert np.abs(audio - scaper_audio)[bg_only].max() < 1e-2
+    fg_error = audio[fg_samples] - scaper_audio[fg_samples]
+    assert np.sqrt(np.mean(fg_error ** 2) / np.mean(scaper_audio[fg_samples] ** 2)) < 0.05
+
+
+def test_soundscape_numpy_backend():
+    sc = Soundscape(1, fg_folder, bg_folder, random_state=2020, backend="numpy")
+    sc.add_random_background()
+    sc.add_fg_event_non_noff("label")
+    audio_file = os.path.join(out_dir, "soundscape_numpy.wav")
+    jams_file = os.path.join(out_dir, "soundscape_numpy.jams")
+    sc.generate(audio_file, jams_file, save_isolated_events=True)
+    assert sf.info(audio_file).frames == sc.sr
+    assert len(os.listdir(os.path.join(out_dir, "soundscape_numpy_events"))) == 2
+
+
+def test_soundscape_numpy_backend_reverb():
+    sc = Soundscape(1, fg_folder, bg_folder, random_state=2020, backend="numpy")
+    sc.add_random_background()
+    sc.add_fg_event_non_noff("label", pitch_shift=("const", 2))
+    with pytest.raises(DesedError):
+        sc.generate(os.path.join(out_dir, "soundscape_reverb.wav"), reverb=0.1)
+
+
+def test_mix_annotation_cached_resampling():
+    sc = Soundscape(10, fg_folder, bg_folder, random_state=2020, backend="numpy")
+    sc.add_random_background()
+    for label in ["label", "label_long", "label_nOn"]:
+        sc.add_fg_event_non_noff(label)
+    ann = sc._instantiate().annotations[0]
+    audio = mix_annotation(ann, 10, 16000, -55)[0]
+    cache = AudioCache()
+    audio_cached = mix_annotation(ann, 10, 16000, -55, audio_cache=cache)[0]
+    # The foregrounds are resampled once per file, then cut at the soundscape samplerate (shift of less than a sample)
+    assert audio.shape == audio_cached.shape
+    assert np.sqrt(np.mean((audio - audio_cached) ** 2) / np.mean(audio ** 2)) < 0.05
+    assert all(samplerate == 16000 for _, samplerate in cache._audio)
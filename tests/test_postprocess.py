@@ -1,11 +1,14 @@
 import glob
 import os.path as osp
 import os
+import numpy as np
 import pandas as pd
 import shutil
 
 import pytest
 from desed.post_process import post_process_txt_labels, rm_high_polyphony, get_data
+from desed.post_process import _post_process_labels_file, post_process_df_labels
+from desed.post_process import _max_polyphony
 
 absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
 
@@ -72,6 +75,52 @@ def test_postprocessing():
 
     assert check.all(axis=None), "Problem with post_processing_txt_annotations"
 
+    df_jobs = post_process_txt_labels(folder, n_jobs=2)
+    check = df_jobs.sort_values("onset").reset_index(drop=True) == valid_df.sort_values(
+        "onset"
+    ).reset_index(drop=True)
+    assert check.all(axis=None), "Problem with post_processing_txt_annotations n_jobs"
+
+
+def test_post_process_labels_file():
+    df = pd.DataFrame(
+        [
+            [0.0, 2.0, "Dog"],
+            [0.5, 1.0, "Dog"],  # contained in the first event
+            [2.1, 3.0, "Dog"],  # pause < 150ms: merged
+            [3.1, 3.25, "Dog"],  # pause < 150ms with the merged event: merged
+            [5.0, 5.1, "Dog_nOff"],  # extended to 250ms
+            [9.9, 9.95, "Cat"],  # too short at the end of the file: removed
+        ],
+        columns=["onset", "offset", "event_label"],
+    )
+    df_fixed, fix_count = _post_process_labels_file(df, length_sec=10)
+    assert fix_count == 4
+    assert df_fixed.values.tolist() == [[0.0, 3.25, "Dog"], [5.0, 5.25, "Dog"]]
+
+
+def test_post_process_df_labels():
+    df = pd.DataFrame(
+        [
+            ["b.wav", 5.0, 5.1, "Dog"],
+            ["a.wav", 2.1, 3.0, "Dog"],
+            ["b.wav", 9.9, 9.95, "Cat"],
+            ["a.wav", 0.0, 2.0, "Dog"],
+            ["a.wav", 9.9, 9.95, "Cat"],
+        ],
+        columns=["filename", "onset", "offset", "event_label"],
+    )
+    files_duration = pd.DataFrame({"filename": ["a.wav"], "duration": [20.0]})
+    expected = [
+        ["b.wav", 5.0, 5.25, "Dog"],
+        ["b.wav", 9.9, 10.15, "Cat"],  # duration of b.wav unknown: not removed
+        ["a.wav", 0.0, 3.0, "Dog"],
+        ["a.wav", 9.9, 10.15, "Cat"],
+    ]
+    for n_jobs in [1, 2]:
+        df_fixed = post_process_df_labels(df, files_duration, n_jobs=n_jobs)
+        assert df_fixed.values.tolist() == expected
+
 
 def test_high_polyphony():
     pol_dir = osp.join(absolute_dir_path, "generated", "polyphony")
@@ -81,13 +130,27 @@ def test_high_polyphony():
     ll = glob.glob(osp.join(pol_dir, "*.jams"))
     assert len(ll) == 2
 
+    histogram = rm_high_polyphony(pol_dir, 1, dry_run=True)
+    assert histogram.to_dict() == {1: 1, 2: 1}
+    assert len(glob.glob(osp.join(pol_dir, "*"))) == 6
+
     save_name = os.path.join(absolute_dir_path, "generated", "final.tsv")
-    rm_high_polyphony(pol_dir, 1, save_name)
+    rm_high_polyphony(pol_dir, 1, save_name, n_jobs=2)
+    assert len(glob.glob(osp.join(pol_dir, "*"))) == 3
+    assert pd.read_csv(save_name, sep="\t")["scaper"].tolist() == ["7.jams"]
 
     ll = glob.glob(osp.join(pol_dir, "*.jams"))
     assert len(ll) == 1, f"Problem rm_high_polyphony {len(ll)} != 1"
 
 
+def test_max_polyphony():
+    onsets = np.array([0.0, 0.5, 1.0, 2.0])
+    offsets = np.array([1.0, 2.0, 1.5, 3.0])
+    # [0, 1] ends when [1, 1.5] starts, [2, 3] starts when [0.5, 2] ends
+    assert _max_polyphony(onsets, offsets) == 2
+    assert _max_polyphony(np.array([]), np.array([])) == 0
+
+
 def test_get_data():
     txt_file = osp.join(absolute_dir_path, "material", "post_processing", "5.txt")
     df, length_sec = get_data(
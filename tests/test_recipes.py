@@ -0,0 +1,54 @@
+import json
+import os
+
+import numpy as np
+
+from desed.recipes import (
+    sample_balance_recipes,
+    sample_occurence_recipes,
+    sample_distribution,
+)
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+
+
+def test_sample_balance_recipes():
+    recipes = sample_balance_recipes(
+        10, ["a", "b", "c"], 1, 4, random_state=2020, start_from=5
+    )
+    assert len(recipes) == 10
+    assert recipes["index"].tolist() == list(range(5, 15))
+    assert sorted(recipes["label"].value_counts().tolist()) == [3, 3, 4]
+    assert recipes["n_events"].between(1, 3).all()
+    for _, recipe in recipes.iterrows():
+        assert recipe["classes"][0] == recipe["label"]
+        assert len(recipe["classes"]) == len(recipe["snrs"]) == recipe["n_events"]
+        assert all(6 <= snr <= 30 for snr in recipe["snrs"])
+
+    same_recipes = sample_balance_recipes(
+        10, ["a", "b", "c"], 1, 4, random_state=2020, start_from=5
+    )
+    assert recipes.equals(same_recipes)
+
+
+def test_sample_occurence_recipes():
+    param_json = os.path.join(
+        absolute_dir_path, "material", "event_occurences", "event_occurences_train.json"
+    )
+    with open(param_json) as json_file:
+        params = json.load(json_file)
+    # The probabilities of the labels sum to 0.2, the total is still the number asked.
+    recipes = sample_occurence_recipes(params, 11, random_state=2020)
+    assert len(recipes) == 11
+    assert sorted(recipes["label"].value_counts().tolist()) == [5, 6]
+    for _, recipe in recipes.iterrows():
+        co_occurences = params[recipe["label"]]["co-occurences"]
+        assert recipe["classes"][0] == recipe["label"]
+        assert set(recipe["classes"][1:]) <= set(co_occurences["classes"])
+        assert len(recipe["classes"]) <= co_occurences["max_events"]
+
+
+def test_sample_distribution():
+    assert np.all(sample_distribution(("const", 3), 4) == 3)
+    values = sample_distribution(("truncnorm", 5.0, 2.0, 0.0, 10.0), 100, 2020)
+    assert values.shape == (100,) and values.min() >= 0 and values.max() <= 10
@@ -0,0 +1,92 @@
+import glob
+import json
+import os
+import shutil
+
+import soundfile as sf
+
+from desed.soundbank import SoundbankIndex
+from desed.soundscape import Soundscape
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+fg_folder = os.path.join(absolute_dir_path, "material", "soundbank", "foreground")
+bg_folder = os.path.join(absolute_dir_path, "material", "soundbank", "background")
+
+
+def test_index_files_info():
+    index = SoundbankIndex([fg_folder, bg_folder])
+    for class_path in [
+        os.path.join(fg_folder, "label_nOn"),
+        os.path.join(bg_folder, "label"),
+        os.path.join(bg_folder, "*"),
+    ]:
+        list_glob = sorted(glob.glob(os.path.join(class_path, "*")))
+        assert index.files(class_path) == list_glob
+        for fpath in list_glob:
+            info = sf.info(fpath)
+            info_index = index.info(fpath)
+            assert info_index.duration == info.duration
+            assert info_index.samplerate == info.samplerate
+            assert info_index.channels == info.channels
+
+
+def test_index_saved_invalidated():
+    soundbank = os.path.join(absolute_dir_path, "generated", "soundbank_index")
+    if os.path.exists(soundbank):
+        shutil.rmtree(soundbank)
+    shutil.copytree(fg_folder, os.path.join(soundbank, "foreground"))
+    index_path = os.path.join(soundbank, "index.json")
+    index = SoundbankIndex([os.path.join(soundbank, "foreground")], index_path)
+    assert os.path.exists(index_path)
+
+    # Replace a file by a longer one, the saved index must not be used for it
+    fpath = os.path.join(soundbank, "foreground", "label", "26104_0.wav")
+    audio, sr = sf.read(fpath)
+    sf.write(fpath, audio.tolist() * 2, sr)
+    index_reloaded = SoundbankIndex([os.path.join(soundbank, "foreground")], index_path)
+    assert index_reloaded.info(fpath).duration == sf.info(fpath).duration
+    assert index_reloaded.info(fpath).duration != index.info(fpath).duration
+    with open(index_path) as f:
+        saved = json.load(f)
+    assert saved["classes"][os.path.dirname(fpath)]["26104_0.wav"][2] == len(audio) * 2
+
+
+def test_soundscape_with_index():
+    index = SoundbankIndex([fg_folder, bg_folder])
+    sc = Soundscape(1, fg_folder, bg_folder, random_state=2020)
+    sc_index = Soundscape(1, fg_folder, bg_folder, random_state=2020, soundbank_index=index)
+    for label in ["label", "label_long", "label_nOn", "label_nOff", "label_nOn_nOff"]:
+        sc.add_fg_event_non_noff(label)
+        sc_index.add_fg_event_non_noff(label)
+    sc.add_random_background()
+    sc_index.add_random_background()
+    assert sc.fg_spec == sc_index.fg_spec
+    assert sc.bg_spec == sc_index.bg_spec
+    ann = sc._instantiate().annotations[0]
+    ann_index = sc_index._instantiate().annotations[0]
+    assert ann.data == ann_index.data
+
+
+def test_index_no_filesystem_access(monkeypatch):
+    index = SoundbankIndex([fg_folder, bg_folder])
+    list_glob = sorted(glob.glob(os.path.join(bg_folder, "*", "*")))
+    index.files(os.path.join(bg_folder, "*"))
+    sc_index = Soundscape(1, fg_folder, bg_folder, random_state=2020, soundbank_index=index)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("filesystem accessed while the soundbank is indexed")
+
+    monkeypatch.setattr(os, "scandir", fail)
+    monkeypatch.setattr(os.path, "isfile", fail)
+    monkeypatch.setattr(os.path, "exists", fail)
+    monkeypatch.setattr(sf, "info", fail)
+    assert index.files(os.path.join(bg_folder, "*")) == list_glob
+    for _ in range(5):
+        sc_index._choose_file(os.path.join(fg_folder, "label"))
+        sc_index._choose_file(os.path.join(bg_folder, "*"))
+
+    # Planning a soundscape: adding the events and instantiating them
+    for label in ["label", "label_long", "label_nOn", "label_nOff", "label_nOn_nOff"]:
+        sc_index.add_fg_event_non_noff(label)
+    sc_index.add_random_background()
+    sc_index._instantiate()
@@ -101,3 +101,20 @@ def test_add_label_non_noff(sc):
     dict_values = get_dict_values(jams_path)
     assert dict_values["event_time"] == 0
     assert dict_values["event_duration"] == duration
+
+
+def test_reset(sc):
+    sc.add_random_background()
+    sc.add_fg_event_non_noff("label")
+    sc.reset(random_state=2021)
+    assert len(sc.fg_spec) == 0 and len(sc.bg_spec) == 0
+
+    sc.add_random_background()
+    sc.add_fg_event_non_noff("label")
+    new_sc = Soundscape(
+        duration, fg_folder, bg_folder, random_state=2021, delete_if_exists=True
+    )
+    new_sc.add_random_background()
+    new_sc.add_fg_event_non_noff("label")
+    assert sc.fg_spec == new_sc.fg_spec
+    assert sc.bg_spec == new_sc.bg_spec
@@ -0,0 +1,57 @@
+import os
+
+import jams
+import numpy as np
+
+from desed.soundscape import Soundscape
+from desed.transform_cache import TransformCache
+
+absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
+fg_folder = os.path.join(absolute_dir_path, "material", "soundbank", "foreground")
+bg_folder = os.path.join(absolute_dir_path, "material", "soundbank", "background")
+out_dir = os.path.join(absolute_dir_path, "generated", "transform_cache")
+os.makedirs(out_dir, exist_ok=True)
+
+
+def soundscape_with_cache(cache, backend="scaper"):
+    sc = Soundscape(
+        10, fg_folder, bg_folder, random_state=2020, transform_cache=cache, backend=backend
+    )
+    sc.add_random_background()
+    for _ in range(3):
+        sc.add_fg_event_non_noff(
+            "label_long",
+            pitch_shift=("uniform", -3, 3),
+            time_stretch=("uniform", 0.8, 1.2),
+        )
+    return sc
+
+
+def test_quantize():
+    cache = TransformCache(os.path.join(out_dir, "cache"), pitch_step=0.5, stretch_step=0.1)
+    jams_file = os.path.join(out_dir, "quantized.jams")
+    soundscape_with_cache(cache).generate(jams_path=jams_file, no_audio=True)
+
+    ann = jams.load(jams_file).annotations.search(namespace="scaper")[0]
+    for obs in ann.data:
+        if obs.value["role"] == "foreground":
+            assert np.isclose(obs.value["pitch_shift"] * 2, round(obs.value["pitch_shift"] * 2))
+            assert np.isclose(obs.value["time_stretch"] * 10, round(obs.value["time_stretch"] * 10))
+            assert np.isclose(
+                obs.duration,
+                min(obs.value["event_duration"] * obs.value["time_stretch"], 10 - obs.time),
+            )
+
+
+def test_transformed_sources_reused():
+    cache_dir = os.path.join(out_dir, "cache_render")
+    cache = TransformCache(cache_dir, pitch_step=3, stretch_step=0.5)
+    soundscape_with_cache(cache, backend="numpy").generate(
+        os.path.join(out_dir, "render.wav")
+    )
+    n_cached = len(os.listdir(cache_dir))
+    assert n_cached > 0
+    soundscape_with_cache(cache, backend="numpy").generate(
+        os.path.join(out_dir, "render_again.wav")
+    )
+    assert len(os.listdir(cache_dir)) == n_cached
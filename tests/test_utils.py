@@ -4,15 +4,19 @@ import os.path as osp
 import pytest
 import functools
 import glob
+import hashlib
+import threading
 import os
 import jams
 import json
 import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from desed.soundscape import Soundscape
 from desed.utils import create_folder, pprint, choose_cooccurence_class
 from desed.utils import change_snr, modify_fg_onset, modify_jams
-from desed.utils import download_file_from_url
+from desed.logger import DownloadDesedError
+from desed.utils import download_file_from_url, read_scaper_jams, zenodo_file_metadata
 
 absolute_dir_path = os.path.abspath(os.path.dirname(__file__))
 
@@ -118,6 +122,18 @@ def test_fg_onset():
     assert onset == (onset_gen - 0.2), "Wrong onset generated"
 
 
+def test_read_scaper_jams():
+    jams_path = osp.join(absolute_dir_path, "material", "5.jams")
+    scaper_jams = read_scaper_jams(jams_path)
+    ann = jams.load(jams_path).annotations.search(namespace="scaper")[0]
+    assert scaper_jams.time.tolist() == [obs.time for obs in ann.data]
+    assert scaper_jams.duration.tolist() == [obs.duration for obs in ann.data]
+    for key in ["label", "role", "snr", "source_file", "event_time"]:
+        assert scaper_jams._asdict()[key].tolist() == [obs.value[key] for obs in ann.data]
+    assert scaper_jams.polyphony_max == ann.sandbox.scaper["polyphony_max"]
+    assert scaper_jams.length == ann.duration
+
+
 def test_download_file():
     fname_valid = (
         "https://zenodo.org/record/4307908/files/soundbank_validation.tsv?download=1"
@@ -135,3 +151,131 @@ def test_download_file():
     assert df_download.equals(
         df_material
     ), "Wrong file downloaded, not matching: soundbank_validation.tsv"
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    """ Serves content (with Range requests if support_range), and the Zenodo metadata of the file under /api """
+
+    content = bytes(range(256)) * 10000
+    support_range = True
+    ranges = []
+
+    def do_GET(self):
+        if self.path.startswith("/api/records/"):
+            body = json.dumps(
+                {
+                    "files": [
+                        {
+                            "key": "file.bin",
+                            "checksum": "md5:" + hashlib.md5(self.content).hexdigest(),
+                            "size": len(self.content),
+                        }
+                    ]
+                }
+            ).encode()
+            self.send_response(200)
+        else:
+            range_header = self.headers.get("Range")
+            _RangeHandler.ranges.append(range_header)
+            start = None
+            if range_header is not None and self.support_range:
+                start = int(range_header.split("=")[1].split("-")[0])
+            if start is not None and start >= len(self.content):
+                body = b""
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(self.content)}")
+            elif start is not None:
+                body = self.content[start:]
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range",
+                    f"bytes {start}-{len(self.content) - 1}/{len(self.content)}",
+                )
+            else:
+                body = self.content
+                self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def range_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    _RangeHandler.ranges = []
+    _RangeHandler.support_range = True
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_file_resume(range_server):
+    content = _RangeHandler.content
+    fpath = os.path.join(absolute_dir_path, "generated", "utils", "range", "file.bin")
+    create_folder(osp.dirname(fpath))
+    url = f"{range_server}/record/1234/files/file.bin?download=1"
+
+    download_file_from_url(url, fpath, chunk_size=1000)
+    with open(fpath, "rb") as f:
+        assert f.read() == content
+    assert not osp.exists(fpath + ".part")
+
+    # Interrupted download: only the end of the file is downloaded
+    with open(fpath + ".part", "wb") as f:
+        f.write(content[:1000])
+    _RangeHandler.ranges = []
+    download_file_from_url(
+        url, fpath, md5=hashlib.md5(content).hexdigest(), size=len(content)
+    )
+    assert _RangeHandler.ranges == ["bytes=1000-"]
+    with open(fpath, "rb") as f:
+        assert f.read() == content
+
+    # Complete .part file: nothing is downloaded
+    with open(fpath + ".part", "wb") as f:
+        f.write(content)
+    _RangeHandler.ranges = []
+    download_file_from_url(url, fpath)
+    assert _RangeHandler.ranges == [f"bytes={len(content)}-"]
+    with open(fpath, "rb") as f:
+        assert f.read() == content
+
+    # .part file larger than the remote file: the download restarts
+    with open(fpath + ".part", "wb") as f:
+        f.write(content + b"0")
+    _RangeHandler.ranges = []
+    download_file_from_url(url, fpath)
+    assert _RangeHandler.ranges == [f"bytes={len(content) + 1}-", None]
+    with open(fpath, "rb") as f:
+        assert f.read() == content
+
+    # Server not supporting Range: the download restarts
+    _RangeHandler.support_range = False
+    with open(fpath + ".part", "wb") as f:
+        f.write(content[:1000])
+    download_file_from_url(url, fpath)
+    with open(fpath, "rb") as f:
+        assert f.read() == content
+
+
+def test_download_file_checksum(range_server):
+    content = _RangeHandler.content
+    fpath = os.path.join(absolute_dir_path, "generated", "utils", "range", "bad.bin")
+    create_folder(osp.dirname(fpath))
+    url = f"{range_server}/record/1234/files/file.bin"
+    with pytest.raises(DownloadDesedError):
+        download_file_from_url(url, fpath, md5="0" * 32)
+    with pytest.raises(DownloadDesedError):
+        download_file_from_url(url, fpath, size=len(content) + 1)
+    assert not osp.exists(fpath) and not osp.exists(fpath + ".part")
+
+    assert zenodo_file_metadata(url, api_url=f"{range_server}/api/records") == (
+        hashlib.md5(content).hexdigest(),
+        len(content),
+    )
+    assert zenodo_file_metadata("https://example.com/file.bin") is None